@@ -0,0 +1,264 @@
+import re
+import time
+import hashlib
+import threading
+import datetime
+from collections import Counter
+import dropbox
+
+# Constants
+DEFAULT_PAGE_SIZE = 500  # Entries per files_list_folder page when the caller sets no limit
+_MODIFIED = datetime.datetime(2024, 1, 1)
+_RANGE_HEADER = re.compile(r"bytes=(\d+)-(\d*)")
+
+
+def build_tree(breadth=5, depth=3, files_per_folder=20, file_size=64 * 1024, large_files=None,
+               extensions=('.txt', '.csv', '.pdf', '.xlsx')):
+    """
+    Builds a synthetic Dropbox tree: every folder has breadth subfolders (down to depth
+    levels) and files_per_folder files cycling through extensions.
+
+    Args:
+        breadth (int): Subfolders per folder.
+        depth (int): Levels of subfolders below the root.
+        files_per_folder (int): Files in each folder, including the root.
+        file_size (int): Size in bytes of each generated file.
+        large_files (dict, optional): Extra files {path: size}, e.g. {"/Archive/big.csv": 200 * 1024 * 1024}.
+        extensions (tuple): File extensions to cycle through.
+
+    Returns:
+        dict: {path_lower: {'path': path_display, 'is_folder': bool, 'size': int}} including
+              the root ("").
+    """
+    tree = {"": {'path': "", 'is_folder': True, 'size': 0}}
+
+    def _add_folder(parent, level):
+        for index in range(files_per_folder):
+            path = f"{parent}/File {level}-{index}{extensions[index % len(extensions)]}"
+            tree[path.lower()] = {'path': path, 'is_folder': False, 'size': file_size}
+        if level >= depth:
+            return
+        for index in range(breadth):
+            path = f"{parent}/Folder {level + 1}-{index}"
+            tree[path.lower()] = {'path': path, 'is_folder': True, 'size': 0}
+            _add_folder(path, level + 1)
+
+    _add_folder("", 0)
+    for path, size in (large_files or {}).items():
+        parent = path.rsplit("/", 1)[0]
+        while parent and parent.lower() not in tree:
+            tree[parent.lower()] = {'path': parent, 'is_folder': True, 'size': 0}
+            parent = parent.rsplit("/", 1)[0]
+        tree[path.lower()] = {'path': path, 'is_folder': False, 'size': size}
+    return tree
+
+
+def file_content(path, start, end):
+    """
+    Returns bytes [start, end) of a generated file. Content is repeating text lines
+    derived from the path, computed per range so huge files never exist in memory.
+    """
+    block = "".join(f"{path},row {row},value {row * 7 % 1000}\n" for row in range(64)).encode("utf-8")
+    offset = start % len(block)
+    repeats = (offset + (end - start)) // len(block) + 1
+    return (block * repeats)[offset:offset + (end - start)]
+
+
+class FakeDownloadResponse:
+    """Stands in for the requests.Response returned by files_download."""
+
+    def __init__(self, client, path, start, end, status_code):
+        self._client = client
+        self._path = path
+        self._position = start
+        self._end = end
+        self.status_code = status_code
+
+    def iter_content(self, chunk_size=64 * 1024):
+        while self._position < self._end:
+            chunk_end = min(self._end, self._position + chunk_size)
+            chunk = file_content(self._path, self._position, chunk_end)
+            self._position = chunk_end
+            self._client._count_bytes(len(chunk))
+            yield chunk
+
+    def close(self):
+        pass
+
+
+class FakeDropbox:
+    """
+    In-process stand-in for a scoped dropbox.Dropbox client over a build_tree() tree.
+
+    Implements the calls the agent makes (paginated files_list_folder, files_get_metadata,
+    files_download with HTTP Range support, clone and files_search_v2) and returns the
+    SDK's own result types. Every call counts as one round trip and sleeps latency
+    seconds; bytes are counted as download bodies are read. Clones share the counters.
+    """
+
+    def __init__(self, tree, latency=0.0, page_size=DEFAULT_PAGE_SIZE, honor_range=True, headers=None, _stats=None):
+        """
+        Args:
+            tree (dict): Tree from build_tree().
+            latency (float): Seconds slept per API call, to model network round trips.
+            page_size (int): Entries per listing page when the caller passes no limit.
+            honor_range (bool): False to ignore Range headers, like a server without range support.
+            headers (dict, optional): Extra request headers (set by clone()).
+        """
+        self.tree = tree
+        self.latency = latency
+        self.page_size = page_size
+        self.honor_range = honor_range
+        self._headers = headers
+        # Shared with clones: counters, plus listing and search cursors {cursor: (keys, offset, limit)}
+        self._stats = _stats or {'lock': threading.Lock(), 'calls': Counter(), 'bytes_downloaded': 0, 'cursors': {}}
+        self._cursors = self._stats['cursors']
+
+    # --- Accounting ---
+
+    def _call(self, name):
+        with self._stats['lock']:
+            self._stats['calls'][name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _new_cursor(self, keys, offset, limit):
+        with self._stats['lock']:
+            cursor = f"cursor-{len(self._cursors)}"
+            self._cursors[cursor] = (keys, offset, limit)
+        return cursor
+
+    def _count_bytes(self, amount):
+        with self._stats['lock']:
+            self._stats['bytes_downloaded'] += amount
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: round_trips, calls (per method) and bytes_downloaded.
+        """
+        with self._stats['lock']:
+            calls = dict(self._stats['calls'])
+            return {'round_trips': sum(calls.values()), 'calls': calls, 'bytes_downloaded': self._stats['bytes_downloaded']}
+
+    def reset_stats(self):
+        with self._stats['lock']:
+            self._stats['calls'].clear()
+            self._stats['bytes_downloaded'] = 0
+
+    # --- Metadata ---
+
+    def _metadata(self, path_lower):
+        node = self.tree[path_lower]
+        name = node['path'].rsplit("/", 1)[-1]
+        if node['is_folder']:
+            return dropbox.files.FolderMetadata(
+                name=name, id=f"id:{hashlib.md5(path_lower.encode()).hexdigest()[:16]}",
+                path_lower=path_lower, path_display=node['path'],
+            )
+        return dropbox.files.FileMetadata(
+            name=name,
+            id=f"id:{hashlib.md5(path_lower.encode()).hexdigest()[:16]}",
+            client_modified=_MODIFIED,
+            server_modified=_MODIFIED,
+            rev=hashlib.md5(path_lower.encode()).hexdigest()[:16],
+            size=node['size'],
+            path_lower=path_lower,
+            path_display=node['path'],
+            content_hash=hashlib.sha256(f"{path_lower}:{node['size']}".encode()).hexdigest(),
+        )
+
+    def _lookup(self, path):
+        path_lower = path.rstrip("/").lower()
+        if path_lower not in self.tree:
+            raise dropbox.exceptions.ApiError(
+                "fake-request-id",
+                dropbox.files.LookupError.not_found,
+                f"path/not_found/ {path}",
+                None,
+            )
+        return path_lower
+
+    def _children(self, path_lower, recursive):
+        prefix = path_lower + "/"
+        return [
+            key for key in self.tree
+            if key.startswith(prefix) and (recursive or "/" not in key[len(prefix):])
+        ]
+
+    # --- Listing ---
+
+    def _page(self, cursor):
+        keys, offset, limit = self._cursors[cursor]
+        page = keys[offset:offset + limit]
+        has_more = offset + limit < len(keys)
+        # The last cursor points past the end, so continuing from it later returns no changes
+        next_cursor = self._new_cursor(keys, offset + limit, limit)
+        return dropbox.files.ListFolderResult(
+            entries=[self._metadata(key) for key in page],
+            cursor=next_cursor,
+            has_more=has_more,
+        )
+
+    def files_list_folder(self, path, recursive=False, limit=None, **kwargs):
+        self._call("files_list_folder")
+        path_lower = self._lookup(path)
+        keys = sorted(self._children(path_lower, recursive))
+        return self._page(self._new_cursor(keys, 0, limit or self.page_size))
+
+    def files_list_folder_continue(self, cursor):
+        self._call("files_list_folder_continue")
+        return self._page(cursor)
+
+    def files_get_metadata(self, path, **kwargs):
+        self._call("files_get_metadata")
+        return self._metadata(self._lookup(path))
+
+    # --- Downloads ---
+
+    def clone(self, headers=None, **kwargs):
+        return FakeDropbox(self.tree, self.latency, self.page_size, self.honor_range, headers, self._stats)
+
+    def files_download(self, path, rev=None):
+        self._call("files_download")
+        metadata = self._metadata(self._lookup(path))
+        start, end, status_code = 0, metadata.size, 200
+        match = _RANGE_HEADER.match((self._headers or {}).get('Range', ""))
+        if match and self.honor_range:
+            start = int(match.group(1))
+            if start >= metadata.size:
+                raise dropbox.exceptions.HttpError("fake-request-id", 416, "Range Not Satisfiable")
+            if match.group(2):
+                end = min(metadata.size, int(match.group(2)) + 1)
+            status_code = 206
+        return metadata, FakeDownloadResponse(self, metadata.path_lower, start, end, status_code)
+
+    # --- Search ---
+
+    def _search_page(self, cursor):
+        keys, offset, limit = self._cursors[cursor]
+        page = keys[offset:offset + limit]
+        has_more = offset + limit < len(keys)
+        next_cursor = self._new_cursor(keys, offset + limit, limit) if has_more else None
+        return dropbox.files.SearchV2Result(
+            matches=[dropbox.files.SearchMatchV2(metadata=dropbox.files.MetadataV2.metadata(self._metadata(key))) for key in page],
+            has_more=has_more,
+            cursor=next_cursor,
+        )
+
+    def files_search_v2(self, query, options=None):
+        self._call("files_search_v2")
+        terms = query.lower().split()
+        root = (options.path or "").lower() if options else ""
+        extensions = {f".{ext}" for ext in options.file_extensions} if options and options.file_extensions else None
+        keys = sorted(
+            key for key, node in self.tree.items()
+            if key and key.startswith(root)
+            and all(term in key.rsplit("/", 1)[-1] for term in terms)
+            and (extensions is None or (not node['is_folder'] and "." + key.rsplit(".", 1)[-1] in extensions))
+        )
+        return self._search_page(self._new_cursor(keys, 0, (options.max_results if options else None) or 100))
+
+    def files_search_continue_v2(self, cursor):
+        self._call("files_search_continue_v2")
+        return self._search_page(cursor)
@@ -0,0 +1,121 @@
+import json
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+
+class ScriptedOpenAI:
+    """
+    In-process stand-in for the OpenAI client that plays back a script.
+
+    Each chat.completions.create call returns the next step of the script: a list of
+    (tool_name, arguments) tuples becomes an assistant message with those tool calls,
+    a string becomes the final answer. When the script runs out the answer is "Done.".
+    responses.create (file summaries) returns a fixed summary. Both count calls and
+    the bytes of the request payload, and sleep latency seconds per call.
+
+    async_client is the AsyncOpenAI counterpart for the async engine, playing the same
+    script; it awaits the latency instead of blocking the event loop.
+    """
+
+    def __init__(self, script=None, latency=0.0, summary="Summary: generated rows of sample data."):
+        """
+        Args:
+            script (list, optional): Steps to play back, see the class docstring.
+            latency (float): Seconds slept per call, to model model latency.
+            summary (str): Text returned by responses.create.
+        """
+        self.latency = latency
+        self.summary = summary
+        self._lock = threading.Lock()
+        self._script = []
+        self._stats = {}
+        self.load(script or [])
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat_create))
+        self.responses = SimpleNamespace(create=self._responses_create)
+        self.async_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self._chat_create_async)))
+
+    def load(self, script):
+        """Replaces the script and resets the counters."""
+        with self._lock:
+            self._script = list(script)
+            self._stats = {'chat_calls': 0, 'responses_calls': 0, 'bytes_sent': 0}
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: chat_calls, responses_calls and bytes_sent (JSON size of the requests).
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def _record(self, kind, payload, sleep=True):
+        size = len(json.dumps(payload, default=str))
+        with self._lock:
+            self._stats[kind] += 1
+            self._stats['bytes_sent'] += size
+            step = self._script.pop(0) if kind == 'chat_calls' and self._script else None
+        if self.latency and sleep:
+            time.sleep(self.latency)
+        return size, step
+
+    def _chat_create(self, model, messages, stream=False, **kwargs):
+        size, step = self._record('chat_calls', messages)
+        return self._chat_response(model, size, step, stream)
+
+    async def _chat_create_async(self, model, messages, stream=False, **kwargs):
+        size, step = self._record('chat_calls', messages, sleep=False)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        response = self._chat_response(model, size, step, stream)
+        if not stream:
+            return response
+
+        async def _stream():
+            for chunk in response:
+                yield chunk
+        return _stream()
+
+    def _chat_response(self, model, size, step, stream):
+        usage = {"prompt_tokens": size // 4, "completion_tokens": 20, "total_tokens": size // 4 + 20}
+        if step is None:
+            step = "Done."
+        if isinstance(step, str):
+            message = {"role": "assistant", "content": step}
+        else:
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {"id": f"call_{index}", "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+                    for index, (name, arguments) in enumerate(step)
+                ],
+            }
+        if stream:
+            return self._chunks(model, message, usage)
+        return ChatCompletion.model_validate({
+            "id": "fake", "object": "chat.completion", "created": 0, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": message}],
+            "usage": usage,
+        })
+
+    def _chunks(self, model, message, usage):
+        base = {"id": "fake", "object": "chat.completion.chunk", "created": 0, "model": model}
+        if message.get("tool_calls"):
+            deltas = [{"role": "assistant", "tool_calls": [dict(tool_call, index=index) for index, tool_call in enumerate(message["tool_calls"])]}]
+        else:
+            words = message["content"].split(" ")
+            deltas = [{"role": "assistant", "content": word + (" " if index < len(words) - 1 else "")} for index, word in enumerate(words)]
+        for delta in deltas:
+            yield ChatCompletionChunk.model_validate({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+        yield ChatCompletionChunk.model_validate({**base, "choices": [], "usage": usage})
+
+    def _responses_create(self, model, input, **kwargs):
+        size, _ = self._record('responses_calls', input)
+        # Only the fields the agent reads; the full Response schema changes between SDK versions
+        return SimpleNamespace(
+            output_text=self.summary,
+            usage=SimpleNamespace(input_tokens=size // 4, output_tokens=20),
+        )
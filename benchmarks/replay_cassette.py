@@ -0,0 +1,150 @@
+"""
+Replays a recorded session offline and reports how the current code performs on it.
+
+Record a cassette by running the agent with AGENT_CASSETTE set, e.g.
+
+    AGENT_CASSETTE=cassettes/finance-search.jsonl python main_agent.py
+
+Every Dropbox and OpenAI call is then written to the cassette, tagged with the
+conversation turn it belongs to, along with the history each turn started from.
+Replaying drives handle_conversation through the same turns: each turn gets its own
+recorded model answers in order, and each Dropbox call is answered with the response
+recorded for the same request. Run from the repository root:
+
+    python -m benchmarks.replay_cassette cassettes/finance-search.jsonl
+    python -m benchmarks.replay_cassette cassettes/finance-search.jsonl --dropbox-latency-ms 50 --model-latency-ms 0
+
+Dropbox calls the current code makes that were not recorded (e.g. after changing
+request parameters) are reported as misses.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+# utils.openai_api_call builds its clients at import time
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from benchmarks.run_benchmarks import bench_environment
+import utils.openai_api_call as openai_api_call
+from utils.cassette import load_cassette, turn_context, ReplayDropbox, ReplayOpenAI
+
+
+def _latency(value):
+    """Parses a --*-latency-ms option: "recorded" or milliseconds."""
+    return None if value == "recorded" else float(value) / 1000
+
+
+def summarize_recording(entries):
+    """
+    Returns the numbers of the recorded session, for comparison with the replay.
+
+    Returns:
+        dict: turns, dropbox_round_trips, dropbox_seconds, openai_calls and openai_seconds.
+    """
+    # Change notifications block by design; they are not part of a search
+    dropbox_entries = [e for e in entries if e['type'] == "dropbox" and e['method'] != "files_list_folder_longpoll"]
+    openai_entries = [e for e in entries if e['type'] == "openai"]
+    return {
+        'turns': sum(1 for e in entries if e['type'] == "turn"),
+        'dropbox_round_trips': len(dropbox_entries),
+        'dropbox_seconds': round(sum(e.get('elapsed', 0) for e in dropbox_entries), 3),
+        'openai_calls': len(openai_entries),
+        'openai_seconds': round(sum(e.get('elapsed', 0) for e in openai_entries), 3),
+    }
+
+
+def replay(entries, dropbox_latency=None, model_latency=None):
+    """
+    Replays every recorded turn with handle_conversation.
+
+    Args:
+        entries (list): Cassette entries from load_cassette.
+        dropbox_latency (float, optional): Seconds per Dropbox call; None uses the recorded latency.
+        model_latency (float, optional): Seconds per OpenAI call; None uses the recorded latency.
+
+    Returns:
+        dict: turns (wall_seconds, dropbox_round_trips, openai_calls and messages per turn),
+              wall_seconds, dropbox_round_trips, dropbox_calls, openai_calls and misses.
+    """
+    dbx = ReplayDropbox(entries, latency=dropbox_latency)
+    fake_openai = ReplayOpenAI(entries, latency=model_latency)
+    turns = []
+    with bench_environment(dbx, fake_openai):
+        for entry in entries:
+            if entry['type'] != "turn":
+                continue
+            round_trips_before = dbx.get_stats()['round_trips']
+            openai_before = sum(fake_openai.get_stats().values())
+            started = time.perf_counter()
+            try:
+                # Each turn gets the model answers and Dropbox responses recorded for it,
+                # even if other conversations were interleaved with it while recording
+                with turn_context(entry.get('turn')):
+                    history, _ = openai_api_call.handle_conversation(entry['history'])
+                messages = len(history) - len(entry['history'])
+                error = None
+            except RuntimeError as e:
+                messages, error = 0, str(e)
+            turns.append({
+                'wall_seconds': round(time.perf_counter() - started, 4),
+                'dropbox_round_trips': dbx.get_stats()['round_trips'] - round_trips_before,
+                'openai_calls': sum(fake_openai.get_stats().values()) - openai_before,
+                'messages': messages,
+                'error': error,
+            })
+
+    stats = dbx.get_stats()
+    return {
+        'turns': turns,
+        'wall_seconds': round(sum(t['wall_seconds'] for t in turns), 4),
+        'dropbox_round_trips': stats['round_trips'],
+        'dropbox_calls': stats['calls'],
+        'openai_calls': sum(fake_openai.get_stats().values()),
+        'misses': stats['misses'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded agent session against the current code.")
+    parser.add_argument("cassette", help="Cassette file recorded with AGENT_CASSETTE")
+    parser.add_argument("--dropbox-latency-ms", default="recorded", help='Latency per Dropbox call, or "recorded" (default)')
+    parser.add_argument("--model-latency-ms", default="recorded", help='Latency per OpenAI call, or "recorded" (default)')
+    parser.add_argument("--json", help="Also write the results to this JSON file, for comparing runs")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    entries = load_cassette(args.cassette)
+    recorded = summarize_recording(entries)
+    if not recorded['turns']:
+        print(f"{args.cassette} has no recorded conversation turns.")
+        return 1
+
+    replayed = replay(entries, _latency(args.dropbox_latency_ms), _latency(args.model_latency_ms))
+
+    print(f"Cassette: {args.cassette} ({recorded['turns']} turn(s))")
+    print(f"Dropbox latency: {args.dropbox_latency_ms}, model latency: {args.model_latency_ms}\n")
+    print(f"{'turn':>4} {'wall s':>8} {'dbx RT':>7} {'oai':>4} {'msgs':>5}")
+    for number, turn in enumerate(replayed['turns'], start=1):
+        line = f"{number:>4} {turn['wall_seconds']:>8.3f} {turn['dropbox_round_trips']:>7} {turn['openai_calls']:>4} {turn['messages']:>5}"
+        print(line + (f"  error: {turn['error']}" if turn['error'] else ""))
+    print(f"\nRecorded: {recorded['dropbox_round_trips']} Dropbox round trips ({recorded['dropbox_seconds']}s), "
+          f"{recorded['openai_calls']} OpenAI calls ({recorded['openai_seconds']}s)")
+    print(f"Replayed: {replayed['dropbox_round_trips']} Dropbox round trips, {replayed['openai_calls']} OpenAI calls, "
+          f"{replayed['wall_seconds']}s wall")
+    if replayed['misses']:
+        print(f"\n{len(replayed['misses'])} Dropbox request(s) were not in the cassette:")
+        for key in replayed['misses'][:10]:
+            print(f"  {key}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'cassette': args.cassette, 'recorded': recorded, 'replayed': replayed}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
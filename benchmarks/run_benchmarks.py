@@ -0,0 +1,203 @@
+"""
+Offline benchmarks for the agent's Dropbox and OpenAI paths.
+
+Runs each scenario against an in-process fake Dropbox tree (benchmarks/fake_dropbox.py)
+and a scripted fake OpenAI client (benchmarks/fake_openai.py), so no credentials or
+network are needed, and reports wall time, API round trips, bytes moved and peak
+Python memory per scenario. Run from the repository root:
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --breadth 8 --depth 3 --latency-ms 30 --json before.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+
+# utils.openai_api_call builds its clients at import time
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from benchmarks.fake_dropbox import FakeDropbox, build_tree
+from benchmarks.fake_openai import ScriptedOpenAI
+import utils.metadata_index as metadata_index
+import utils.memory_store as memory_store
+import utils.openai_api_call as openai_api_call
+from utils.dropbox_client_context import DropboxContext, set_context_factory
+from utils.dropbox_folder_manager import list_folder_complete, list_tree
+from utils.dropbox_file_manager import download_file_with_size_limit
+from utils.dropbox_search_manager import search_files
+from utils.tools import check_file_contents
+
+# Constants
+LARGE_FILE_PATH = "/Archive/Export 2023.csv"
+LARGE_FILE_SIZE = 200 * 1024 * 1024
+SMALL_FILE_PATH = "/Folder 1-0/File 1-0.txt"
+
+
+@contextmanager
+def bench_environment(dbx, fake_openai):
+    """
+    Points the agent at the fakes and at a throwaway directory for its SQLite files
+    (metadata index, summary cache, memories), restoring everything afterwards.
+    """
+    work_dir = tempfile.mkdtemp(prefix="agent-bench-")
+    saved = (metadata_index.INDEX_DIR, metadata_index.INDEX_DB_PATH, memory_store.MEMORY_DB_PATH, openai_api_call.client, openai_api_call.async_client)
+    metadata_index.INDEX_DIR = work_dir
+    metadata_index.INDEX_DB_PATH = os.path.join(work_dir, "dropbox_index.db")
+    memory_store.MEMORY_DB_PATH = os.path.join(work_dir, "memory.db")
+    openai_api_call.client = fake_openai
+    # Fakes without an async client (cassette replay) are only driven through the sync engine
+    openai_api_call.async_client = getattr(fake_openai, "async_client", openai_api_call.async_client)
+    set_context_factory(lambda select_user: DropboxContext(dbx, "dbmid:benchmark", "ns:benchmark"))
+    try:
+        yield work_dir
+    finally:
+        set_context_factory(None)
+        metadata_index.INDEX_DIR, metadata_index.INDEX_DB_PATH, memory_store.MEMORY_DB_PATH, openai_api_call.client, openai_api_call.async_client = saved
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def measure(name, operation, dbx, fake_openai, script=None):
+    """
+    Runs one scenario and collects its numbers.
+
+    Args:
+        name (str): Scenario name.
+        operation (callable): Runs the scenario; returns a short description of the result.
+        dbx (FakeDropbox): The fake Dropbox client (counters are reset first).
+        fake_openai (ScriptedOpenAI): The fake OpenAI client (script loaded first).
+        script (list, optional): Model script for this scenario.
+
+    Returns:
+        dict: name, result, wall_seconds, dropbox_round_trips, dropbox_calls,
+              bytes_downloaded, openai_calls, openai_bytes_sent and peak_memory_bytes.
+    """
+    dbx.reset_stats()
+    fake_openai.load(script or [])
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    result = operation()
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    dropbox_stats = dbx.get_stats()
+    openai_stats = fake_openai.get_stats()
+    return {
+        'name': name,
+        'result': result,
+        'wall_seconds': round(wall, 4),
+        'dropbox_round_trips': dropbox_stats['round_trips'],
+        'dropbox_calls': dropbox_stats['calls'],
+        'bytes_downloaded': dropbox_stats['bytes_downloaded'],
+        'openai_calls': openai_stats['chat_calls'] + openai_stats['responses_calls'],
+        'openai_bytes_sent': openai_stats['bytes_sent'],
+        'peak_memory_bytes': max(0, peak - baseline),
+    }
+
+
+def _download_large_file():
+    local_path, is_truncated, total_size, _ = download_file_with_size_limit(LARGE_FILE_PATH)
+    try:
+        return f"{os.path.getsize(local_path)} of {total_size} bytes, truncated={is_truncated}"
+    finally:
+        os.remove(local_path)
+
+
+def run_scenarios(dbx, fake_openai):
+    """Runs every scenario in order and returns their results."""
+    results = []
+
+    def run(name, operation, script=None):
+        results.append(measure(name, operation, dbx, fake_openai, script))
+
+    run("list_folder_complete (recursive root)",
+        lambda: f"{len(list_folder_complete('', recursive=True))} entries")
+    run("list_folder_complete (name filter, 10 hits)",
+        lambda: f"{len(list_folder_complete('', recursive=True, max_entries=10, predicate=lambda e: e.name.endswith('.pdf')))} entries")
+    run("list_tree (depth 3)",
+        lambda: f"{sum(len(children) for children in list_tree('').children.values())} entries")
+    run("search_files (50 results)",
+        lambda: f"{len(search_files('File 2', max_results=50))} matches")
+    run("metadata_index.sync_index (cold crawl)",
+        lambda: f"{metadata_index.sync_index()} entries applied")
+    run("metadata_index.sync_index (incremental)",
+        lambda: f"{metadata_index.sync_index()} entries applied")
+    run("download_file_with_size_limit (200 MB file)", _download_large_file)
+    run("check_file_contents (text, cold)",
+        lambda: f"{len(check_file_contents(SMALL_FILE_PATH))} chars")
+    run("check_file_contents (text, cached)",
+        lambda: f"{len(check_file_contents(SMALL_FILE_PATH))} chars")
+    run("check_file_contents (200 MB CSV, sampled)",
+        lambda: f"{len(check_file_contents(LARGE_FILE_PATH))} chars")
+
+    def _conversation():
+        history, should_end = openai_api_call.handle_conversation(
+            [{"role": "user", "content": "Find last year's export of the sales data."}]
+        )
+        return f"{len(history)} messages, ended={should_end}"
+
+    # A typical search: look around, drill into a folder, read a file, answer
+    run("handle_conversation (4 model steps, 4 tools)", _conversation, script=[
+        [("list_folder_contents", {"dropbox_path": "/"})],
+        [("list_folder_contents", {"dropbox_path": "/Folder 1-0"}), ("search_dropbox", {"query": "Export"})],
+        [("check_file_contents", {"dropbox_path": "/Folder 1-0/File 1-1.csv"})],
+        "The export is /Archive/Export 2023.csv.",
+    ])
+    return results
+
+
+def print_results(results):
+    header = f"{'scenario':<46} {'wall s':>8} {'dbx RT':>7} {'MB down':>8} {'oai':>4} {'KB sent':>8} {'peak MB':>8}  result"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['name']:<46} {r['wall_seconds']:>8.3f} {r['dropbox_round_trips']:>7} "
+            f"{r['bytes_downloaded'] / 1024 / 1024:>8.2f} {r['openai_calls']:>4} "
+            f"{r['openai_bytes_sent'] / 1024:>8.1f} {r['peak_memory_bytes'] / 1024 / 1024:>8.2f}  {r['result']}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks against fake Dropbox and OpenAI backends.")
+    parser.add_argument("--breadth", type=int, default=5, help="Subfolders per folder (default: 5)")
+    parser.add_argument("--depth", type=int, default=3, help="Levels of subfolders (default: 3)")
+    parser.add_argument("--files-per-folder", type=int, default=20, help="Files per folder (default: 20)")
+    parser.add_argument("--file-size", type=int, default=64 * 1024, help="Bytes per generated file (default: 64 KB)")
+    parser.add_argument("--page-size", type=int, default=500, help="Entries per listing page (default: 500)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Simulated latency per Dropbox call")
+    parser.add_argument("--model-latency-ms", type=float, default=0, help="Simulated latency per OpenAI call")
+    parser.add_argument("--json", help="Also write the results to this JSON file, for comparing runs")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    tree = build_tree(args.breadth, args.depth, args.files_per_folder, args.file_size,
+                      large_files={LARGE_FILE_PATH: LARGE_FILE_SIZE})
+    dbx = FakeDropbox(tree, latency=args.latency_ms / 1000, page_size=args.page_size)
+    fake_openai = ScriptedOpenAI(latency=args.model_latency_ms / 1000)
+    print(f"Fake tree: {len(tree) - 1} entries (breadth {args.breadth}, depth {args.depth}, "
+          f"{args.files_per_folder} files per folder), {args.latency_ms:g} ms per Dropbox call\n")
+
+    tracemalloc.start()
+    try:
+        with bench_environment(dbx, fake_openai):
+            results = run_scenarios(dbx, fake_openai)
+    finally:
+        tracemalloc.stop()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
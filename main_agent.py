@@ -1,13 +1,33 @@
 import os
-import json
+import threading
 from datetime import datetime
-from openai.types.chat import ChatCompletionMessageToolCall
+from utils.memory_store import retrieve_memories
 
 AGENT_PROMPT_PATH = os.path.join("agent", "agent_prompt.txt")
 FOLDER_KNOWLEDGE_PATH = os.path.join("agent", "general_folder_knowledge.txt")
-RUNNING_MEMORY_PATH = os.path.join("agent", "running_memory.txt")
 
-def load_agent_prompt():
+# Static prompt text, re-read only when one of its files changes {'key': (mtime, size) per file, 'prompt': str}
+_static_prompt_cache = {'key': None, 'prompt': ""}
+_static_prompt_lock = threading.Lock()
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        return None
+
+def load_static_prompt():
+    """
+    Returns the part of the system prompt that is the same for every conversation: the
+    base prompt and folder knowledge. Memoized and re-read only when either file's
+    mtime or size changes, so new sessions don't touch the disk.
+    """
+    key = (_file_signature(AGENT_PROMPT_PATH), _file_signature(FOLDER_KNOWLEDGE_PATH))
+    with _static_prompt_lock:
+        if _static_prompt_cache['key'] == key:
+            return _static_prompt_cache['prompt']
+
     prompt = ""
     # Load base prompt
     if os.path.exists(AGENT_PROMPT_PATH):
@@ -22,27 +42,60 @@ def load_agent_prompt():
                 prompt += "\n\n" + knowledge
             else:
                 prompt = knowledge
-    
-    # Append running memory if exists
-    if os.path.exists(RUNNING_MEMORY_PATH) and os.path.getsize(RUNNING_MEMORY_PATH) > 0:
-        with open(RUNNING_MEMORY_PATH, "r") as f:
-            memory = f.read().strip()
-            if memory:
-                # Add the disclaimer before the memory content
-                disclaimer = "Note: The following memories are from previous sessions. They might be helpful, but often will not be relevant to the current search. Use your judgment."
-                memory_header = "### Accumulated Knowledge ###"
-                # Combine disclaimer, header, and memory, ensuring proper spacing
-                memory_section = f"\n\n{disclaimer}\n{memory_header}\n{memory}"
-
-                if prompt:  # Append to existing prompt
-                    prompt += memory_section
-                else:
-                    # If no base prompt, start with the memory section, removing leading newline
-                    prompt = memory_section.lstrip()
-    
+
+    with _static_prompt_lock:
+        _static_prompt_cache['key'] = key
+        _static_prompt_cache['prompt'] = prompt
     return prompt
 
-from utils.openai_api_call import client, tools, handle_conversation
+def load_memory_prompt(query=None):
+    """
+    Returns the stored memories most relevant to query (at most MEMORY_TOP_K, within
+    MEMORY_TOKEN_BUDGET tokens) as prompt text, or "" if there are none.
+    """
+    memories = retrieve_memories(query)
+    if not memories:
+        return ""
+    memory = "\n".join(f"[{m['updated_at']}] {m['content']}" for m in memories)
+    # Add the disclaimer before the memory content
+    disclaimer = "Note: The following memories are from previous sessions. They might be helpful, but often will not be relevant to the current search. Use your judgment."
+    memory_header = "### Accumulated Knowledge ###"
+    return f"{disclaimer}\n{memory_header}\n{memory}"
+
+def build_system_messages(query=None):
+    """
+    Builds the system messages that start a conversation. The static prompt comes
+    first and is byte-identical across sessions, so together with the tool definitions
+    it forms a prefix OpenAI can serve from its prompt cache; the per-request memories
+    follow in a second message.
+
+    Args:
+        query (str, optional): The user's first message, used to pick relevant memories.
+
+    Returns:
+        list: System message dicts (empty if there is no prompt at all).
+    """
+    messages = []
+    static_prompt = load_static_prompt()
+    if static_prompt:
+        messages.append({"role": "system", "content": static_prompt})
+    memory_prompt = load_memory_prompt(query)
+    if memory_prompt:
+        messages.append({"role": "system", "content": memory_prompt})
+    return messages
+
+def load_agent_prompt(query=None):
+    """
+    Builds the full system prompt as one string: the static prompt followed by the
+    memories relevant to query. Conversations use build_system_messages instead.
+    """
+    return "\n\n".join(message["content"] for message in build_system_messages(query))
+
+from utils.openai_api_call import client, tools, handle_conversation, run_conversation_turn, STREAM_RESPONSES
+from utils.metadata_index import start_index_watcher
+from utils.content_index import start_content_indexer
+from utils.session_log import append_session_messages, flush_session_logs, session_log_path
+from utils.tracing import TRACING_ENABLED, start_metrics_exporter, write_metrics
 
 HISTORY_DIR = "history"
 os.makedirs(HISTORY_DIR, exist_ok=True)
@@ -55,22 +108,39 @@ RESET_COLOR = "\033[0m"
 
 MODEL = "gpt-4.1"  # Per user instructions
 
-# Custom JSON serializer function
-def default_serializer(obj):
-    if isinstance(obj, ChatCompletionMessageToolCall):
-        # Convert the Pydantic model to a dictionary
-        return obj.model_dump() 
-    # Let the default encoder handle other types or raise an error
-    raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
-
 def save_conversation(history, session_id):
-    path = os.path.join(HISTORY_DIR, f"{session_id}.json")
-    try:
-        with open(path, "w") as f:
-            # Use the custom serializer with json.dump
-            json.dump(history, f, indent=2, default=default_serializer)
-    except TypeError as e:
-        print(f"Error saving conversation: {e}")
+    """
+    Appends the messages added since the last save to history/<session_id>.jsonl.
+    Writing happens on a background thread, so this returns immediately.
+    """
+    append_session_messages(history, session_id)
+
+
+def make_stream_printer():
+    """
+    Returns (on_event, finish) for streaming a turn to the terminal: on_event prints
+    response text as it arrives and a line per tool call; finish ends the last line.
+    """
+    state = {'in_text': False}
+
+    def end_text():
+        if state['in_text']:
+            print(RESET_COLOR, flush=True)
+            state['in_text'] = False
+
+    def on_event(event, data):
+        if event == "text":
+            if not state['in_text']:
+                print(f"{AGENT_COLOR}Agent: ", end="")
+                state['in_text'] = True
+            print(data, end="", flush=True)
+        elif event == "tool_start":
+            end_text()
+            print(f"{SYSTEM_COLOR}  ... {data['description']}{RESET_COLOR}", flush=True)
+        elif event == "step":
+            end_text()
+
+    return on_event, end_text
 
 
 def get_new_session_id():
@@ -78,6 +148,12 @@ def get_new_session_id():
 
 
 def main():
+    # Keep the local metadata and full-text indexes fresh in the background while the user types
+    start_index_watcher()
+    start_content_indexer()
+    # No-op unless AGENT_TRACE=1
+    start_metrics_exporter()
+
     # Use SYSTEM_COLOR for initial messages
     print(f"{SYSTEM_COLOR}Welcome! Describe the file you're looking for in Dropbox (be as vague as you want):{RESET_COLOR}")
     # Use USER_COLOR for the user prompt indicator
@@ -85,10 +161,8 @@ def main():
     session_id = get_new_session_id()
     history = []
 
-    # Add system prompt (now includes folder knowledge)
-    system_prompt = load_agent_prompt()
-    if system_prompt:
-        history.append({"role": "system", "content": system_prompt})
+    # Static system prompt first (cacheable prefix), then the memories relevant to this request
+    history.extend(build_system_messages(user_prompt))
 
     # Initial user message
     history.append({"role": "user", "content": user_prompt})
@@ -99,19 +173,26 @@ def main():
     while turn < max_turns: # Loop primarily based on turns
         # Use the new conversation handler function
         prev_len = len(history)
-        # handle_conversation returns the updated history and whether the *end_conversation* tool was called
-        history, should_end = handle_conversation(history, model=MODEL) 
+        # run_conversation_turn (async engine on the agent loop by default, or the sync engine) returns the updated history and whether the *end_conversation* tool was called
+        if STREAM_RESPONSES:
+            # Text and tool progress are printed while the turn runs
+            on_event, finish_stream = make_stream_printer()
+            history, should_end = run_conversation_turn(history, model=MODEL, on_event=on_event)
+            finish_stream()
+        else:
+            history, should_end = run_conversation_turn(history, model=MODEL)
         
         # Save conversation history immediately after the API call and processing
         save_conversation(history, session_id)
         
-        # Determine what to show to the user from the new messages
-        new_messages = history[prev_len:]
-        
-        # Print only non-None assistant responses using AGENT_COLOR
-        for msg in new_messages:
-            if msg["role"] == "assistant" and msg.get("content") is not None:
-                print(f"{AGENT_COLOR}Agent: {msg.get('content', '')}{RESET_COLOR}")
+        if not STREAM_RESPONSES:
+            # Determine what to show to the user from the new messages
+            new_messages = history[prev_len:]
+            
+            # Print only non-None assistant responses using AGENT_COLOR
+            for msg in new_messages:
+                if msg["role"] == "assistant" and msg.get("content") is not None:
+                    print(f"{AGENT_COLOR}Agent: {msg.get('content', '')}{RESET_COLOR}")
         
         # Check if the agent signaled to end the conversation
         if should_end:
@@ -135,8 +216,12 @@ def main():
         
         turn += 1
 
+    # Make sure the background writer has finished before exiting
+    flush_session_logs()
+    if TRACING_ENABLED:
+        write_metrics()
     # Use SYSTEM_COLOR for the final message
-    print(f"\n{SYSTEM_COLOR}Conversation saved to {os.path.join(HISTORY_DIR, session_id + '.json')}{RESET_COLOR}")
+    print(f"\n{SYSTEM_COLOR}Conversation saved to {session_log_path(session_id)}{RESET_COLOR}")
 
 if __name__ == "__main__":
     main()
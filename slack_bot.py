@@ -3,8 +3,9 @@ import logging
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 from dotenv import load_dotenv
-from threading import Thread
 import time
+import asyncio
+import concurrent.futures
 
 # Load environment variables from .env file
 load_dotenv()
@@ -19,8 +20,15 @@ logger = logging.getLogger(__name__)
 # Import necessary functions from our agent (adjust path if needed)
 # Assuming utils and agent folders are accessible from where slack_bot.py is run
 try:
-    from utils.openai_api_call import handle_conversation, tools # Assuming tools might be needed directly later
-    from main_agent import load_agent_prompt, save_conversation, get_new_session_id
+    from utils.openai_api_call import handle_conversation, run_conversation_turn, run_conversation_turn_async, submit_to_agent_loop, tools, STREAM_RESPONSES, USE_ASYNC_ENGINE # Assuming tools might be needed directly later
+    from main_agent import build_system_messages, save_conversation, get_new_session_id, HISTORY_DIR
+    from utils.metadata_index import start_index_watcher
+    from utils.conversation_dispatcher import ConversationDispatcher
+    from utils.content_index import start_content_indexer
+    from utils.conversation_store import ConversationStateStore
+    from utils.session_log import forget_session
+    from utils.slack_stream import SlackMessageStreamer
+    from utils.tracing import start_metrics_exporter
     logger.info("Successfully imported agent functions.")
 except ImportError as e:
     logger.error(f"Error importing agent functions: {e}. Make sure PYTHONPATH is set correctly or files are in the right place.")
@@ -30,9 +38,26 @@ except ImportError as e:
 # Initializes your app with your bot token
 app = App(token=SLACK_BOT_TOKEN)
 
-# Dictionary to store conversation states {channel_id_user_id: {'history': [], 'session_id': ''}}
+# Messages are queued per conversation and processed by a bounded worker pool (see enqueue_message)
+AGENT_MAX_WORKERS = int(os.environ.get("AGENT_MAX_WORKERS", "8"))
+AGENT_MAX_PENDING = int(os.environ.get("AGENT_MAX_PENDING", "200"))
+AGENT_TURN_TIMEOUT_SECONDS = 300
+
+# Conversation states kept in memory; idle or least-recently-used ones spill to disk
+AGENT_MAX_SESSIONS = int(os.environ.get("AGENT_MAX_SESSIONS", "200"))
+AGENT_SESSION_IDLE_SECONDS = int(os.environ.get("AGENT_SESSION_IDLE_SECONDS", "1800"))
+AGENT_SESSION_MEMORY_MB = int(os.environ.get("AGENT_SESSION_MEMORY_MB", "100"))
+
+# Conversation states {channel_id_user_id: {'history': [], 'session_id': ''}}
 # Using channel_id_user_id to support concurrent conversations in different channels/DMs by the same user
-conversation_states = {}
+conversation_states = ConversationStateStore(
+    os.path.join(HISTORY_DIR, "slack_sessions"),
+    max_sessions=AGENT_MAX_SESSIONS,
+    idle_ttl_seconds=AGENT_SESSION_IDLE_SECONDS,
+    max_bytes=AGENT_SESSION_MEMORY_MB * 1024 * 1024,
+    # The session log's per-session counter goes with the state; it is recounted from disk if the conversation returns
+    on_spill=lambda state_key, state: forget_session(state["session_id"]),
+)
 
 # --- Event Handlers ---
 
@@ -58,7 +83,7 @@ def handle_app_mention_events(body, say, logger):
     # Use channel_id + user_id as a unique key for state
     state_key = f"{channel_id}_{user_id}"
     
-    process_message(state_key, user_input, say, thread_ts)
+    enqueue_message(state_key, user_input, say, thread_ts)
 
 
 @app.event("message")
@@ -83,57 +108,117 @@ def handle_message_events(body, say, logger):
     # Use channel_id + user_id as the key (channel_id is the DM channel ID here)
     state_key = f"{channel_id}_{user_id}"
     # DMs don't have threads in the same way, so we don't pass thread_ts to say
-    process_message(state_key, user_input, say) 
+    enqueue_message(state_key, user_input, say) 
+
+def _reply(say_func, text, thread_ts=None):
+    """Posts a message, in the thread if there is one."""
+    if thread_ts:
+        say_func(text=text, thread_ts=thread_ts)
+    else:
+        say_func(text=text)
+
+def enqueue_message(state_key, user_input, say_func, thread_ts=None):
+    """
+    Queues an incoming message for its conversation and returns immediately, so the
+    Bolt listener finishes (and Slack is acknowledged) without waiting for the agent.
+    """
+    accepted, ahead, saturated = dispatcher.submit(state_key, {
+        "user_input": user_input,
+        "say_func": say_func,
+        "thread_ts": thread_ts,
+    })
+    metrics = dispatcher.get_metrics()
+    logger.info(f"Queue depth {metrics['queue_depth']}, running {metrics['running']}/{metrics['max_workers']}, avg wait {metrics['avg_wait_seconds']:.1f}s")
+
+    if not accepted:
+        logger.warning(f"Rejected message for {state_key}: queue is full ({metrics['queue_depth']} waiting)")
+        _reply(say_func, "Sorry, I'm handling too many requests right now. Please try again in a few minutes.", thread_ts)
+    elif ahead:
+        _reply(say_func, "Got it! I'll get to this as soon as I've finished your previous message.", thread_ts)
+    elif saturated:
+        _reply(say_func, f"Got it! I'm busy with other requests at the moment ({metrics['conversations_waiting']} conversation(s) waiting); I'll start on yours shortly.", thread_ts)
+
+def _process_queued_message(state_key, item):
+    """Dispatcher handler: runs one queued message on a worker thread."""
+    return process_message(state_key, item["user_input"], item["say_func"], item["thread_ts"])
 
 def process_message(state_key, user_input, say_func, thread_ts=None):
-    """Processes incoming user messages, manages state, and calls the agent."""
-    global conversation_states
-    
-    if state_key not in conversation_states:
+    """
+    Processes incoming user messages, manages state, and calls the agent.
+    Runs on a dispatcher worker; messages for the same state_key never run concurrently.
+
+    With the async engine the worker only starts the turn: it runs on the agent loop and
+    posts its own reply, and the returned future tells the dispatcher when it is done,
+    so no worker thread waits for the model. Otherwise the turn runs on the worker.
+    """
+    current_state = conversation_states.get(state_key)
+    if current_state is None:
         # Start a new conversation
         logger.info(f"Starting new conversation for state_key: {state_key}")
         session_id = get_new_session_id()
-        system_prompt = load_agent_prompt()
-        history = []
-        if system_prompt:
-            history.append({"role": "system", "content": system_prompt})
+        # Static system prompt first (cacheable prefix), then the memories relevant to this request
+        history = build_system_messages(user_input)
         history.append({"role": "user", "content": user_input})
-        conversation_states[state_key] = {"history": history, "session_id": session_id}
+        current_state = {"history": history, "session_id": session_id}
     else:
         # Continue existing conversation
         logger.info(f"Continuing conversation for state_key: {state_key}")
-        conversation_states[state_key]["history"].append({"role": "user", "content": user_input})
-
-    current_state = conversation_states[state_key]
-    history_to_send = current_state["history"]
-    session_id = current_state["session_id"]
+        current_state["history"].append({"role": "user", "content": user_input})
+    conversation_states.put(state_key, current_state)
 
+    streamer = None
     try:
         # Add a thinking message
         thinking_message = "Thinking..."
         if thread_ts:
-            say_func(text=thinking_message, thread_ts=thread_ts)
+            thinking_response = say_func(text=thinking_message, thread_ts=thread_ts)
         else:
-            say_func(text=thinking_message)
+            thinking_response = say_func(text=thinking_message)
 
-        # Run API call in a separate thread to avoid blocking Slack event loop
-        updated_history, should_end = None, False
-        
-        def run_handle_conversation():
-            nonlocal updated_history, should_end
-            # NOTE: Ensure handle_conversation and its dependencies (API calls, etc.) are thread-safe
-            # or consider using a queue/worker pattern for more complex scenarios.
-            # For now, assuming OpenAI client and file operations are reasonably safe.
-            updated_history, should_end = handle_conversation(history_to_send, model="gpt-4.1") # Use configured model
-        
-        thread = Thread(target=run_handle_conversation)
-        thread.start()
-        thread.join(timeout=300) # Wait for completion, adjust timeout as needed (Slack needs response < 3s for ack)
+        # Stream the answer and tool progress into the thinking message as the turn runs
+        if STREAM_RESPONSES and thinking_response is not None and thinking_response.get("ts"):
+            streamer = SlackMessageStreamer(app.client, thinking_response["channel"], thinking_response["ts"])
+
+        if USE_ASYNC_ENGINE:
+            return submit_to_agent_loop(_run_turn_async(state_key, current_state, say_func, thread_ts, streamer))
+
+        # Sync engine: the turn runs on this worker and is stopped at the deadline
+        result = run_conversation_turn(
+            current_state["history"],
+            model="gpt-4.1", # Use configured model
+            timeout=AGENT_TURN_TIMEOUT_SECONDS,
+            on_event=streamer.on_event if streamer else None,
+        )
+    except Exception as e:
+        _turn_failed(state_key, current_state, say_func, thread_ts, streamer, e)
+        return None
+    _turn_finished(state_key, current_state, result, say_func, thread_ts, streamer)
+    return None
 
-        if updated_history is None:
-            raise TimeoutError("Agent response timed out.")
+async def _run_turn_async(state_key, current_state, say_func, thread_ts, streamer):
+    """
+    Runs a turn on the agent loop and posts the reply. Slack calls block, so the reply
+    is posted from the loop's helper threads rather than on the loop itself.
+    """
+    try:
+        result = await run_conversation_turn_async(
+            current_state["history"],
+            model="gpt-4.1", # Use configured model
+            timeout=AGENT_TURN_TIMEOUT_SECONDS,
+            on_event=streamer.on_event if streamer else None,
+        )
+    except Exception as e:
+        await asyncio.to_thread(_turn_failed, state_key, current_state, say_func, thread_ts, streamer, e)
+        return
+    await asyncio.to_thread(_turn_finished, state_key, current_state, result, say_func, thread_ts, streamer)
 
+def _turn_finished(state_key, current_state, result, say_func, thread_ts, streamer):
+    """Stores the updated history and posts the agent's answer."""
+    updated_history, should_end = result
+    session_id = current_state["session_id"]
+    try:
         current_state["history"] = updated_history # Update history in state
+        conversation_states.put(state_key, current_state) # Re-measure it for the memory cap
         
         # Get only the most recent assistant response
         assistant_responses = []
@@ -143,10 +228,12 @@ def process_message(state_key, user_input, say_func, thread_ts=None):
                 break
         response_text = "\n".join(assistant_responses).strip() if assistant_responses else "Sorry, I encountered an issue." # Default if no content
 
-        if thread_ts:
-            say_func(text=response_text, thread_ts=thread_ts)
-        else:
-            say_func(text=response_text)
+        # When streaming, the thinking message is replaced with the answer
+        if streamer is None or not streamer.finish(response_text):
+            if thread_ts:
+                say_func(text=response_text, thread_ts=thread_ts)
+            else:
+                say_func(text=response_text)
 
         # Save conversation
         save_conversation(current_state["history"], session_id)
@@ -158,19 +245,37 @@ def process_message(state_key, user_input, say_func, thread_ts=None):
                 say_func(text=final_message, thread_ts=thread_ts)
             else:
                 say_func(text=final_message)
-            del conversation_states[state_key] # Clear state for next interaction
-
+            conversation_states.delete(state_key) # Clear state for next interaction
+            forget_session(session_id)
     except Exception as e:
-        logger.error(f"Error processing message for {state_key}: {e}", exc_info=True)
-        error_message = f"Sorry, an error occurred: {e}"
-        if thread_ts:
-            say_func(text=error_message, thread_ts=thread_ts)
-        else:
-            say_func(text=error_message)
-        # Optionally clear state on error or handle differently
-        if state_key in conversation_states:
-            del conversation_states[state_key]
+        _turn_failed(state_key, current_state, say_func, thread_ts, streamer, e)
+
+def _turn_failed(state_key, current_state, say_func, thread_ts, streamer, error):
+    """Tells the user a turn failed or timed out and forgets the conversation."""
+    if isinstance(error, concurrent.futures.TimeoutError):
+        logger.error(f"Agent turn for {state_key} timed out after {AGENT_TURN_TIMEOUT_SECONDS} seconds")
+        error_message = f"Sorry, that request took too long (over {AGENT_TURN_TIMEOUT_SECONDS // 60} minutes) and was stopped. Please try again, perhaps with a narrower request."
+    else:
+        logger.error(f"Error processing message for {state_key}: {error}", exc_info=error)
+        error_message = f"Sorry, an error occurred: {error}"
+    if streamer is not None:
+        streamer.finish("Thinking... stopped.")
+    if thread_ts:
+        say_func(text=error_message, thread_ts=thread_ts)
+    else:
+        say_func(text=error_message)
+    # Optionally clear state on error or handle differently
+    conversation_states.delete(state_key)
+    forget_session(current_state["session_id"])
+
 
+# Bounded worker pool with one FIFO queue per state_key
+dispatcher = ConversationDispatcher(
+    _process_queued_message,
+    max_workers=AGENT_MAX_WORKERS,
+    max_pending=AGENT_MAX_PENDING,
+    name="slack-agent",
+)
 
 # --- Start the App ---
 if __name__ == "__main__":
@@ -178,6 +283,13 @@ if __name__ == "__main__":
         logger.error("Missing SLACK_BOT_TOKEN or SLACK_APP_TOKEN in environment variables.")
     else:
         logger.info("Starting Slack Bolt app in Socket Mode...")
+        # Keep the local metadata and full-text indexes fresh in the background
+        start_index_watcher()
+        start_content_indexer()
+        # Spill idle conversations on a timer, not only when another conversation arrives
+        conversation_states.start_idle_eviction()
+        # Trace file and Prometheus metrics, if AGENT_TRACE=1
+        start_metrics_exporter()
         # SocketModeHandler starts the app listening for events
         # It requires an App Token (SLACK_APP_TOKEN) starting with xapp-
         handler = SocketModeHandler(app, SLACK_APP_TOKEN)
@@ -0,0 +1,42 @@
+"""
+Shared fixtures: the agent runs against the in-process fakes from benchmarks/, so the
+tests need no credentials or network. Run from the repository root:
+
+    python -m pytest
+"""
+import os
+
+import pytest
+
+# utils.openai_api_call builds its clients at import time
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from benchmarks.fake_dropbox import FakeDropbox, build_tree
+from benchmarks.fake_openai import ScriptedOpenAI
+from benchmarks.run_benchmarks import bench_environment
+import utils.memory_store as memory_store
+import utils.session_log as session_log
+
+
+@pytest.fixture
+def fake_dropbox(tmp_path, monkeypatch):
+    """
+    A small fake Dropbox tree: three files and two subfolders of three files each at
+    the root, plus /Archive with an empty file, a large file and a small one. The agent
+    is pointed at it and at throwaway SQLite files.
+    """
+    dbx = FakeDropbox(build_tree(breadth=2, depth=1, files_per_folder=3, file_size=4096,
+                                 large_files={"/Archive/Empty.txt": 0, "/Archive/Export.csv": 10 * 1024 * 1024,
+                                              "/Archive/Notes.txt": 100}))
+    monkeypatch.setattr(memory_store, "LEGACY_MEMORY_PATH", str(tmp_path / "running_memory.txt"))
+    with bench_environment(dbx, ScriptedOpenAI()):
+        yield dbx
+
+
+@pytest.fixture
+def session_dir(tmp_path, monkeypatch):
+    """Points the session logs at a throwaway directory."""
+    # The writer thread creates the directory only when it starts, once per process
+    (tmp_path / "history").mkdir()
+    monkeypatch.setattr(session_log, "SESSION_LOG_DIR", str(tmp_path / "history"))
+    return tmp_path / "history"
@@ -0,0 +1,98 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletion
+
+import utils.cassette as cassette
+import utils.openai_api_call as openai_api_call
+from benchmarks.fake_dropbox import FakeDropbox, build_tree
+from benchmarks.replay_cassette import replay
+from benchmarks.run_benchmarks import bench_environment
+
+
+class _ByConversation:
+    """
+    Fake OpenAI client that answers each conversation by its first user message: two
+    folder listings, then an answer naming the conversation. Conversation "A" is slower,
+    so concurrent turns interleave in the cassette.
+    """
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, **kwargs):
+        who = next(message['content'] for message in messages if message['role'] == "user")
+        steps = sum(1 for message in messages if message['role'] == "assistant")
+        time.sleep(0.05 if who == "A" else 0.03)
+        if steps < 2:
+            folder = "/Folder 1-0" if who == "A" else "/Folder 1-1"
+            message = {'role': "assistant", 'content': None, 'tool_calls': [{
+                'id': f"{who}{steps}", 'type': "function",
+                'function': {'name': "list_folder_contents", 'arguments': json.dumps({'dropbox_path': folder})}}]}
+        else:
+            message = {'role': "assistant", 'content': f"answer for {who}"}
+        return ChatCompletion.model_validate({
+            'id': "fake", 'object': "chat.completion", 'created': 0, 'model': model,
+            'choices': [{'index': 0, 'finish_reason': "stop", 'message': message}],
+            'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+        })
+
+
+def _record_interleaved_turns(tmp_path, monkeypatch):
+    recorder = cassette.CassetteRecorder(str(tmp_path / "cassette.jsonl"))
+    monkeypatch.setattr(cassette, "CASSETTE_PATH", recorder.path)
+    monkeypatch.setattr(cassette, "_recorder", recorder)
+
+    def _turn(who):
+        history = [{'role': "user", 'content': who}]
+        with cassette.recording_turn(history):
+            openai_api_call.handle_conversation(history)
+
+    dbx = cassette.wrap_dropbox_client(FakeDropbox(build_tree(breadth=2, depth=1, files_per_folder=3)))
+    with bench_environment(dbx, cassette.wrap_openai_client(_ByConversation())):
+        threads = [threading.Thread(target=_turn, args=(who,)) for who in "AB"]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    recorder._file.close()
+    return cassette.load_cassette(recorder.path)
+
+
+def test_every_call_of_a_turn_is_tagged_with_it(tmp_path, monkeypatch):
+    entries = _record_interleaved_turns(tmp_path, monkeypatch)
+
+    turns = [entry['turn'] for entry in entries if entry['type'] == "turn"]
+    assert len(set(turns)) == 2
+    assert all(entry['turn'] in turns for entry in entries)
+    # The two conversations really were interleaved while recording
+    openai_turns = [entry['turn'] for entry in entries if entry['type'] == "openai"]
+    assert openai_turns != sorted(openai_turns, key=openai_turns.index)
+
+
+def test_interleaved_turns_replay_with_their_own_answers(tmp_path, monkeypatch):
+    entries = _record_interleaved_turns(tmp_path, monkeypatch)
+    answers = {}
+
+    def _answer(entry):
+        with cassette.turn_context(entry['turn']):
+            history, _ = openai_api_call.handle_conversation(entry['history'])
+        answers[entry['history'][0]['content']] = history[-1]['content']
+
+    with bench_environment(cassette.ReplayDropbox(entries, latency=0), cassette.ReplayOpenAI(entries, latency=0)):
+        for entry in entries:
+            if entry['type'] == "turn":
+                _answer(entry)
+
+    assert answers == {'A': "answer for A", 'B': "answer for B"}
+
+
+def test_replay_reports_no_misses(tmp_path, monkeypatch):
+    entries = _record_interleaved_turns(tmp_path, monkeypatch)
+    result = replay(entries, dropbox_latency=0, model_latency=0)
+
+    assert [turn['error'] for turn in result['turns']] == [None, None]
+    assert [turn['openai_calls'] for turn in result['turns']] == [3, 3]
+    assert result['misses'] == []
@@ -0,0 +1,53 @@
+from utils.content_index import _connect, index_file_contents, search_text
+from utils.metadata_index import sync_index
+
+# Generated text files repeat their own path on every line
+OLD_PATH = "/Folder 1-0/File 1-0.txt"
+NEW_PATH = "/Moved/Renamed notes.txt"
+
+
+def _index_everything():
+    sync_index()
+    index_file_contents(max_files=100)
+
+
+def _move_in_metadata_index(old_path, new_path):
+    """Records a move the way a metadata sync would: same Dropbox id and content_hash, new path."""
+    conn = _connect()
+    try:
+        conn.execute("UPDATE files SET path_display = ?, path_lower = ?, name = ?, name_lower = ? WHERE path_lower = ?",
+                     (new_path, new_path.lower(), new_path.rsplit("/", 1)[1], new_path.rsplit("/", 1)[1].lower(), old_path.lower()))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_moved_document_is_found_under_its_new_path(fake_dropbox):
+    _index_everything()
+    _move_in_metadata_index(OLD_PATH, NEW_PATH)
+
+    rows = search_text("row value", path_prefix="/Moved")
+    assert [row['path'] for row in rows] == [NEW_PATH]
+    assert NEW_PATH not in [row['path'] for row in search_text("row value", path_prefix="/Folder 1-0", limit=50)]
+
+
+def test_moved_document_is_not_downloaded_again(fake_dropbox):
+    _index_everything()
+    _move_in_metadata_index(OLD_PATH, NEW_PATH)
+    fake_dropbox.reset_stats()
+
+    assert index_file_contents(max_files=100) == 0
+    assert fake_dropbox.get_stats()['bytes_downloaded'] == 0
+    # The path words follow the file too
+    assert [row['path'] for row in search_text("renamed")] == [NEW_PATH]
+
+
+def test_wildcards_in_the_folder_filter_match_literally(fake_dropbox):
+    _index_everything()
+    assert search_text("row", path_prefix="/Folder_1-0") == []
+    assert search_text("row", path_prefix="/%") == []
+
+
+def test_missing_limit_uses_the_default(fake_dropbox):
+    _index_everything()
+    assert 0 < len(search_text("row", limit=None)) <= 10
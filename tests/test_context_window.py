@@ -0,0 +1,78 @@
+import copy
+
+import utils.context_window as context_window
+from utils.context_window import KEEP_RECENT_TOOL_RESULTS, count_history_tokens, count_text_tokens, fit_history_to_budget
+
+
+def _exchange(number, result_chars=4000):
+    """One user request answered after a single tool call with a large result."""
+    call_id = f"call_{number}"
+    return [
+        {'role': "user", 'content': f"request {number}"},
+        {'role': "assistant", 'content': None, 'tool_calls': [
+            {'id': call_id, 'type': "function", 'function': {'name': "list_folder_contents", 'arguments': "{}"}}]},
+        {'role': "tool", 'tool_call_id': call_id, 'name': "list_folder_contents", 'content': f"result {number} " + "x" * result_chars},
+        {'role': "assistant", 'content': f"answer {number}"},
+    ]
+
+
+def _history(exchanges):
+    history = [{'role': "system", 'content': "You are a file search assistant."}]
+    for number in range(exchanges):
+        history += _exchange(number)
+    return history
+
+
+def _assert_tool_results_follow_their_calls(messages):
+    for index, message in enumerate(messages):
+        if message['role'] == "tool":
+            call_ids = [call['id'] for call in messages[index - 1].get('tool_calls') or []]
+            assert message['tool_call_id'] in call_ids
+
+
+def test_history_under_the_budget_is_sent_unchanged():
+    history = _history(2)
+    messages, stats = fit_history_to_budget(history, budget=count_history_tokens(history))
+    assert messages == history
+    assert stats['sent_tokens'] == stats['original_tokens']
+    assert stats['elided_tool_results'] == stats['dropped_messages'] == 0
+
+
+def test_old_tool_results_are_shortened_first():
+    history = _history(KEEP_RECENT_TOOL_RESULTS + 2)
+    original = copy.deepcopy(history)
+    budget = count_history_tokens(history) - 100
+
+    messages, stats = fit_history_to_budget(history, budget=budget)
+
+    assert history == original
+    assert len(messages) == len(history)
+    assert stats['elided_tool_results'] == 1
+    assert stats['sent_tokens'] <= budget
+    assert messages[3]['content'].startswith("[Earlier list_folder_contents result shortened")
+    # The newest results are untouched
+    tool_results = [message for message in messages if message['role'] == "tool"]
+    assert all(message['content'].startswith("result ") for message in tool_results[-KEEP_RECENT_TOOL_RESULTS:])
+    _assert_tool_results_follow_their_calls(messages)
+
+
+def test_oldest_exchanges_are_dropped_when_shortening_is_not_enough():
+    history = _history(KEEP_RECENT_TOOL_RESULTS + 2)
+    latest = history[-4:]
+    budget = count_history_tokens([history[0]] + latest) + 50
+
+    messages, stats = fit_history_to_budget(history, budget=budget)
+
+    assert messages[0] == history[0]
+    assert messages[-4:] == latest
+    assert stats['dropped_messages'] > 0
+    assert stats['sent_tokens'] <= budget
+    assert messages[1]['role'] == "user"
+    _assert_tool_results_follow_their_calls(messages)
+
+
+def test_token_count_cache_does_not_keep_the_text():
+    text = "a tool result that should not outlive its conversation " * 50
+    count = count_text_tokens(text)
+    assert count_text_tokens(text) == count
+    assert all(isinstance(key, bytes) and len(key) == 16 for key in context_window._token_counts)
@@ -0,0 +1,123 @@
+import concurrent.futures
+import threading
+import time
+
+from utils.conversation_dispatcher import ConversationDispatcher
+
+
+def _wait_for(dispatcher, processed, timeout=5):
+    deadline = time.monotonic() + timeout
+    while dispatcher.get_metrics()['processed'] < processed:
+        assert time.monotonic() < deadline, "dispatcher did not finish in time"
+        time.sleep(0.01)
+
+
+def test_items_of_one_conversation_run_one_at_a_time_in_order():
+    lock = threading.Lock()
+    running = {}
+    handled = []
+
+    def _handler(key, item):
+        with lock:
+            running[key] = running.get(key, 0) + 1
+            assert running[key] == 1
+        time.sleep(0.01)
+        with lock:
+            handled.append((key, item))
+            running[key] -= 1
+
+    dispatcher = ConversationDispatcher(_handler, max_workers=4)
+    for item in range(5):
+        for key in ("a", "b"):
+            dispatcher.submit(key, item)
+    _wait_for(dispatcher, 10)
+
+    assert dispatcher.get_metrics()['failed'] == 0
+    assert [item for key, item in handled if key == "a"] == list(range(5))
+    assert [item for key, item in handled if key == "b"] == list(range(5))
+
+
+def test_conversations_run_in_parallel_up_to_max_workers():
+    # Only passes if all three handlers are running at the same time
+    barrier = threading.Barrier(3, timeout=2)
+    dispatcher = ConversationDispatcher(lambda key, item: barrier.wait(), max_workers=3)
+    for key in ("a", "b", "c"):
+        dispatcher.submit(key, None)
+    _wait_for(dispatcher, 3)
+
+    assert dispatcher.get_metrics()['failed'] == 0
+
+
+def test_full_queue_rejects_and_reports_position():
+    release = threading.Event()
+    started = threading.Event()
+
+    def _handler(key, item):
+        started.set()
+        release.wait(5)
+
+    dispatcher = ConversationDispatcher(_handler, max_workers=1, max_pending=3)
+    assert dispatcher.submit("a", 1) == (True, 0, False)
+    assert started.wait(5)
+
+    # a is running; its next message waits behind it, and b waits for the only worker
+    assert dispatcher.submit("a", 2) == (True, 1, False)
+    assert dispatcher.submit("b", 1) == (True, 0, True)
+    assert dispatcher.submit("b", 2) == (True, 1, True)
+    assert dispatcher.submit("c", 1) == (False, 0, True)
+
+    metrics = dispatcher.get_metrics()
+    assert (metrics['queue_depth'], metrics['running'], metrics['rejected']) == (3, 1, 1)
+
+    release.set()
+    _wait_for(dispatcher, 4)
+    assert dispatcher.get_metrics()['queue_depth'] == 0
+
+
+def test_failing_item_does_not_stop_its_conversation():
+    handled = []
+
+    def _handler(key, item):
+        if item == 1:
+            raise RuntimeError("boom")
+        handled.append(item)
+
+    dispatcher = ConversationDispatcher(_handler, max_workers=1)
+    for item in range(3):
+        dispatcher.submit("a", item)
+    _wait_for(dispatcher, 3)
+
+    assert handled == [0, 2]
+    assert dispatcher.get_metrics()['failed'] == 1
+
+
+def test_handler_returning_a_future_frees_its_worker_but_keeps_the_order():
+    futures = {}
+    started = []
+
+    def _handler(key, item):
+        started.append((key, item))
+        futures[(key, item)] = concurrent.futures.Future()
+        return futures[(key, item)]
+
+    dispatcher = ConversationDispatcher(_handler, max_workers=1)
+    dispatcher.submit("a", 1)
+    dispatcher.submit("a", 2)
+    time.sleep(0.1)
+    # a's turn holds no worker, so b is not told to wait
+    assert dispatcher.submit("b", 1) == (True, 0, False)
+    time.sleep(0.1)
+
+    # The only worker moved on to b while a's first item is still running
+    assert started == [("a", 1), ("b", 1)]
+    assert dispatcher.get_metrics()['awaiting'] == 2
+
+    futures[("a", 1)].set_result(None)
+    _wait_for(dispatcher, 1)
+    time.sleep(0.1)
+    assert started == [("a", 1), ("b", 1), ("a", 2)]
+
+    futures[("b", 1)].set_exception(RuntimeError("boom"))
+    futures[("a", 2)].set_result(None)
+    _wait_for(dispatcher, 3)
+    assert dispatcher.get_metrics()['failed'] == 1
@@ -0,0 +1,66 @@
+import os
+
+from utils.conversation_store import ConversationStateStore
+
+
+def _state(session_id, text="hello"):
+    return {'history': [{'role': "user", 'content': text}], 'session_id': session_id}
+
+
+def test_least_recently_used_state_spills_and_comes_back(tmp_path):
+    spilled = []
+    store = ConversationStateStore(str(tmp_path), max_sessions=2, on_spill=lambda key, state: spilled.append(key))
+    store.put("a", _state("session-a"))
+    store.put("b", _state("session-b"))
+    store.get("a")  # b is now the least recently used
+    store.put("c", _state("session-c"))
+
+    assert spilled == ["b"]
+    assert os.path.exists(tmp_path / "b.json")
+    assert store.get_stats()['sessions_in_memory'] == 2
+
+    assert store.get("b") == _state("session-b")
+    assert store.get_stats()['rehydrated'] == 1
+    # Loading b back made room by spilling the least recently used of a and c
+    assert not os.path.exists(tmp_path / "b.json")
+    assert spilled == ["b", "a"]
+
+
+def test_memory_cap_spills_least_recently_used_states(tmp_path):
+    store = ConversationStateStore(str(tmp_path), max_bytes=5000)
+    store.put("big", _state("session-big", "x" * 4000))
+    store.put("small", _state("session-small"))
+    store.put("other", _state("session-other", "y" * 2000))
+
+    assert "big" in store
+    assert store.get_stats()['bytes_in_memory'] <= 5000
+    assert os.path.exists(tmp_path / "big.json")
+
+
+def test_idle_states_spill_on_a_sweep(tmp_path):
+    store = ConversationStateStore(str(tmp_path), idle_ttl_seconds=0)
+    store.put("idle", _state("session-idle"))
+    store.evict_idle()
+
+    assert store.get_stats()['sessions_in_memory'] == 0
+    assert store.get("idle") == _state("session-idle")
+
+
+def test_put_supersedes_a_spilled_state(tmp_path):
+    store = ConversationStateStore(str(tmp_path), idle_ttl_seconds=0)
+    store.put("key", _state("session", "old"))
+    store.evict_idle()
+    store.put("key", _state("session", "new"))
+
+    assert not os.path.exists(tmp_path / "key.json")
+    assert store.get("key") == _state("session", "new")
+
+
+def test_deleted_state_is_gone_from_disk_too(tmp_path):
+    store = ConversationStateStore(str(tmp_path), idle_ttl_seconds=0)
+    store.put("key", _state("session"))
+    store.evict_idle()
+    store.delete("key")
+
+    assert "key" not in store
+    assert store.get("key") is None
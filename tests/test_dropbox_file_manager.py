@@ -0,0 +1,33 @@
+import os
+
+from utils.dropbox_file_manager import download_file_with_size_limit
+
+
+def test_range_download_moves_only_the_byte_budget(fake_dropbox, tmp_path):
+    local_path, is_truncated, total_size, _ = download_file_with_size_limit(
+        "/Archive/Export.csv", local_path=str(tmp_path / "export.csv"), max_size_bytes=64 * 1024)
+
+    assert is_truncated
+    assert total_size == 10 * 1024 * 1024
+    assert os.path.getsize(local_path) == 64 * 1024
+    assert fake_dropbox.get_stats()['bytes_downloaded'] == 64 * 1024
+
+
+def test_small_file_is_downloaded_whole(fake_dropbox, tmp_path):
+    local_path, is_truncated, total_size, _ = download_file_with_size_limit(
+        "/Folder 1-0/File 1-0.txt", local_path=str(tmp_path / "file.txt"), max_size_bytes=64 * 1024)
+
+    assert not is_truncated
+    assert total_size == 4096
+    assert os.path.getsize(local_path) == 4096
+
+
+def test_empty_file_falls_back_to_a_plain_download_on_416(fake_dropbox, tmp_path):
+    local_path, is_truncated, total_size, _ = download_file_with_size_limit(
+        "/Archive/Empty.txt", local_path=str(tmp_path / "empty.txt"))
+
+    assert not is_truncated
+    assert total_size == 0
+    assert os.path.getsize(local_path) == 0
+    # The ranged request was refused, the unranged retry succeeded
+    assert fake_dropbox.get_stats()['calls']['files_download'] == 2
@@ -0,0 +1,36 @@
+from benchmarks.fake_dropbox import FakeDropbox, build_tree
+from benchmarks.fake_openai import ScriptedOpenAI
+from benchmarks.run_benchmarks import bench_environment
+from utils.dropbox_folder_manager import list_tree
+
+# The fake root holds 3 files, 2 folders and /Archive; each of those folders holds 3 files
+ROOT_ENTRIES = 6
+TREE_ENTRIES = ROOT_ENTRIES + 3 * 3
+
+
+def test_tree_that_fits_the_budget_exactly_is_not_truncated(fake_dropbox):
+    tree = list_tree("", max_depth=2, max_entries=TREE_ENTRIES)
+    assert sum(len(entries) for entries in tree.children.values()) == TREE_ENTRIES
+    assert not tree.truncated
+
+
+def test_tree_over_the_budget_is_truncated(fake_dropbox):
+    assert list_tree("", max_depth=2, max_entries=TREE_ENTRIES - 1).truncated
+
+
+def test_tree_at_the_depth_limit_is_not_truncated(fake_dropbox):
+    tree = list_tree("", max_depth=1, max_entries=ROOT_ENTRIES)
+    assert not tree.truncated
+    assert tree.unexpanded
+
+
+def test_level_wider_than_the_budget_stays_within_it():
+    tree_dropbox = FakeDropbox(build_tree(breadth=40, depth=1, files_per_folder=1))
+    with bench_environment(tree_dropbox, ScriptedOpenAI()):
+        tree = list_tree("", max_depth=2, max_entries=50)
+
+    assert sum(len(entries) for entries in tree.children.values()) <= 50
+    # The root plus one listing per folder the budget had room for
+    assert tree_dropbox.get_stats()['calls']['files_list_folder'] <= 1 + 50 - 41
+    assert tree.truncated
+    assert len(tree.unexpanded) == 40 - (50 - 41)
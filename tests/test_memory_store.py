@@ -0,0 +1,22 @@
+from utils.memory_store import get_memory_stats, retrieve_memories, store_memory
+
+
+def test_identical_memory_is_a_duplicate(fake_dropbox):
+    assert store_memory("Invoices are kept in '/Finance/Invoices'.") == "stored"
+    assert store_memory("  invoices are KEPT in   '/Finance/Invoices'") == "duplicate"
+    assert get_memory_stats()['memories'] == 1
+
+
+def test_similar_memory_about_the_same_folder_is_updated(fake_dropbox):
+    assert store_memory("The quarterly reports for 2023 are in the '/Finance/Reports' folder") == "stored"
+    assert store_memory("The quarterly reports for 2023 are all in the '/Finance/Reports' folder") == "updated"
+
+    memories = retrieve_memories("quarterly reports")
+    assert [memory['content'] for memory in memories] == [
+        "The quarterly reports for 2023 are all in the '/Finance/Reports' folder"]
+
+
+def test_memories_about_other_folders_are_kept(fake_dropbox):
+    store_memory("The quarterly reports for 2023 are in the '/Finance/Reports' folder")
+    assert store_memory("The quarterly reports for 2023 are in the '/Finance/Archive' folder") == "stored"
+    assert get_memory_stats() == {'memories': 2, 'folders': 2}
@@ -0,0 +1,132 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import pytest
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletionChunk
+
+import utils.openai_api_call as openai_api_call
+from utils.openai_api_call import _StreamedResponse
+
+
+def _chunk(delta=None, usage=None):
+    return ChatCompletionChunk.model_validate({
+        'id': "chunk", 'object': "chat.completion.chunk", 'created': 0, 'model': "test",
+        'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}] if delta is not None else [],
+        'usage': usage,
+    })
+
+
+def test_text_is_reassembled_and_forwarded():
+    events = []
+    response = _StreamedResponse(lambda event, data: events.append((event, data)))
+    for text in ("Found ", "3 files", "."):
+        response.add(_chunk({'content': text}))
+
+    message = response.message()
+    assert message.content == "Found 3 files."
+    assert message.tool_calls is None
+    assert events == [("text", "Found "), ("text", "3 files"), ("text", ".")]
+
+
+def test_tool_calls_split_across_chunks_are_reassembled():
+    response = _StreamedResponse(lambda event, data: None)
+    response.add(_chunk({'tool_calls': [{'index': 0, 'id': "call_a", 'function': {'name': "search_dropbox", 'arguments': '{"que'}}]}))
+    response.add(_chunk({'tool_calls': [{'index': 1, 'id': "call_b", 'function': {'name': "list_folder_contents", 'arguments': ""}}]}))
+    response.add(_chunk({'tool_calls': [{'index': 0, 'function': {'arguments': 'ry": "budget"}'}}]}))
+    response.add(_chunk({'tool_calls': [{'index': 1, 'function': {'arguments': '{"dropbox_path": "/"}'}}]}))
+    response.add(_chunk(usage={'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15}))
+
+    message = response.message()
+    assert message.content is None
+    assert [(call.id, call.function.name, call.function.arguments) for call in message.tool_calls] == [
+        ("call_a", "search_dropbox", '{"query": "budget"}'),
+        ("call_b", "list_folder_contents", '{"dropbox_path": "/"}'),
+    ]
+    assert response.usage == CompletionUsage(prompt_tokens=10, completion_tokens=5, total_tokens=15)
+
+
+def test_sync_turn_stops_at_its_deadline_on_the_calling_thread(fake_dropbox, monkeypatch):
+    release = threading.Event()
+    turn_threads = set()
+    monkeypatch.setattr(openai_api_call, "USE_ASYNC_ENGINE", False)
+    # The tool outlives the turn's deadline
+    monkeypatch.setattr(openai_api_call, "execute_tool_call", lambda tool_name, arguments: (release.wait(5), False))
+    openai_api_call.client.load([[("list_folder_contents", {'dropbox_path': "/"})], "Too late."])
+
+    started = time.monotonic()
+    try:
+        with pytest.raises(concurrent.futures.TimeoutError):
+            openai_api_call.run_conversation_turn(
+                [{'role': "user", 'content': "list the root"}], timeout=0.2,
+                on_event=lambda event, data: turn_threads.add(threading.current_thread()))
+    finally:
+        release.set()
+
+    assert time.monotonic() - started < 2
+    assert turn_threads == {threading.current_thread()}
+    # The turn stopped before asking the model again
+    assert openai_api_call.client.get_stats()['chat_calls'] == 1
+
+
+def test_async_turn_runs_tools_and_answers(fake_dropbox, monkeypatch):
+    monkeypatch.setattr(openai_api_call, "USE_ASYNC_ENGINE", True)
+    openai_api_call.client.load([[("list_folder_contents", {'dropbox_path': "/"})], "The root has three files."])
+    events = []
+
+    history, should_end = openai_api_call.run_conversation_turn(
+        [{'role': "user", 'content': "list the root"}], on_event=lambda event, data: events.append(event))
+
+    assert [message['role'] for message in history] == ["user", "assistant", "tool", "assistant"]
+    assert "File 0-0.txt" in history[2]['content']
+    assert history[-1]['content'] == "The root has three files."
+    assert not should_end
+    assert events.count("step") == 2 and "tool_start" in events and "tool_end" in events
+
+
+def test_many_async_turns_share_the_agent_loop(fake_dropbox):
+    openai_api_call.client.latency = 0.2
+    threads_before = threading.active_count()
+    started = time.monotonic()
+
+    futures = [openai_api_call.submit_to_agent_loop(openai_api_call.run_conversation_turn_async(
+        [{'role': "user", 'content': f"request {number}"}])) for number in range(50)]
+    answers = [future.result(timeout=10)[0][-1]['content'] for future in futures]
+
+    assert answers == ["Done."] * 50
+    # 50 model calls of 0.2 seconds overlapped on the loop, without a thread per turn
+    assert time.monotonic() - started < 2
+    assert threading.active_count() - threads_before <= 2
+
+
+def test_async_turns_wait_for_a_free_slot(fake_dropbox, monkeypatch):
+    monkeypatch.setattr(openai_api_call, "_turn_slots", asyncio.Semaphore(2))
+    openai_api_call.client.latency = 0.1
+    started = time.monotonic()
+
+    futures = [openai_api_call.submit_to_agent_loop(openai_api_call.run_conversation_turn_async(
+        [{'role': "user", 'content': f"request {number}"}])) for number in range(6)]
+    for future in futures:
+        future.result(timeout=10)
+
+    # Three rounds of two turns
+    assert time.monotonic() - started >= 0.3
+
+
+def test_timed_out_async_turn_is_cancelled_with_its_tool_calls(fake_dropbox, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(openai_api_call, "execute_tool_call", lambda tool_name, arguments: (release.wait(5), False))
+    openai_api_call.client.load([[("list_folder_contents", {'dropbox_path': "/"})], "Too late."])
+
+    try:
+        future = openai_api_call.submit_to_agent_loop(openai_api_call.run_conversation_turn_async(
+            [{'role': "user", 'content': "list the root"}], timeout=0.2))
+        with pytest.raises(concurrent.futures.TimeoutError):
+            future.result(timeout=5)
+        # The running tool call is tracked until it finishes
+        assert "list_folder_contents" in [tool_name for tool_name, _ in openai_api_call.get_abandoned_tool_calls()]
+    finally:
+        release.set()
+    assert openai_api_call.client.get_stats()['chat_calls'] == 1
@@ -0,0 +1,33 @@
+from utils.session_log import append_session_messages, flush_session_logs, forget_session, load_session
+
+
+def _messages(count, start=0):
+    return [{'role': "user", 'content': f"message {index}"} for index in range(start, start + count)]
+
+
+def test_appended_messages_load_back_in_order(session_dir):
+    history = _messages(3)
+    append_session_messages(history, "round-trip")
+    history += _messages(2, start=3)
+    assert append_session_messages(history, "round-trip") == 2
+    flush_session_logs()
+
+    assert load_session("round-trip") == history
+
+
+def test_forgotten_session_is_not_logged_twice(session_dir):
+    history = _messages(3)
+    append_session_messages(history, "forgotten")
+    flush_session_logs()
+    forget_session("forgotten")
+
+    # After eviction the whole history is queued again; what is on disk is skipped
+    history += _messages(1, start=3)
+    append_session_messages(history, "forgotten")
+    flush_session_logs()
+
+    assert load_session("forgotten") == history
+
+
+def test_unknown_session_loads_empty(session_dir):
+    assert load_session("missing") == []
@@ -0,0 +1,52 @@
+import utils.openai_api_call as openai_api_call
+from utils.summary_cache import _connect
+from utils.tools import check_file_contents
+
+SMALL_FILE = "/Folder 1-0/File 1-0.txt"
+
+
+def _summaries_made():
+    return openai_api_call.client.get_stats().get('responses_calls', 0)
+
+
+def _downloads(fake_dropbox):
+    return fake_dropbox.get_stats()['calls'].get('files_download', 0)
+
+
+def test_unchanged_file_is_summarized_once(fake_dropbox):
+    first = check_file_contents(SMALL_FILE)
+    assert check_file_contents(SMALL_FILE) == first
+    assert _summaries_made() == 1
+    assert _downloads(fake_dropbox) == 1
+
+
+def test_key_is_the_bytes_analyzed_not_the_bytes_requested(fake_dropbox):
+    # The whole 4 KB file is analyzed either way
+    check_file_contents(SMALL_FILE, max_size_bytes=8 * 1024)
+    check_file_contents(SMALL_FILE, max_size_bytes=16 * 1024)
+    assert _summaries_made() == 1
+
+
+def test_changed_file_is_summarized_again(fake_dropbox):
+    check_file_contents(SMALL_FILE)
+    # A new size gives the fake file a new content_hash
+    fake_dropbox.tree[SMALL_FILE.lower()]['size'] = 2048
+    check_file_contents(SMALL_FILE)
+    assert _summaries_made() == 2
+    assert _downloads(fake_dropbox) == 2
+
+
+def test_sample_is_cached_under_the_bytes_it_read(fake_dropbox):
+    # 10 MB, over the 5 MB download cap, so a sample is summarized
+    check_file_contents("/Archive/Export.csv")
+    bytes_read = fake_dropbox.get_stats()['bytes_downloaded']
+    check_file_contents("/Archive/Export.csv")
+
+    assert _summaries_made() == 1
+    assert fake_dropbox.get_stats()['bytes_downloaded'] == bytes_read
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT prompt_variant, analyzed_bytes FROM summary_cache").fetchall()
+    finally:
+        conn.close()
+    assert [(row['prompt_variant'].startswith("sample"), row['analyzed_bytes']) for row in rows] == [(True, bytes_read)]
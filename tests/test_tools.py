@@ -0,0 +1,9 @@
+from utils.tools import list_folder_contents
+
+# The fake root holds 3 files, 2 folders and /Archive
+ROOT_ENTRIES = 6
+
+
+def test_listing_stops_early_only_when_entries_are_left(fake_dropbox):
+    assert "stopped early" not in list_folder_contents("/", max_entries=ROOT_ENTRIES)
+    assert "stopped early" in list_folder_contents("/", max_entries=ROOT_ENTRIES - 1)
@@ -0,0 +1,500 @@
+import os
+import json
+import time
+import uuid
+import base64
+import threading
+import logging
+import contextvars
+from contextlib import contextmanager
+from collections import defaultdict, deque
+from types import SimpleNamespace
+import dropbox
+from dropbox import stone_serializers
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+CASSETTE_PATH = os.getenv("AGENT_CASSETTE")  # Record every Dropbox and OpenAI call of this process to this JSONL file
+_RECORDED_PREFIXES = ("files_", "users_", "team_", "sharing_")  # Dropbox client methods that are API calls
+_DOWNLOAD_METHODS = {"files_download"}  # Return (metadata, response) instead of a result
+
+_recorder_lock = threading.Lock()
+_recorder = None
+# Conversation turn the current call belongs to; None for background work (index sync etc.)
+_current_turn = contextvars.ContextVar("cassette_turn", default=None)
+
+
+def _json_default(obj):
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    return repr(obj)
+
+
+class CassetteRecorder:
+    """Appends cassette entries (one JSON object per line) to a file, from any thread."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)  # Line buffered
+
+    def write(self, entry):
+        entry.setdefault('turn', _current_turn.get())
+        entry['recorded_at'] = time.time()
+        line = json.dumps(entry, default=_json_default)
+        with self._lock:
+            self._file.write(line + "\n")
+
+
+def get_recorder():
+    """Returns the process-wide recorder if AGENT_CASSETTE is set, otherwise None."""
+    global _recorder
+    if not CASSETTE_PATH:
+        return None
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = CassetteRecorder(CASSETTE_PATH)
+            logger.info(f"Recording Dropbox and OpenAI calls to {CASSETTE_PATH}")
+        return _recorder
+
+
+@contextmanager
+def turn_context(turn_id):
+    """
+    Marks the calls made inside (including on pool threads started through
+    tracing.bind) as belonging to turn_id, for recording and for replay.
+    """
+    token = _current_turn.set(turn_id)
+    try:
+        yield
+    finally:
+        _current_turn.reset(token)
+
+
+def current_turn():
+    """Returns the id of the turn the current call belongs to, or None."""
+    return _current_turn.get()
+
+
+@contextmanager
+def recording_turn(history):
+    """
+    Records the history a conversation turn starts from, under a new turn id, and tags
+    every call recorded inside with that id, so replay can run the turn on its own
+    even when conversations were interleaved (as in the Slack bot).
+    """
+    recorder = get_recorder()
+    if recorder is None:
+        yield
+        return
+    with turn_context(uuid.uuid4().hex[:12]):
+        recorder.write({'type': "turn", 'history': history})
+        yield
+
+
+# --- Dropbox ---
+
+def _dropbox_route(method):
+    """Maps a client method name (e.g. files_list_folder) to its route, for its result and error types."""
+    namespace, _, name = method.partition("_")
+    module = getattr(dropbox, namespace, None)
+    return getattr(module, name, None) if module is not None else None
+
+
+def dropbox_call_key(method, args, kwargs, headers=None):
+    """
+    Identifies a Dropbox call by method, arguments and Range header, so replay can find
+    the recorded response for the same request.
+    """
+    range_header = (headers or {}).get('Range')
+    return json.dumps([method, list(args), sorted(kwargs.items()), range_header], default=repr)
+
+
+class _RecordingDownload:
+    """Wraps a download response, keeping the bytes the caller reads; records them on close."""
+
+    def __init__(self, response, on_close):
+        self._response = response
+        self._on_close = on_close
+        self._chunks = []
+        self.status_code = getattr(response, 'status_code', 200)
+
+    def iter_content(self, chunk_size=1):
+        for chunk in self._response.iter_content(chunk_size=chunk_size):
+            self._chunks.append(chunk)
+            yield chunk
+
+    def close(self):
+        self._response.close()
+        if self._on_close is not None:
+            self._on_close(b"".join(self._chunks), self.status_code)
+            self._on_close = None
+
+
+class RecordingDropbox:
+    """
+    Proxy for a scoped Dropbox client that records every API call (arguments, result or
+    API error, and latency) to a cassette. Clients made with clone() are proxied too.
+    """
+
+    def __init__(self, client, recorder):
+        self._client = client
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name == "clone":
+            return lambda *args, **kwargs: RecordingDropbox(attr(*args, **kwargs), self._recorder)
+        if callable(attr) and name.startswith(_RECORDED_PREFIXES):
+            return lambda *args, **kwargs: self._call(name, attr, args, kwargs)
+        return attr
+
+    def _call(self, method, function, args, kwargs):
+        route = _dropbox_route(method)
+        entry = {
+            'type': "dropbox",
+            'method': method,
+            'key': dropbox_call_key(method, args, kwargs, getattr(self._client, '_headers', None)),
+        }
+        started = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except dropbox.exceptions.ApiError as e:
+            entry['elapsed'] = time.perf_counter() - started
+            entry['user_message'] = e.user_message_text
+            entry['error_summary'] = str(e.error)
+            try:
+                entry['error'] = stone_serializers.json_compat_obj_encode(route.error_type, e.error) if route is not None else None
+            except Exception:
+                entry['error'] = None  # Replayed with only the summary
+            self._recorder.write(entry)
+            raise
+        except dropbox.exceptions.HttpError as e:
+            # e.g. 416 for a range request on an empty file
+            entry['elapsed'] = time.perf_counter() - started
+            entry['http_error'] = e.status_code
+            self._recorder.write(entry)
+            raise
+        entry['elapsed'] = time.perf_counter() - started
+
+        if method in _DOWNLOAD_METHODS:
+            metadata, response = result
+            entry['result'] = stone_serializers.json_compat_obj_encode(route.result_type, metadata)
+
+            def _on_close(body, status_code):
+                entry['body'] = base64.b64encode(body).decode("ascii")
+                entry['status_code'] = status_code
+                self._recorder.write(entry)
+
+            return metadata, _RecordingDownload(response, _on_close)
+
+        if route is not None:
+            entry['result'] = stone_serializers.json_compat_obj_encode(route.result_type, result)
+        else:
+            # Still counted as a round trip; replaying it raises (see ReplayDropbox)
+            entry['result'] = None
+            entry['result_repr'] = repr(result)[:200]
+        self._recorder.write(entry)
+        return result
+
+
+def wrap_dropbox_client(client):
+    """Returns client wrapped in a RecordingDropbox when recording, otherwise client itself."""
+    recorder = get_recorder()
+    return RecordingDropbox(client, recorder) if recorder is not None else client
+
+
+# --- OpenAI ---
+
+def _assemble_chunks(chunks):
+    """Rebuilds the message and usage of a streamed chat completion from its chunks."""
+    content = []
+    tool_calls = {}
+    usage = None
+    for chunk in chunks:
+        if chunk.usage is not None:
+            usage = chunk.usage.model_dump()
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            content.append(delta.content)
+        for tool_call in delta.tool_calls or []:
+            entry = tool_calls.setdefault(tool_call.index, {'id': None, 'type': "function", 'function': {'name': "", 'arguments': ""}})
+            if tool_call.id:
+                entry['id'] = tool_call.id
+            if tool_call.function:
+                entry['function']['name'] += tool_call.function.name or ""
+                entry['function']['arguments'] += tool_call.function.arguments or ""
+    message = {'role': "assistant", 'content': "".join(content) or None}
+    if tool_calls:
+        message['tool_calls'] = [entry for _, entry in sorted(tool_calls.items())]
+    return message, usage
+
+
+class RecordingOpenAI:
+    """
+    Proxy for an OpenAI or AsyncOpenAI client that records chat.completions.create
+    (the assistant message and usage, streamed or not) and responses.create (the
+    output text and usage) to a cassette. Other attributes pass through.
+    """
+
+    def __init__(self, client, recorder, is_async=False):
+        self._client = client
+        self._recorder = recorder
+        create = self._chat_create_async if is_async else self._chat_create
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+        self.responses = SimpleNamespace(create=self._responses_create)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _record_chat(self, message, usage, started):
+        self._recorder.write({
+            'type': "openai",
+            'method': "chat.completions.create",
+            'message': message,
+            'usage': usage,
+            'elapsed': time.perf_counter() - started,
+        })
+
+    def _chat_create(self, **kwargs):
+        started = time.perf_counter()
+        result = self._client.chat.completions.create(**kwargs)
+        if kwargs.get('stream'):
+            return self._tee_stream(result, started)
+        self._record_chat(result.choices[0].message.model_dump(exclude_none=True), result.usage.model_dump() if result.usage else None, started)
+        return result
+
+    def _tee_stream(self, stream, started):
+        chunks = []
+        for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        self._record_chat(*_assemble_chunks(chunks), started)
+
+    async def _chat_create_async(self, **kwargs):
+        started = time.perf_counter()
+        result = await self._client.chat.completions.create(**kwargs)
+        if kwargs.get('stream'):
+            return self._tee_stream_async(result, started)
+        self._record_chat(result.choices[0].message.model_dump(exclude_none=True), result.usage.model_dump() if result.usage else None, started)
+        return result
+
+    async def _tee_stream_async(self, stream, started):
+        chunks = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        self._record_chat(*_assemble_chunks(chunks), started)
+
+    def _responses_create(self, **kwargs):
+        # Only the sync client summarizes files
+        started = time.perf_counter()
+        result = self._client.responses.create(**kwargs)
+        usage = getattr(result, "usage", None)
+        self._recorder.write({
+            'type': "openai",
+            'method': "responses.create",
+            'output_text': result.output_text,
+            'usage': {'input_tokens': getattr(usage, "input_tokens", 0), 'output_tokens': getattr(usage, "output_tokens", 0)},
+            'elapsed': time.perf_counter() - started,
+        })
+        return result
+
+
+def wrap_openai_client(client, is_async=False):
+    """Returns client wrapped in a RecordingOpenAI when recording, otherwise client itself."""
+    recorder = get_recorder()
+    return RecordingOpenAI(client, recorder, is_async=is_async) if recorder is not None else client
+
+
+# --- Replay ---
+
+def load_cassette(path):
+    """
+    Reads a cassette.
+
+    Args:
+        path (str): The cassette file.
+
+    Returns:
+        list: Entries in recording order; each has a type of "turn", "dropbox" or "openai".
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _sleep_for(entry, latency):
+    delay = entry.get('elapsed', 0) if latency is None else latency
+    if delay:
+        time.sleep(delay)
+
+
+class _ReplayDownload:
+    """Serves a recorded download body like a streaming response."""
+
+    def __init__(self, body, status_code):
+        self._body = body
+        self.status_code = status_code
+
+    def iter_content(self, chunk_size=1):
+        for offset in range(0, len(self._body), chunk_size):
+            yield self._body[offset:offset + chunk_size]
+
+    def close(self):
+        pass
+
+
+class ReplayDropbox:
+    """
+    Dropbox client stand-in that answers each call with the response recorded for the
+    same request (see dropbox_call_key) in the same turn (see turn_context), falling
+    back to responses recorded outside any turn, such as index syncs. Repeated identical
+    requests get the recorded responses in order, the last one being reused. A request
+    that was never recorded raises RuntimeError and is counted as a miss.
+    """
+
+    def __init__(self, entries, latency=None, headers=None, _state=None):
+        """
+        Args:
+            entries (list): Cassette entries from load_cassette.
+            latency (float, optional): Seconds to sleep per call; None sleeps for the
+                                       latency measured when the call was recorded.
+            headers (dict, optional): Request headers (set by clone()).
+        """
+        self.latency = latency
+        self._headers = headers
+        if _state is None:
+            recorded = defaultdict(deque)  # (turn, key) -> entries
+            for entry in entries:
+                if entry.get('type') == "dropbox":
+                    recorded[(entry.get('turn'), entry['key'])].append(entry)
+            _state = {'lock': threading.Lock(), 'recorded': recorded, 'calls': defaultdict(int), 'misses': []}
+        self._state = _state
+
+    def __getattr__(self, name):
+        if name.startswith(_RECORDED_PREFIXES):
+            return lambda *args, **kwargs: self._replay(name, args, kwargs)
+        raise AttributeError(name)
+
+    def clone(self, headers=None, **kwargs):
+        return ReplayDropbox(None, self.latency, headers, self._state)
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: round_trips, calls (per method) and misses (requests not in the cassette).
+        """
+        with self._state['lock']:
+            calls = dict(self._state['calls'])
+            return {'round_trips': sum(calls.values()), 'calls': calls, 'misses': list(self._state['misses'])}
+
+    def _replay(self, method, args, kwargs):
+        key = dropbox_call_key(method, args, kwargs, self._headers)
+        turn = current_turn()
+        with self._state['lock']:
+            self._state['calls'][method] += 1
+            queue = self._state['recorded'].get((turn, key)) or self._state['recorded'].get((None, key))
+            if not queue:
+                self._state['misses'].append(key)
+                entry = None
+            else:
+                entry = queue.popleft() if len(queue) > 1 else queue[0]
+        if entry is None:
+            raise RuntimeError(f"No recorded response for {method} {list(args)} {kwargs}")
+
+        _sleep_for(entry, self.latency)
+        route = _dropbox_route(method)
+        if 'http_error' in entry:
+            raise dropbox.exceptions.HttpError("replay", entry['http_error'], None)
+        if 'error' in entry:
+            if entry['error'] is None or route is None:
+                error = entry.get('error_summary')
+            else:
+                error = stone_serializers.json_compat_obj_decode(route.error_type, entry['error'])
+            raise dropbox.exceptions.ApiError("replay", error, entry.get('user_message'), None)
+        if entry.get('result') is None or route is None:
+            raise RuntimeError(f"Recorded {method} response cannot be replayed: {entry.get('result_repr')}")
+        result = stone_serializers.json_compat_obj_decode(route.result_type, entry['result'])
+        if method in _DOWNLOAD_METHODS:
+            return result, _ReplayDownload(base64.b64decode(entry.get('body', "")), entry.get('status_code', 200))
+        return result
+
+
+class ReplayOpenAI:
+    """
+    OpenAI client stand-in that returns the recorded chat completions and file
+    summaries of the current turn (see turn_context) in recording order, whatever the
+    request, so a recorded conversation takes the same model steps when it is replayed.
+    """
+
+    def __init__(self, entries, latency=None):
+        """
+        Args:
+            entries (list): Cassette entries from load_cassette.
+            latency (float, optional): Seconds to sleep per call; None sleeps for the
+                                       latency measured when the call was recorded.
+        """
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._recorded = defaultdict(deque)  # (turn, method) -> entries
+        for entry in entries:
+            if entry.get('type') == "openai":
+                self._recorded[(entry.get('turn'), entry['method'])].append(entry)
+        self._calls = defaultdict(int)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat_create))
+        self.responses = SimpleNamespace(create=self._responses_create)
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Calls per method.
+        """
+        with self._lock:
+            return dict(self._calls)
+
+    def _next(self, method):
+        turn = current_turn()
+        with self._lock:
+            self._calls[method] += 1
+            queue = self._recorded.get((turn, method)) or self._recorded.get((None, method))
+            if not queue:
+                raise RuntimeError(f"The cassette has no more recorded {method} responses for turn {turn}")
+            entry = queue.popleft()
+        _sleep_for(entry, self.latency)
+        return entry
+
+    def _chat_create(self, model, stream=False, **kwargs):
+        entry = self._next("chat.completions.create")
+        base = {'id': "replay", 'created': 0, 'model': model}
+        if not stream:
+            return ChatCompletion.model_validate({
+                **base, 'object': "chat.completion",
+                'choices': [{'index': 0, 'finish_reason': "stop", 'message': entry['message']}],
+                'usage': entry.get('usage'),
+            })
+        message = dict(entry['message'])
+        tool_calls = [dict(tool_call, index=index) for index, tool_call in enumerate(message.pop('tool_calls', None) or [])]
+        chunks = [{**message, 'tool_calls': tool_calls or None}]
+        chunks.append(None)  # Usage-only last chunk, as sent with include_usage
+
+        def _stream():
+            for delta in chunks:
+                if delta is None:
+                    yield ChatCompletionChunk.model_validate({**base, 'object': "chat.completion.chunk", 'choices': [], 'usage': entry.get('usage')})
+                else:
+                    yield ChatCompletionChunk.model_validate({**base, 'object': "chat.completion.chunk", 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})
+        return _stream()
+
+    def _responses_create(self, **kwargs):
+        entry = self._next("responses.create")
+        usage = entry.get('usage') or {}
+        return SimpleNamespace(
+            output_text=entry['output_text'],
+            usage=SimpleNamespace(input_tokens=usage.get('input_tokens', 0), output_tokens=usage.get('output_tokens', 0)),
+        )
@@ -0,0 +1,229 @@
+import threading
+import time
+import logging
+from .metadata_index import connect_index, _escape_like
+from .dropbox_file_manager import download_file_to_buffer, extract_text_from_bytes, MAX_DOWNLOAD_SIZE, TEXT_EXTRACTABLE_EXTENSIONS
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+CONTENT_INDEX_MAX_CHARS = 200_000  # Text kept per document
+CONTENT_INDEX_INTERVAL_SECONDS = 5 * 60  # Pause between background indexing passes
+CONTENT_INDEX_BATCH_SIZE = 50  # Documents per indexing pass
+
+# Lives in the same database as the metadata index, keyed by Dropbox file id.
+# content_docs records what was indexed (and failures, so they aren't retried
+# until the content_hash changes); content_fts holds the searchable text.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS content_docs (
+    file_id TEXT PRIMARY KEY,
+    content_hash TEXT,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS content_fts USING fts5(
+    file_id UNINDEXED,
+    path,
+    body,
+    tokenize = 'porter unicode61'
+);
+"""
+
+# Only one indexing pass may run at a time
+_index_lock = threading.Lock()
+
+
+def _connect():
+    conn = connect_index()
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _pending_documents(conn, limit):
+    """Returns files whose content is not indexed yet or whose content_hash changed."""
+    extensions = sorted(ext.lstrip('.') for ext in TEXT_EXTRACTABLE_EXTENSIONS)
+    placeholders = ", ".join("?" for _ in extensions)
+    return conn.execute(
+        "SELECT f.id, f.path_display, f.name, f.content_hash FROM files f "
+        "LEFT JOIN content_docs d ON d.file_id = f.id "
+        f"WHERE f.is_folder = 0 AND f.extension IN ({placeholders}) AND f.size <= ? "
+        "AND (d.file_id IS NULL OR d.content_hash IS NOT f.content_hash) "
+        "ORDER BY f.server_modified DESC LIMIT ?",
+        (*extensions, MAX_DOWNLOAD_SIZE, limit),
+    ).fetchall()
+
+
+def _refresh_moved_documents(conn):
+    """
+    Updates the stored path of documents that were moved or renamed. Their Dropbox id and
+    content_hash stay the same, so they are not re-downloaded, but the path words in
+    content_fts must follow the file.
+
+    Returns:
+        int: Number of documents whose path changed.
+    """
+    moved = conn.execute(
+        "SELECT d.file_id, f.path_display FROM content_docs d JOIN files f ON f.id = d.file_id "
+        "WHERE d.path IS NOT f.path_display"
+    ).fetchall()
+    for row in moved:
+        conn.execute("UPDATE content_fts SET path = ? WHERE file_id = ?", (row['path_display'], row['file_id']))
+        conn.execute("UPDATE content_docs SET path = ? WHERE file_id = ?", (row['path_display'], row['file_id']))
+    return len(moved)
+
+
+def _remove_deleted_documents(conn):
+    """Drops indexed text for files that are no longer in the metadata index."""
+    conn.execute("DELETE FROM content_fts WHERE file_id NOT IN (SELECT id FROM files)")
+    conn.execute("DELETE FROM content_docs WHERE file_id NOT IN (SELECT id FROM files)")
+
+
+def index_file_contents(max_files=CONTENT_INDEX_BATCH_SIZE, select_user=None):
+    """
+    Runs one indexing pass: downloads new or changed documents listed in the metadata
+    index, extracts their text and stores it in the full-text index.
+    Only files up to MAX_DOWNLOAD_SIZE are indexed, since extractors need whole files.
+
+    Args:
+        max_files (int): Maximum number of documents to index in this pass.
+        select_user (str, optional): Team member ID to operate as.
+
+    Returns:
+        int: Number of documents processed (indexed or recorded as failed).
+    """
+    with _index_lock:
+        conn = _connect()
+        try:
+            _remove_deleted_documents(conn)
+            moved = _refresh_moved_documents(conn)
+            conn.commit()
+            if moved:
+                logger.info(f"Content index followed {moved} moved or renamed documents")
+
+            pending = _pending_documents(conn, max_files)
+            for row in pending:
+                status, error, text = 'indexed', None, ""
+                try:
+                    with download_file_to_buffer(row['path_display'], select_user=select_user, max_size_bytes=MAX_DOWNLOAD_SIZE) as (data, _, _, _):
+                        text = extract_text_from_bytes(data, row['name'])[:CONTENT_INDEX_MAX_CHARS]
+                except Exception as e:
+                    status, error = 'failed', str(e)
+                    logger.warning(f"Could not index contents of '{row['path_display']}': {e}")
+
+                conn.execute("DELETE FROM content_fts WHERE file_id = ?", (row['id'],))
+                if text:
+                    conn.execute("INSERT INTO content_fts (file_id, path, body) VALUES (?, ?, ?)", (row['id'], row['path_display'], text))
+                conn.execute(
+                    "INSERT OR REPLACE INTO content_docs (file_id, content_hash, path, status, error, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (row['id'], row['content_hash'], row['path_display'], status, error, time.time()),
+                )
+                conn.commit()
+
+            if pending:
+                logger.info(f"Content index pass processed {len(pending)} documents")
+            return len(pending)
+        finally:
+            conn.close()
+
+
+def _fts_query(query, operator):
+    """Quotes each word so user input can't be parsed as FTS5 syntax, joined by operator."""
+    terms = [f'"{term.replace(chr(34), chr(34) * 2)}"' for term in query.split()]
+    return f" {operator} ".join(terms)
+
+
+def search_text(query, path_prefix=None, limit=10):
+    """
+    Full-text search over indexed document contents, ranked by BM25.
+    Tries to match all words first and falls back to any word if nothing matches.
+    Paths come from the metadata index, so a moved or renamed document is returned
+    (and filtered) under its current path even before the next indexing pass.
+
+    Args:
+        query (str): Words to search for.
+        path_prefix (str, optional): Only return documents under this folder.
+        limit (int): Maximum number of results (default: 10).
+
+    Returns:
+        list: dicts with path and snippet, best match first.
+    """
+    if not query or not query.split():
+        return []
+    limit = max(1, int(limit or 10))
+
+    prefix_clause = ""
+    params_tail = []
+    if path_prefix and path_prefix.strip("/"):
+        prefix_clause = "AND f.path_lower LIKE ? ESCAPE '\\' "
+        params_tail.append(_escape_like("/" + path_prefix.strip("/").lower()) + "/%")
+
+    conn = _connect()
+    try:
+        for operator in ("AND", "OR"):
+            rows = conn.execute(
+                "SELECT f.path_display AS path, snippet(content_fts, 2, '[', ']', '...', 16) AS snippet "
+                "FROM content_fts JOIN files f ON f.id = content_fts.file_id "
+                f"WHERE content_fts MATCH ? {prefix_clause}ORDER BY bm25(content_fts) LIMIT ?",
+                (_fts_query(query, operator), *params_tail, limit),
+            ).fetchall()
+            if rows:
+                return [{'path': row['path'], 'snippet': row['snippet']} for row in rows]
+        return []
+    finally:
+        conn.close()
+
+
+def get_content_index_stats():
+    """
+    Returns coverage counters for the full-text index.
+
+    Returns:
+        dict: indexed and failed document counts.
+    """
+    conn = _connect()
+    try:
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM content_docs GROUP BY status").fetchall())
+    finally:
+        conn.close()
+    return {'indexed': counts.get('indexed', 0), 'failed': counts.get('failed', 0)}
+
+
+def run_content_indexer(stop_event=None, interval_seconds=CONTENT_INDEX_INTERVAL_SECONDS, select_user=None):
+    """
+    Repeatedly runs index_file_contents until stop_event is set. Passes follow each
+    other immediately while there is a backlog and pause for interval_seconds once
+    everything is indexed.
+
+    Args:
+        stop_event (threading.Event, optional): Set it to stop the indexer.
+        interval_seconds (int): Pause between passes once caught up.
+        select_user (str, optional): Team member ID to operate as.
+    """
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        try:
+            processed = index_file_contents(select_user=select_user)
+        except Exception as e:
+            logger.error(f"Content indexer error: {e}")
+            processed = 0
+        if processed < CONTENT_INDEX_BATCH_SIZE:
+            stop_event.wait(interval_seconds)
+
+
+def start_content_indexer(select_user=None):
+    """
+    Starts run_content_indexer in a daemon thread.
+
+    Args:
+        select_user (str, optional): Team member ID to operate as.
+
+    Returns:
+        threading.Event: Set it to stop the indexer.
+    """
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run_content_indexer, args=(stop_event,), kwargs={'select_user': select_user}, daemon=True, name="content-indexer")
+    thread.start()
+    return stop_event
@@ -0,0 +1,193 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+# tiktoken gives exact counts; without it tokens are estimated from the text length
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+CONTEXT_TOKEN_BUDGET = int(os.getenv("AGENT_CONTEXT_TOKENS", "60000"))  # Tokens of history sent per API call
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and formatting tokens added to every message
+CHARS_PER_TOKEN = 4  # Estimate used when tiktoken is not installed
+KEEP_RECENT_TOOL_RESULTS = 4  # The newest tool results are always sent in full
+ELIDED_PREVIEW_CHARS = 300  # Start of an elided tool result kept as a hint
+TOKEN_COUNT_CACHE_SIZE = 4096  # Token counts remembered for recently counted texts
+
+_encoding = None
+
+# Token counts keyed by a digest of the text, least recently used first. Keyed on the
+# digest so the cache never keeps tool results or prompts alive after their conversation.
+_token_counts_lock = threading.Lock()
+_token_counts = OrderedDict()
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning(f"Could not load tiktoken encoding, estimating token counts instead: {e}")
+    return _encoding
+
+
+def count_text_tokens(text):
+    """
+    Counts the tokens in a piece of text. Counts of recently seen texts are reused, since
+    the whole history is recounted before every model call.
+
+    Args:
+        text (str): The text to count.
+
+    Returns:
+        int: Exact count with tiktoken, otherwise an estimate of one token per CHARS_PER_TOKEN characters.
+    """
+    if not text:
+        return 0
+    digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    with _token_counts_lock:
+        count = _token_counts.get(digest)
+        if count is not None:
+            _token_counts.move_to_end(digest)
+            return count
+
+    encoding = _get_encoding()
+    if encoding is not None:
+        count = len(encoding.encode(text, disallowed_special=()))
+    else:
+        count = len(text) // CHARS_PER_TOKEN + 1
+    with _token_counts_lock:
+        _token_counts[digest] = count
+        while len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return count
+
+
+def trim_text_to_tokens(text, max_tokens):
+    """
+    Cuts text down to at most max_tokens tokens.
+
+    Args:
+        text (str): The text to trim.
+        max_tokens (int): Token budget.
+
+    Returns:
+        tuple: (str: The text, trimmed if needed, bool: True if it was trimmed)
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text, False
+        return encoding.decode(tokens[:max_tokens]), True
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text, False
+    return text[:max_chars], True
+
+
+def count_message_tokens(message):
+    """
+    Counts the tokens one history message contributes to a request.
+
+    Args:
+        message (dict): A chat message as stored in the history.
+
+    Returns:
+        int: Token count including per-message overhead.
+    """
+    content = message.get("content") or ""
+    if not isinstance(content, str):
+        content = json.dumps(content, default=str)
+    tokens = MESSAGE_OVERHEAD_TOKENS + count_text_tokens(content)
+    for tool_call in message.get("tool_calls") or []:
+        tokens += count_text_tokens(json.dumps(tool_call.get("function", {}), sort_keys=True))
+    return tokens
+
+
+def count_history_tokens(history):
+    """Returns the total token count of a list of messages."""
+    return sum(count_message_tokens(message) for message in history)
+
+
+def _elide_tool_result(message):
+    """Returns a copy of a tool message with its content replaced by a short preview."""
+    content = message.get("content") or ""
+    preview = content[:ELIDED_PREVIEW_CHARS].rstrip()
+    elided = dict(message)
+    elided["content"] = (
+        f"[Earlier {message.get('name', 'tool')} result shortened to save context; "
+        f"{len(content)} characters originally. Call the tool again if you need the full output.]\n{preview}..."
+    )
+    return elided
+
+
+def _turn_starts(history):
+    """Indexes of user messages, where complete exchanges (including tool calls) begin."""
+    return [i for i, message in enumerate(history) if message.get("role") == "user"]
+
+
+def fit_history_to_budget(history, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Returns a copy of history that fits in budget tokens, for sending to the model.
+
+    Old tool results are shortened first, oldest first, leaving the newest
+    KEEP_RECENT_TOOL_RESULTS intact. If that is not enough, the oldest complete
+    exchanges (a user message and everything up to the next one) are dropped.
+    System messages and the latest exchange are always kept, and messages are
+    never split, so every tool result still follows its assistant tool call.
+
+    Args:
+        history (list): The full conversation history. It is not modified.
+        budget (int): Maximum number of tokens to send.
+
+    Returns:
+        tuple: (list: Messages to send, dict: stats with original_tokens, sent_tokens,
+                elided_tool_results and dropped_messages)
+    """
+    messages = list(history)
+    counts = [count_message_tokens(message) for message in messages]
+    total = original = sum(counts)
+    stats = {'original_tokens': original, 'sent_tokens': original, 'elided_tool_results': 0, 'dropped_messages': 0}
+    if total <= budget:
+        return messages, stats
+
+    tool_indexes = [i for i, message in enumerate(messages) if message.get("role") == "tool"]
+    for i in tool_indexes[:max(0, len(tool_indexes) - KEEP_RECENT_TOOL_RESULTS)]:
+        if total <= budget:
+            break
+        elided = _elide_tool_result(messages[i])
+        elided_count = count_message_tokens(elided)
+        if elided_count < counts[i]:
+            total -= counts[i] - elided_count
+            messages[i], counts[i] = elided, elided_count
+            stats['elided_tool_results'] += 1
+
+    if total > budget:
+        starts = _turn_starts(messages)
+        # Drop whole exchanges between the first user message and the latest one
+        drop_until = None
+        for start in starts[1:]:
+            dropped = sum(counts[j] for j in range(starts[0], start) if messages[j].get("role") != "system")
+            drop_until = start
+            if total - dropped <= budget:
+                break
+        if drop_until is not None:
+            keep = [j for j in range(len(messages)) if j < starts[0] or j >= drop_until or messages[j].get("role") == "system"]
+            stats['dropped_messages'] = len(messages) - len(keep)
+            total = sum(counts[j] for j in keep)
+            messages = [messages[j] for j in keep]
+
+    stats['sent_tokens'] = total
+    if total > budget:
+        logger.warning(f"History is {total} tokens after trimming, over the {budget} token budget")
+    return messages, stats
@@ -0,0 +1,161 @@
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class ConversationDispatcher:
+    """
+    Runs queued work on a bounded thread pool with one FIFO queue per conversation.
+
+    Items for the same key are processed one at a time, in the order they arrived.
+    Different keys run in parallel, up to max_workers at once. After each item a
+    conversation goes to the back of the pool's queue, so a chatty conversation
+    can't starve the others.
+
+    A handler that starts its work elsewhere (e.g. a turn on the agent event loop) can
+    return a concurrent.futures.Future: the worker is freed at once, and the
+    conversation's next item starts when the future is done.
+    """
+
+    def __init__(self, handler, max_workers=8, max_pending=200, name="conversation"):
+        """
+        Args:
+            handler (callable): Called as handler(key, item) on a worker thread. May return
+                                a Future that completes when the item is fully processed.
+            max_workers (int): Maximum number of conversations processed at once.
+            max_pending (int): Maximum number of queued (not yet started) items across
+                               all conversations; submit() rejects items beyond this.
+            name (str): Prefix for worker thread names.
+        """
+        self._handler = handler
+        self._max_workers = max_workers
+        self._max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queues = {}  # key -> deque of (enqueued_at, item)
+        self._scheduled = set()  # keys with a drain task submitted or running
+        self._in_progress = set()  # keys whose handler (or the future it returned) is running right now
+        self._awaiting = set()  # keys whose handler returned a future that is not done yet; they hold no worker
+        self._running = 0
+        self._pending = 0
+        self._stats = {
+            'submitted': 0,
+            'rejected': 0,
+            'processed': 0,
+            'failed': 0,
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0,
+            'last_wait_seconds': 0.0,
+        }
+
+    def submit(self, key, item):
+        """
+        Queues an item for a conversation and returns immediately.
+
+        Args:
+            key (str): Conversation key; items with the same key run in order.
+            item: Passed to the handler.
+
+        Returns:
+            tuple: (bool: True if accepted, int: items ahead of this one in its
+                    conversation, bool: True if every worker is busy)
+        """
+        with self._lock:
+            if self._pending >= self._max_pending:
+                self._stats['rejected'] += 1
+                return False, 0, True
+
+            queue = self._queues.setdefault(key, deque())
+            queue.append((time.monotonic(), item))
+            self._pending += 1
+            self._stats['submitted'] += 1
+            ahead = len(queue) - 1 + (1 if key in self._in_progress else 0)
+            # Every worker is taken by other conversations, so this one has to wait
+            saturated = len(self._scheduled - self._awaiting - {key}) >= self._max_workers
+
+            if key not in self._scheduled:
+                self._scheduled.add(key)
+                self._executor.submit(self._drain_one, key)
+        return True, ahead, saturated
+
+    def _drain_one(self, key):
+        """Processes the next item for key, then reschedules the key if more are waiting."""
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                self._queues.pop(key, None)
+                self._scheduled.discard(key)
+                return
+            enqueued_at, item = queue.popleft()
+            self._pending -= 1
+            self._running += 1
+            self._in_progress.add(key)
+            wait = time.monotonic() - enqueued_at
+            self._stats['total_wait_seconds'] += wait
+            self._stats['last_wait_seconds'] = wait
+            self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], wait)
+
+        if wait > 1:
+            logger.info(f"Conversation {key} waited {wait:.1f}s in the queue")
+
+        try:
+            result = self._handler(key, item)
+        except Exception as e:
+            logger.error(f"Error processing queued item for {key}: {e}", exc_info=True)
+            self._finish(key, failed=True)
+            return
+        if isinstance(result, Future):
+            with self._lock:
+                self._awaiting.add(key)
+            result.add_done_callback(lambda future: self._finish_future(key, future))
+        else:
+            self._finish(key, failed=False)
+
+    def _finish_future(self, key, future):
+        """Done callback for a future returned by the handler."""
+        error = future.exception() if not future.cancelled() else "cancelled"
+        if error is not None:
+            logger.error(f"Error processing queued item for {key}: {error}")
+        with self._lock:
+            self._awaiting.discard(key)
+        self._finish(key, failed=error is not None)
+
+    def _finish(self, key, failed):
+        """Records an item as processed and schedules the conversation's next item, if any."""
+        with self._lock:
+            self._running -= 1
+            self._in_progress.discard(key)
+            self._stats['processed'] += 1
+            if failed:
+                self._stats['failed'] += 1
+            if self._queues.get(key):
+                # Go to the back of the line so other conversations get a turn
+                self._executor.submit(self._drain_one, key)
+            else:
+                self._queues.pop(key, None)
+                self._scheduled.discard(key)
+
+    def get_metrics(self):
+        """
+        Returns queue and worker metrics.
+
+        Returns:
+            dict: queue_depth (items waiting), conversations_waiting, running (including
+                  items whose handler returned a future), awaiting (those alone), max_workers,
+                  submitted, rejected, processed, failed and wait times in seconds.
+        """
+        with self._lock:
+            metrics = dict(self._stats)
+            metrics['queue_depth'] = self._pending
+            metrics['conversations_waiting'] = sum(1 for q in self._queues.values() if q)
+            metrics['running'] = self._running
+            metrics['awaiting'] = len(self._awaiting)
+            metrics['max_workers'] = self._max_workers
+        started = metrics['processed'] + metrics['running']
+        metrics['avg_wait_seconds'] = metrics['total_wait_seconds'] / started if started else 0.0
+        return metrics
@@ -0,0 +1,269 @@
+import os
+import re
+import json
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def _json_default(obj):
+    # Pydantic models (e.g. tool calls) dump to plain dicts; anything else becomes a string
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    return str(obj)
+
+
+def _estimate_state_bytes(state):
+    """Rough in-memory size of a conversation state: the text of its messages plus a fixed overhead each."""
+    total = 0
+    for message in state.get("history", []):
+        total += 200
+        content = message.get("content")
+        if isinstance(content, str):
+            total += len(content)
+        for tool_call in message.get("tool_calls") or []:
+            total += len(json.dumps(tool_call, default=_json_default))
+    return total
+
+
+class ConversationStateStore:
+    """
+    Thread-safe store for per-conversation state with bounded memory use.
+
+    States are kept in least-recently-used order. A state is evicted when it has been
+    idle longer than idle_ttl_seconds, or when the store holds more than max_sessions
+    states or more than max_bytes of estimated history. Evicted states are written to
+    spill_dir and loaded back transparently the next time their key is requested.
+    Files are read and written outside the store lock, so one conversation's disk I/O
+    never blocks the others.
+    """
+
+    def __init__(self, spill_dir, max_sessions=200, idle_ttl_seconds=30 * 60, max_bytes=100 * 1024 * 1024, on_spill=None):
+        """
+        Args:
+            spill_dir (str): Directory where evicted states are written.
+            max_sessions (int): Maximum number of states kept in memory.
+            idle_ttl_seconds (int): States idle for longer than this are spilled.
+            max_bytes (int): Maximum estimated size of all in-memory histories.
+            on_spill (callable, optional): Called as on_spill(key, state) after a state was
+                                           written to disk, to release what else is held for it.
+        """
+        self._on_spill = on_spill
+        self._spill_dir = spill_dir
+        self._max_sessions = max_sessions
+        self._idle_ttl_seconds = idle_ttl_seconds
+        self._max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._states = OrderedDict()  # key -> {'state': dict, 'bytes': int, 'last_access': float}
+        # Evicted states whose spill file is still being written {key: state}; get() takes them back from here
+        self._spilling = {}
+        self._total_bytes = 0
+        self._stats = {'spilled': 0, 'rehydrated': 0}
+        os.makedirs(spill_dir, exist_ok=True)
+
+    def _spill_path(self, key):
+        # Slack keys are channel_user IDs, but keep file names safe regardless
+        return os.path.join(self._spill_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", key) + ".json")
+
+    def get(self, key):
+        """
+        Returns the state for key, loading it back from disk if it was spilled.
+
+        Args:
+            key (str): Conversation key.
+
+        Returns:
+            dict: The state, or None if there is no conversation for key.
+        """
+        with self._lock:
+            entry = self._states.get(key)
+            if entry is not None:
+                entry['last_access'] = time.monotonic()
+                self._states.move_to_end(key)
+                return entry['state']
+            if key in self._spilling:
+                # Evicted a moment ago; its write is abandoned (see _write_spills)
+                state = self._spilling.pop(key)
+                spills = self._insert(key, state)
+            else:
+                state = None
+        if state is not None:
+            self._write_spills(spills)
+            return state
+
+        path = self._spill_path(key)
+        try:
+            with open(path, "r") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load spilled conversation state for {key}: {e}")
+            return None
+
+        with self._lock:
+            entry = self._states.get(key)
+            if entry is not None:
+                # Put (or loaded) by another thread while this one was reading
+                return entry['state']
+            self._discard_spill(key)
+            self._stats['rehydrated'] += 1
+            spills = self._insert(key, state)
+        logger.info(f"Rehydrated conversation state for {key} from disk")
+        self._write_spills(spills)
+        return state
+
+    def put(self, key, state):
+        """
+        Stores (or updates) the state for key and evicts other states if limits are exceeded.
+        Call it again after mutating a state so its size is re-estimated.
+
+        Args:
+            key (str): Conversation key.
+            state (dict): The state, with a "history" list.
+        """
+        with self._lock:
+            self._remove(key)
+            # A state spilled while its conversation was running is superseded by this one
+            self._spilling.pop(key, None)
+            self._discard_spill(key)
+            spills = self._insert(key, state)
+        self._write_spills(spills)
+
+    def delete(self, key):
+        """Forgets the state for key, in memory and on disk."""
+        with self._lock:
+            self._remove(key)
+            self._spilling.pop(key, None)
+            self._discard_spill(key)
+
+    def _discard_spill(self, key):
+        try:
+            os.remove(self._spill_path(key))
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._states or key in self._spilling or os.path.exists(self._spill_path(key))
+
+    def _insert(self, key, state):
+        """Adds a state (lock held) and returns the states evicted to make room, for _write_spills."""
+        size = _estimate_state_bytes(state)
+        self._states[key] = {'state': state, 'bytes': size, 'last_access': time.monotonic()}
+        self._total_bytes += size
+        return self._evict(keep=key)
+
+    def _remove(self, key):
+        entry = self._states.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry['bytes']
+        return entry
+
+    def _evict(self, keep=None):
+        """
+        Evicts idle states, then least-recently-used ones until under the limits (lock held).
+
+        Returns:
+            list: (key, state, bytes) of the evicted states; pass them to _write_spills
+                  once the lock is released.
+        """
+        evicted = []
+
+        def _take(key):
+            entry = self._remove(key)
+            self._spilling[key] = entry['state']
+            evicted.append((key, entry['state'], entry['bytes']))
+
+        now = time.monotonic()
+        for key in [k for k, e in self._states.items() if k != keep and now - e['last_access'] > self._idle_ttl_seconds]:
+            _take(key)
+        while len(self._states) > self._max_sessions or self._total_bytes > self._max_bytes:
+            oldest = next((k for k in self._states if k != keep), None)
+            if oldest is None:
+                break
+            _take(oldest)
+        return evicted
+
+    def _write_spills(self, evicted):
+        """
+        Writes evicted states to disk; call without the lock held. Each state is written
+        to a temporary file that only replaces the spill file if the state was not taken
+        back or superseded in the meantime.
+        """
+        for key, state, size in evicted:
+            path = self._spill_path(key)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(temp_path, "w") as f:
+                    json.dump(state, f, default=_json_default)
+            except (OSError, TypeError) as e:
+                logger.error(f"Could not spill conversation state for {key}, dropping it: {e}")
+                with self._lock:
+                    if self._spilling.get(key) is state:
+                        del self._spilling[key]
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                continue
+
+            with self._lock:
+                current = self._spilling.get(key) is state
+                if current:
+                    os.replace(temp_path, path)
+                    del self._spilling[key]
+                    self._stats['spilled'] += 1
+            if current:
+                logger.info(f"Spilled conversation state for {key} to disk ({size} bytes)")
+                if self._on_spill is not None:
+                    try:
+                        self._on_spill(key, state)
+                    except Exception as e:
+                        logger.error(f"on_spill failed for {key}: {e}")
+            else:
+                os.remove(temp_path)
+
+    def evict_idle(self):
+        """Spills every state that has been idle longer than idle_ttl_seconds."""
+        with self._lock:
+            evicted = self._evict()
+        self._write_spills(evicted)
+
+    def start_idle_eviction(self, interval_seconds=60):
+        """
+        Calls evict_idle every interval_seconds in a daemon thread, so idle states are
+        spilled even when no other conversation touches the store.
+
+        Args:
+            interval_seconds (float): Seconds between sweeps.
+
+        Returns:
+            threading.Event: Set it to stop the sweeps.
+        """
+        stop_event = threading.Event()
+
+        def _sweep():
+            while not stop_event.wait(interval_seconds):
+                try:
+                    self.evict_idle()
+                except Exception as e:
+                    logger.error(f"Error evicting idle conversation states: {e}")
+
+        threading.Thread(target=_sweep, daemon=True, name="conversation-store-evictor").start()
+        return stop_event
+
+    def get_stats(self):
+        """
+        Returns store metrics.
+
+        Returns:
+            dict: sessions and bytes held in memory, plus spilled/rehydrated counts.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['sessions_in_memory'] = len(self._states)
+            stats['bytes_in_memory'] = self._total_bytes
+        return stats
@@ -0,0 +1,227 @@
+import threading
+import time
+import logging
+from collections import namedtuple
+import dropbox
+import dropbox.common
+from urllib.parse import urlsplit
+from .dropbox_token_manager import get_access_token, invalidate_access_token
+from .tracing import TRACING_ENABLED, span, record_span
+from .cassette import wrap_dropbox_client
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+CONTEXT_TTL_SECONDS = 30 * 60  # Re-resolve member/namespace info every 30 minutes
+
+# Resolved context for one team member: the scoped client plus the IDs used to build it
+DropboxContext = namedtuple("DropboxContext", ["client", "member_id", "root_namespace_id"])
+
+# Cache of resolved contexts {select_user: {'context': DropboxContext, 'access_token': str, 'resolved_at': float}}
+_context_cache = {}
+_context_lock = threading.Lock()
+
+# Optional replacement for building contexts, see set_context_factory
+_context_factory = None
+
+# HTTP session shared by traced clients, see _team_client
+_traced_session = None
+_traced_session_lock = threading.Lock()
+
+
+def _trace_http_response(response, *args, **kwargs):
+    """requests response hook: records every Dropbox API round trip as a span named after its route."""
+    request = response.request
+    route = urlsplit(request.url).path.lstrip("/")
+    if route.startswith("2/"):
+        route = route[2:]
+    body = request.body
+    record_span(
+        f"dropbox.{route}",
+        response.elapsed.total_seconds(),  # Time until the response headers arrived
+        error=f"HTTP {response.status_code}" if response.status_code >= 400 else None,
+        status=response.status_code,
+        request_bytes=len(body) if isinstance(body, (bytes, str)) else 0,
+        response_bytes=int(response.headers.get("Content-Length") or 0),
+    )
+
+
+def _team_client(access_token):
+    """
+    Builds a team client. With tracing enabled the client uses a shared HTTP session
+    whose response hook records each API call; clients derived with as_user,
+    with_path_root and clone keep that session.
+    """
+    global _traced_session
+    if not TRACING_ENABLED:
+        return dropbox.DropboxTeam(access_token)
+    with _traced_session_lock:
+        if _traced_session is None:
+            _traced_session = dropbox.create_session()
+            _traced_session.hooks['response'].append(_trace_http_response)
+    return dropbox.DropboxTeam(access_token, session=_traced_session)
+
+
+def _resolve_member_and_namespace(dbx_team, select_user=None):
+    """
+    Looks up the team member ID and root namespace ID for a user.
+    This is the expensive part of building a client (two API round trips).
+
+    Args:
+        dbx_team (dropbox.DropboxTeam): Team client built from the current access token.
+        select_user (str, optional): Team member ID to operate as.
+                                     If None, the admin linked to the token is used.
+
+    Returns:
+        tuple: (str: team member ID, str: root namespace ID)
+
+    Raises:
+        ValueError: If the member ID or root namespace ID cannot be determined.
+    """
+    member_id_to_use = select_user
+
+    # 1. Determine the Member ID context
+    if not member_id_to_use:
+        logger.info("No select_user provided, determining token admin's member ID...")
+        admin_info = dbx_team.team_token_get_authenticated_admin()
+        # Ensure we get the team_member_id, not just the user_id if different
+        if hasattr(admin_info.admin_profile, 'team_member_id'):
+            member_id_to_use = admin_info.admin_profile.team_member_id
+        else:
+            raise ValueError("Could not determine team_member_id for the authenticated admin.")
+
+    # 2. Get account info to find the root namespace ID
+    account_info = dbx_team.as_user(member_id_to_use).users_get_current_account()
+
+    if not hasattr(account_info, 'root_info') or not hasattr(account_info.root_info, 'root_namespace_id'):
+        raise ValueError("Could not determine root_namespace_id from user's account info.")
+
+    return member_id_to_use, account_info.root_info.root_namespace_id
+
+
+def _build_scoped_client(dbx_team, member_id, root_namespace_id):
+    """Builds a client scoped to the member's root namespace. No API calls are made."""
+    team_path_root = dropbox.common.PathRoot.namespace_id(root_namespace_id)
+    # Apply path_root first, then user context for the final client
+    return wrap_dropbox_client(dbx_team.with_path_root(team_path_root).as_user(member_id))
+
+
+def get_dropbox_context(select_user=None):
+    """
+    Returns a Dropbox client scoped to the correct user and root namespace, resolving
+    and caching the member ID and root namespace ID per select_user.
+
+    The IDs are cached for CONTEXT_TTL_SECONDS. If the access token changes in the
+    meantime the scoped client is rebuilt locally from the cached IDs without any
+    extra API calls.
+
+    Args:
+        select_user (str, optional): Team member ID (e.g., "dbmid:...") to operate as.
+                                     If None, operates as the admin linked to the token.
+
+    Returns:
+        DropboxContext: (client, member_id, root_namespace_id)
+
+    Raises:
+        ValueError: If token is invalid or required info cannot be determined.
+        dropbox.exceptions.ApiError: If a lookup request fails.
+    """
+    if _context_factory is not None:
+        return _context_factory(select_user)
+
+    access_token = get_access_token()
+    if not access_token:
+        raise ValueError("Failed to obtain a valid access token")
+
+    now = time.monotonic()
+    with _context_lock:
+        cached = _context_cache.get(select_user)
+        if cached and now - cached['resolved_at'] < CONTEXT_TTL_SECONDS:
+            if cached['access_token'] != access_token:
+                # Token was refreshed: rebuild the client from the cached IDs
+                context = cached['context']
+                client = _build_scoped_client(_team_client(access_token), context.member_id, context.root_namespace_id)
+                cached['context'] = context._replace(client=client)
+                cached['access_token'] = access_token
+            return cached['context']
+
+    # Resolve outside the lock so a slow lookup for one user doesn't block the others
+    dbx_team = _team_client(access_token)
+    with span("dropbox.resolve_context", select_user=select_user):
+        member_id, root_namespace_id = _resolve_member_and_namespace(dbx_team, select_user)
+    context = DropboxContext(
+        client=_build_scoped_client(dbx_team, member_id, root_namespace_id),
+        member_id=member_id,
+        root_namespace_id=root_namespace_id,
+    )
+
+    with _context_lock:
+        _context_cache[select_user] = {
+            'context': context,
+            'access_token': access_token,
+            'resolved_at': time.monotonic(),
+        }
+    logger.info(f"Resolved Dropbox context for member {member_id} in namespace {root_namespace_id}")
+    return context
+
+
+def set_context_factory(factory):
+    """
+    Replaces how Dropbox contexts are built, e.g. with a fake Dropbox client for local
+    testing. While a factory is set no access token is requested and nothing is cached.
+
+    Args:
+        factory (callable): Called as factory(select_user) and must return a
+                            DropboxContext. Pass None to restore the real behaviour.
+    """
+    global _context_factory
+    with _context_lock:
+        _context_factory = factory
+        _context_cache.clear()
+
+
+def invalidate_dropbox_context(select_user=None, all_users=False):
+    """
+    Drops cached context so the next call re-resolves it.
+
+    Args:
+        select_user (str, optional): The select_user whose context should be dropped.
+        all_users (bool): If True, drop the cached context for every user.
+    """
+    with _context_lock:
+        if all_users:
+            _context_cache.clear()
+        else:
+            _context_cache.pop(select_user, None)
+
+
+def run_with_dropbox_context(operation, select_user=None):
+    """
+    Runs operation(context) with a cached Dropbox context. If the call fails with an
+    auth or path-root error the cached context is dropped and the operation is
+    retried once with a freshly resolved context. Auth errors also force an
+    access token refresh.
+
+    Args:
+        operation (callable): Function taking a DropboxContext.
+        select_user (str, optional): Team member ID to operate as.
+
+    Returns:
+        Whatever operation returns.
+
+    Raises:
+        dropbox.exceptions.AuthError: If the retry also fails authentication.
+        dropbox.exceptions.PathRootError: If the retry also fails with a path root error.
+    """
+    for attempt in range(2):
+        context = get_dropbox_context(select_user)
+        try:
+            return operation(context)
+        except (dropbox.exceptions.AuthError, dropbox.exceptions.PathRootError) as e:
+            invalidate_dropbox_context(select_user)
+            if isinstance(e, dropbox.exceptions.AuthError):
+                invalidate_access_token()
+            if attempt:
+                raise
+            logger.warning(f"Dropbox context rejected ({e.__class__.__name__}), re-resolving and retrying once...")
@@ -1,22 +1,174 @@
 import os
 import tempfile
+import threading
 import dropbox
-import dropbox.common
 import io
 import logging
-from .dropbox_token_manager import get_access_token
+from contextlib import contextmanager
+from .dropbox_client_context import run_with_dropbox_context
+from .tracing import span
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
 # Constants
-MAX_DOWNLOAD_SIZE = 5 * 1024 * 1024  # 5MB absolute maximum
+MAX_DOWNLOAD_SIZE = 5 * 1024 * 1024  # 5MB absolute maximum read from any single file
 PARTIAL_DOWNLOAD_SIZE = 1 * 1024 * 1024  # 1MB for partial downloads
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # Read size when streaming download responses
+PLAIN_TEXT_EXTENSIONS = {'.txt', '.csv', '.md'}
+TEXT_EXTRACTABLE_EXTENSIONS = {'.pdf', '.docx', '.xlsx', '.pptx'} | PLAIN_TEXT_EXTENSIONS
+
+# Accounting for in-memory download buffers, shared by all threads
+_buffer_lock = threading.Lock()
+_buffer_stats = {'in_flight_bytes': 0, 'peak_in_flight_bytes': 0, 'buffers_opened': 0}
+
+def _stream_download(dbx_client, path, max_bytes, write, start=0):
+    """
+    Streams at most max_bytes of a Dropbox file, starting at byte start, into write(chunk).
+    Sends an HTTP Range header so the server only transfers the requested bytes,
+    and stops reading at the byte budget in case the range is not honored.
+
+    Args:
+        dbx_client (dropbox.Dropbox): Client scoped to the correct user and root.
+        path (str): The path of the file in Dropbox.
+        max_bytes (int): Maximum number of bytes to read.
+        write (callable): Called with each chunk of bytes.
+        start (int): Offset of the first byte to read (default: 0).
+
+    Returns:
+        tuple: (dropbox.files.FileMetadata: Metadata of the whole file, int: Bytes written)
+    """
+    with span("dropbox.download", path=path, start=start, max_bytes=max_bytes) as download_span:
+        max_bytes = max(1, max_bytes)
+        # Clone the client with an extra Range header; the clone shares the HTTP session
+        range_headers = dict(dbx_client._headers or {})
+        range_headers['Range'] = f"bytes={start}-{start + max_bytes - 1}"
+        ranged_client = dbx_client.clone(headers=range_headers)
+
+        try:
+            metadata, response = ranged_client.files_download(path)
+        except dropbox.exceptions.HttpError as e:
+            if e.status_code != 416 or start:
+                raise
+            # Empty files cannot satisfy a range request, fetch them without one
+            metadata, response = dbx_client.files_download(path)
+
+        # A full (200) response to a ranged request starts at byte 0; skip to start
+        skip = start if start and getattr(response, 'status_code', 206) == 200 else 0
+        if skip:
+            logger.warning(f"Range request for '{path}' was not honored, skipping {skip} bytes")
+
+        written = 0
+        try:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                if skip:
+                    dropped = min(skip, len(chunk))
+                    chunk = chunk[dropped:]
+                    skip -= dropped
+                    if not chunk:
+                        continue
+                remaining = max_bytes - written
+                if remaining <= 0:
+                    break
+                chunk = chunk[:remaining]
+                write(chunk)
+                written += len(chunk)
+        finally:
+            # Closing drops any unread remainder instead of pulling it over the wire
+            response.close()
+        download_span.set(bytes=written)
+
+    return metadata, written
+
+class DropboxRangeReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over a Dropbox file that fetches only the byte
+    ranges actually read, in blocks of block_size. Lets zipfile and PDF readers jump
+    to the parts they need (central directory, xref table, first pages) without
+    downloading the whole file. Raises RuntimeError once more than budget bytes would
+    be fetched, so the cost of reading stays bounded whatever the file size.
+    """
+
+    def __init__(self, dbx_client, path, size, budget=MAX_DOWNLOAD_SIZE, block_size=256 * 1024, max_cached_blocks=16):
+        """
+        Args:
+            dbx_client (dropbox.Dropbox): Client scoped to the correct user and root.
+            path (str): The path of the file in Dropbox.
+            size (int): Total file size in bytes.
+            budget (int): Maximum number of bytes to fetch over the reader's lifetime.
+            block_size (int): Bytes fetched per range request.
+            max_cached_blocks (int): Blocks kept in memory for re-reads.
+        """
+        super().__init__()
+        self._client = dbx_client
+        self._path = path
+        self._size = size
+        self._budget = budget
+        self._block_size = block_size
+        self._max_cached_blocks = max_cached_blocks
+        self._blocks = {}
+        self._pos = 0
+        self.bytes_fetched = 0
+        self.requests = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        self._pos = max(0, self._pos)
+        return self._pos
+
+    def _block(self, index):
+        block = self._blocks.get(index)
+        if block is None:
+            start = index * self._block_size
+            length = min(self._block_size, self._size - start)
+            if self.bytes_fetched + length > self._budget:
+                raise RuntimeError(f"Read budget of {self._budget} bytes exhausted for '{self._path}'")
+            buffer = bytearray()
+            _stream_download(self._client, self._path, length, buffer.extend, start=start)
+            self.bytes_fetched += len(buffer)
+            self.requests += 1
+            if len(self._blocks) >= self._max_cached_blocks:
+                self._blocks.pop(next(iter(self._blocks)))
+            block = self._blocks[index] = bytes(buffer)
+        return block
+
+    def readinto(self, b):
+        view = memoryview(b).cast('B')
+        end = min(self._pos + len(view), self._size)
+        written = 0
+        while self._pos < end:
+            index, offset = divmod(self._pos, self._block_size)
+            block = self._block(index)
+            chunk = block[offset:offset + (end - self._pos)]
+            if not chunk:
+                break
+            view[written:written + len(chunk)] = chunk
+            written += len(chunk)
+            self._pos += len(chunk)
+        return written
 
 def download_file_with_size_limit(path, select_user=None, local_path=None, max_size_bytes=PARTIAL_DOWNLOAD_SIZE):
     """
     Downloads a file from Dropbox with size limit to avoid timeouts on large files.
-    For files larger than MAX_DOWNLOAD_SIZE (5MB), no download is attempted.
+    Only the first max_size_bytes (capped at MAX_DOWNLOAD_SIZE) are requested with an
+    HTTP Range read, so files of any size can be partially analyzed and bandwidth
+    scales with the byte budget rather than the file size.
     
     Args:
         path (str): The path of the file in Dropbox to download
@@ -24,72 +176,30 @@ def download_file_with_size_limit(path, select_user=None, local_path=None, max_s
                                      If None, operates as the admin linked to the token.
         local_path (str, optional): Local path where to save the file.
                                     If None, saves to a temporary file.
-        max_size_bytes (int): Maximum file size to download (default: 1MB)
+        max_size_bytes (int): Maximum number of bytes to download (default: 1MB, capped at 5MB)
         
     Returns:
-        tuple: (str: Path to the downloaded file or None if too large, 
-                bool: True if file was truncated or too large, 
+        tuple: (str: Path to the downloaded file, 
+                bool: True if file was truncated, 
                 int: Total file size,
-                bool: True if the file was too large to download at all)
+                bool: True if the file was too large to download at all. Always False now
+                      that oversized files are range-read; kept so callers unpack unchanged.)
         
     Raises:
         dropbox.exceptions.ApiError: If the API request fails.
         ValueError: If token is invalid or required info cannot be determined.
         RuntimeError: For unexpected errors during the process.
     """
-    access_token = get_access_token()
-    if not access_token:
-        raise ValueError("Failed to obtain a valid access token")
-
-    dbx_team = dropbox.DropboxTeam(access_token)
     member_id_to_use = select_user
-    is_truncated = False
-    total_file_size = 0
-    too_large_to_download = False
+    root_namespace_id = None
+    max_size_bytes = min(max_size_bytes, MAX_DOWNLOAD_SIZE)
 
-    try:
-        # 1. Determine the Member ID context
-        if not member_id_to_use:
-            logger.info("No select_user provided, determining token admin's member ID...")
-            admin_info = dbx_team.team_token_get_authenticated_admin()
-            # Ensure we get the team_member_id, not just the user_id if different
-            if hasattr(admin_info.admin_profile, 'team_member_id'):
-                 member_id_to_use = admin_info.admin_profile.team_member_id
-            else:
-                 # Fallback or error, depending on API version/structure
-                 raise ValueError("Could not determine team_member_id for the authenticated admin.")
-        else:
-            logger.info(f"Operating as specified user: {member_id_to_use}")
+    def _download(context):
+        nonlocal member_id_to_use, root_namespace_id, local_path
+        member_id_to_use = context.member_id
+        root_namespace_id = context.root_namespace_id
 
-        # 2. Get user-specific context client
-        dbx_user_context = dbx_team.as_user(member_id_to_use)
-
-        # 3. Get account info to find the root namespace ID
-        account_info = dbx_user_context.users_get_current_account()
-        
-        if not hasattr(account_info, 'root_info') or not hasattr(account_info.root_info, 'root_namespace_id'):
-             raise ValueError("Could not determine root_namespace_id from user's account info.")
-             
-        root_namespace_id = account_info.root_info.root_namespace_id
-
-        # 4. Create the final client scoped to the correct root and user
-        team_path_root = dropbox.common.PathRoot.namespace_id(root_namespace_id)
-        # Apply path_root first, then user context for the final client
-        dbx_final_client = dbx_team.with_path_root(team_path_root).as_user(member_id_to_use)
-
-        # 5. First, get metadata to check file size
-        logger.info(f"Getting metadata for '{path}'...")
-        metadata = dbx_final_client.files_get_metadata(path)
-        total_file_size = metadata.size
-        
-        # Check if file is too large to even attempt download (> 5MB)
-        if total_file_size > MAX_DOWNLOAD_SIZE:
-            logger.warning(f"File size ({total_file_size} bytes) exceeds maximum limit ({MAX_DOWNLOAD_SIZE} bytes). Skipping download.")
-            is_truncated = True
-            too_large_to_download = True
-            return None, is_truncated, total_file_size, too_large_to_download
-            
-        # 6. Prepare local file path
+        # 1. Prepare local file path
         if local_path is None:
             # Create a temporary file with the same extension as the original
             file_ext = os.path.splitext(path)[1]
@@ -100,30 +210,25 @@ def download_file_with_size_limit(path, select_user=None, local_path=None, max_s
             # Ensure the directory exists
             os.makedirs(os.path.dirname(os.path.abspath(local_path)), exist_ok=True)
         
-        # 7. Download the file (either full or partial)
-        if total_file_size > max_size_bytes:
-            logger.info(f"File size ({total_file_size} bytes) exceeds partial limit ({max_size_bytes} bytes). Downloading partial content...")
-            is_truncated = True
-            
-            # Use files_download instead of files_download_to_file to get content directly
-            result = dbx_final_client.files_download(path)
-            # Get the file content
-            _, response = result
-            
-            # Read only up to max_size_bytes
-            content = response.content[:max_size_bytes]
-            
-            # Write the partial content to the file
-            with open(local_path, 'wb') as f:
-                f.write(content)
-                
-            logger.info(f"Partial download complete: {metadata.name}, downloaded: {len(content)} bytes of {total_file_size} bytes")
+        # 2. Stream up to max_size_bytes straight to disk. The download response carries
+        #    the file metadata, so no separate files_get_metadata call is needed.
+        logger.info(f"Downloading up to {max_size_bytes} bytes of '{path}' to '{local_path}'...")
+        with open(local_path, 'wb') as f:
+            metadata, downloaded = _stream_download(context.client, path, max_size_bytes, f.write)
+
+        total_file_size = metadata.size
+        is_truncated = total_file_size > downloaded
+        if is_truncated:
+            logger.info(f"Partial download complete: {metadata.name}, downloaded: {downloaded} bytes of {total_file_size} bytes")
         else:
-            logger.info(f"Downloading entire file ({total_file_size} bytes) to '{local_path}'...")
-            dbx_final_client.files_download_to_file(local_path, path)
             logger.info(f"Download complete: {metadata.name}, size: {total_file_size} bytes")
         
-        return local_path, is_truncated, total_file_size, too_large_to_download
+        return local_path, is_truncated, total_file_size, False
+
+    try:
+        if select_user:
+            logger.info(f"Operating as specified user: {select_user}")
+        return run_with_dropbox_context(_download, select_user=select_user)
 
     except dropbox.exceptions.AuthError as e:
         raise ValueError(f"Authentication error: {e}. Check token validity and scopes.") from e
@@ -144,15 +249,102 @@ def download_file_with_size_limit(path, select_user=None, local_path=None, max_s
              logger.error(f"  Error details related to path lookup: {e.error.path}")
              
         # Provide context about the operation
-        logger.error(f"  Error occurred during download for user {member_id_to_use} in namespace {root_namespace_id if 'root_namespace_id' in locals() else 'N/A'} for path '{path}'.")
+        logger.error(f"  Error occurred during download for user {member_id_to_use} in namespace {root_namespace_id or 'N/A'} for path '{path}'.")
         raise # Re-raise the original ApiError
 
+    except ValueError:
+        # Token or context resolution failures already carry a descriptive message
+        raise
     except Exception as e:
         # Catch any other unexpected errors
         import traceback
         logger.error(f"Unexpected Error: {e}\n{traceback.format_exc()}")
         raise RuntimeError(f"An unexpected error occurred: {e}") from e
 
+@contextmanager
+def download_file_to_buffer(path, select_user=None, max_size_bytes=PARTIAL_DOWNLOAD_SIZE):
+    """
+    Downloads up to max_size_bytes of a Dropbox file into memory, with no temporary file.
+    Use as a context manager; the buffer is released (and accounted for) on exit.
+
+    Example:
+        with download_file_to_buffer("/a.pdf") as (data, is_truncated, total_size, metadata):
+            ...
+
+    Args:
+        path (str): The path of the file in Dropbox to download
+        select_user (str, optional): Team member ID to operate as
+        max_size_bytes (int): Maximum number of bytes to download (default: 1MB, capped at 5MB)
+
+    Yields:
+        tuple: (memoryview: The downloaded bytes,
+                bool: True if file was truncated,
+                int: Total file size,
+                dropbox.files.FileMetadata: Metadata of the file)
+
+    Raises:
+        dropbox.exceptions.ApiError: If the API request fails.
+        ValueError: If token is invalid or required info cannot be determined.
+    """
+    max_size_bytes = min(max_size_bytes, MAX_DOWNLOAD_SIZE)
+
+    def _download(context):
+        buffer = bytearray()
+        metadata, _ = _stream_download(context.client, path, max_size_bytes, buffer.extend)
+        return buffer, metadata
+
+    try:
+        buffer, metadata = run_with_dropbox_context(_download, select_user=select_user)
+    except dropbox.exceptions.AuthError as e:
+        raise ValueError(f"Authentication error: {e}. Check token validity and scopes.") from e
+
+    buffer_size = len(buffer)
+    with _buffer_lock:
+        _buffer_stats['in_flight_bytes'] += buffer_size
+        _buffer_stats['buffers_opened'] += 1
+        _buffer_stats['peak_in_flight_bytes'] = max(_buffer_stats['peak_in_flight_bytes'], _buffer_stats['in_flight_bytes'])
+
+    is_truncated = metadata.size > buffer_size
+    logger.info(f"Buffered {buffer_size} bytes of {metadata.size} bytes for '{path}'")
+    view = memoryview(buffer)
+    try:
+        yield view, is_truncated, metadata.size, metadata
+    finally:
+        del view, buffer
+        with _buffer_lock:
+            _buffer_stats['in_flight_bytes'] -= buffer_size
+
+def get_download_buffer_stats():
+    """
+    Returns accounting for in-memory download buffers across all threads.
+
+    Returns:
+        dict: in_flight_bytes (currently held), peak_in_flight_bytes (high-water mark)
+              and buffers_opened (total downloads buffered).
+    """
+    with _buffer_lock:
+        return dict(_buffer_stats)
+
+def get_file_metadata(path, select_user=None):
+    """
+    Fetches the metadata of a Dropbox file (size, content_hash, rev, ...).
+
+    Args:
+        path (str): The path of the file in Dropbox
+        select_user (str, optional): Team member ID to operate as
+
+    Returns:
+        dropbox.files.Metadata: The file's metadata.
+
+    Raises:
+        dropbox.exceptions.ApiError: If the API request fails.
+        ValueError: If token is invalid or required info cannot be determined.
+    """
+    try:
+        return run_with_dropbox_context(lambda context: context.client.files_get_metadata(path), select_user=select_user)
+    except dropbox.exceptions.AuthError as e:
+        raise ValueError(f"Authentication error: {e}. Check token validity and scopes.") from e
+
 # Update existing download_file function to use the new size-limited version
 def download_file(path, select_user=None, local_path=None, max_size_bytes=PARTIAL_DOWNLOAD_SIZE):
     """
@@ -165,7 +357,7 @@ def download_file(path, select_user=None, local_path=None, max_size_bytes=PARTIA
                                      If None, operates as the admin linked to the token.
         local_path (str, optional): Local path where to save the file.
                                     If None, saves to a temporary file.
-        max_size_bytes (int): Maximum file size to download (default: 1MB)
+        max_size_bytes (int): Maximum number of bytes to download (default: 1MB, capped at 5MB)
         
     Returns:
         str: Path to the downloaded file
@@ -174,16 +366,11 @@ def download_file(path, select_user=None, local_path=None, max_size_bytes=PARTIA
         dropbox.exceptions.ApiError: If the API request fails.
         ValueError: If token is invalid or required info cannot be determined.
         RuntimeError: For unexpected errors during the process.
-        ValueError: If file is too large to download (>5MB)
     """
-    local_path, is_truncated, total_size, too_large = download_file_with_size_limit(
+    local_path, is_truncated, total_size, _ = download_file_with_size_limit(
         path, select_user, local_path, max_size_bytes
     )
     
-    if too_large:
-        size_mb = total_size / (1024 * 1024)
-        raise ValueError(f"File is too large to download: {size_mb:.1f} MB exceeds the 5 MB limit")
-    
     if is_truncated:
         logger.warning(f"File was truncated! Only downloaded {max_size_bytes} bytes of {total_size} bytes.")
     
@@ -191,7 +378,7 @@ def download_file(path, select_user=None, local_path=None, max_size_bytes=PARTIA
 
 def extract_text(file_path):
     """
-    Extracts text from a file (PDF, DOCX, XLSX, PPTX).
+    Extracts text from a file (PDF, DOCX, XLSX, PPTX, TXT, CSV, MD).
     
     Args:
         file_path (str): Path to the file to extract text from
@@ -204,28 +391,61 @@ def extract_text(file_path):
         ImportError: If the required package is not installed
         RuntimeError: For unexpected errors during extraction
     """
-    file_ext = os.path.splitext(file_path)[1].lower()
+    return _extract_text_by_extension(file_path, os.path.splitext(file_path)[1].lower(), file_path)
+
+def extract_text_from_bytes(data, filename):
+    """
+    Extracts text from in-memory file content, choosing the extractor from the filename.
     
+    Args:
+        data (bytes-like): The file content (bytes, bytearray or memoryview)
+        filename (str): Name of the file, used to determine its format
+        
+    Returns:
+        str: Extracted text content
+        
+    Raises:
+        ValueError: If the file format is not supported
+        ImportError: If the required package is not installed
+        RuntimeError: For unexpected errors during extraction
+    """
+    return _extract_text_by_extension(io.BytesIO(data), os.path.splitext(filename)[1].lower(), filename)
+
+def _extract_text_by_extension(source, file_ext, label):
+    """Dispatches to the extractor for file_ext. source is a file path or a binary file object."""
     try:
         # Extract text based on file type
         if file_ext == '.pdf':
-            return _extract_text_from_pdf(file_path)
+            return _extract_text_from_pdf(source)
         elif file_ext == '.docx':
-            return _extract_text_from_docx(file_path)
+            return _extract_text_from_docx(source)
         elif file_ext == '.xlsx':
-            return _extract_text_from_xlsx(file_path)
+            return _extract_text_from_xlsx(source)
         elif file_ext == '.pptx':
-            return _extract_text_from_pptx(file_path)
+            return _extract_text_from_pptx(source)
+        elif file_ext in PLAIN_TEXT_EXTENSIONS:
+            return _extract_text_from_plain(source)
         else:
-            raise ValueError(f"Unsupported file format: {file_ext}. Supported formats: PDF, DOCX, XLSX, PPTX")
+            raise ValueError(f"Unsupported file format: {file_ext}. Supported formats: PDF, DOCX, XLSX, PPTX, TXT, CSV, MD")
     
+    except ValueError:
+        raise
     except ImportError as e:
         raise ImportError(f"Required package not installed for {file_ext} extraction: {e}")
     except Exception as e:
         import traceback
-        print(f"Error extracting text from {file_path}: {e}\n{traceback.format_exc()}")
+        print(f"Error extracting text from {label}: {e}\n{traceback.format_exc()}")
         raise RuntimeError(f"Failed to extract text: {e}") from e
 
+def _extract_text_from_plain(source):
+    """Extract text from a plain text file (TXT, CSV, MD)."""
+    if hasattr(source, 'read'):
+        data = source.read()
+    else:
+        with open(source, 'rb') as f:
+            data = f.read()
+    return data.decode('utf-8', errors='replace')
+
 def _extract_text_from_pdf(file_path):
     """Extract text from a PDF file."""
     try:
@@ -310,17 +530,11 @@ def download_and_extract_text(path, select_user=None, cleanup=True, max_size_byt
         # Get metadata first to determine the file size
         local_path, is_truncated, total_size, too_large = download_file_with_size_limit(path, select_user, None, max_size_bytes)
         
-        # Handle case when file is too large to download
-        if too_large:
-            size_mb = total_size / (1024 * 1024)
-            error_message = f"This file is too large to process ({size_mb:.1f} MB exceeds the 5 MB limit). Please try a smaller file or a different approach."
-            return error_message, True, total_size, True
-            
         # Process the downloaded file
         text = extract_text(local_path)
         
         if is_truncated:
-            text += f"\n\n[NOTE: This is a partial extraction of the file. Only the first {max_size_bytes/1024/1024:.1f} MB of {total_size/1024/1024:.1f} MB total size was processed due to file size constraints.]"
+            text += f"\n\n[NOTE: This is a partial extraction of the file. Only the first {min(max_size_bytes, MAX_DOWNLOAD_SIZE)/1024/1024:.1f} MB of {total_size/1024/1024:.1f} MB total size was processed due to file size constraints.]"
         
         if cleanup:
             try:
@@ -1,7 +1,19 @@
 import os
 import dropbox
-import dropbox.common 
-from .dropbox_token_manager import get_access_token
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from .dropbox_client_context import run_with_dropbox_context
+from .tracing import span, bind
+
+# Constants
+TREE_MAX_DEPTH = 3  # Folder levels listed by list_tree
+TREE_MAX_ENTRIES = 5000  # Total entries list_tree collects before it stops
+TREE_MAX_WORKERS = 8  # Folders listed concurrently by list_tree
+
+# Result of list_tree. children maps each listed folder's path_lower ("" for the root)
+# to its entries; errors maps folders that could not be listed to the error message;
+# unexpanded holds path_lower of folders at the depth limit or skipped for the entry budget.
+FolderTree = namedtuple('FolderTree', ['root', 'children', 'errors', 'unexpanded', 'truncated'])
 
 # Renamed from files_list_folder
 def _files_list_folder_internal(dbx_client, path, **kwargs):
@@ -27,84 +39,16 @@ def _files_list_folder_continue_internal(dbx_client, cursor):
     """Internal function to continue listing using a pre-configured client."""
     return dbx_client.files_list_folder_continue(cursor)
 
-def list_folder_complete(path, select_user=None, **kwargs):
+def _run_listing_call(operation, path, select_user):
     """
-    Lists all contents of a folder on Dropbox, handling pagination automatically.
-    Determines the correct user context and path root based on Dropbox best practices.
-    
-    Args:
-        path (str): The path of the folder to list (relative to the determined root). 
-                    Use empty string "" for the root.
-        select_user (str, optional): Team member ID (e.g., "dbmid:...") to operate as. 
-                                     If None, operates as the admin linked to the token.
-        **kwargs: Additional arguments for files_list_folder (e.g., recursive=True). 
-                  Must match the API parameter names.
-        
-    Returns:
-        list: Complete list of all dropbox.files.Metadata entries in the folder.
-        
-    Raises:
-        dropbox.exceptions.ApiError: If the API request fails.
-        ValueError: If token is invalid or required info cannot be determined.
-        RuntimeError: For unexpected errors during the process.
+    Runs one listing API call through the cached Dropbox context and translates
+    failures into the errors documented for list_folder_complete.
     """
-    access_token = get_access_token()
-    if not access_token:
-        raise ValueError("Failed to obtain a valid access token")
-
-    dbx_team = dropbox.DropboxTeam(access_token)
-    member_id_to_use = select_user
-
     try:
-        # 1. Determine the Member ID context
-        if not member_id_to_use:
-            admin_info = dbx_team.team_token_get_authenticated_admin()
-            # Ensure we get the team_member_id, not just the user_id if different
-            if hasattr(admin_info.admin_profile, 'team_member_id'):
-                 member_id_to_use = admin_info.admin_profile.team_member_id
-            else:
-                 # Fallback or error, depending on API version/structure
-                 raise ValueError("Could not determine team_member_id for the authenticated admin.")
-        
-        # 2. Get user-specific context client
-        dbx_user_context = dbx_team.as_user(member_id_to_use)
-
-        # 3. Get account info to find the root namespace ID
-        account_info = dbx_user_context.users_get_current_account()
-        
-        if not hasattr(account_info, 'root_info') or not hasattr(account_info.root_info, 'root_namespace_id'):
-             raise ValueError("Could not determine root_namespace_id from user's account info.")
-             
-        root_namespace_id = account_info.root_info.root_namespace_id
-
-        # 4. Create the final client scoped to the correct root and user
-        team_path_root = dropbox.common.PathRoot.namespace_id(root_namespace_id)
-        # Apply path_root first, then user context for the final client
-        dbx_final_client = dbx_team.with_path_root(team_path_root).as_user(member_id_to_use)
-
-        # 5. Perform the listing using the configured client
-        # Pass only valid listing arguments from kwargs
-        listing_kwargs = {
-            k: v for k, v in kwargs.items() 
-            if k in ['recursive', 'include_media_info', 'include_deleted', 
-                     'include_has_explicit_shared_members', 'include_mounted_folders', 
-                     'limit', 'shared_link', 'include_property_groups', 
-                     'include_non_downloadable_files']
-        }
-        
-        # Fix: Convert "/" to "" for root path (Dropbox API requires empty string for root)
-        if path == "/":
-            path = ""
-            
-        result = _files_list_folder_internal(dbx_final_client, path, **listing_kwargs)
-        entries = result.entries
-        
-        # 6. Handle pagination
-        while result.has_more:
-            result = _files_list_folder_continue_internal(dbx_final_client, result.cursor)
-            entries.extend(result.entries)
-            
-        return entries
+        with span("dropbox.list_folder_page", path=path) as page_span:
+            result = run_with_dropbox_context(operation, select_user=select_user)
+            page_span.set(entries=len(result.entries), has_more=result.has_more)
+        return result
 
     except dropbox.exceptions.AuthError as e:
         raise ValueError(f"Authentication error: {e}. Check token validity and scopes.") from e
@@ -128,6 +72,9 @@ def list_folder_complete(path, select_user=None, **kwargs):
         print(f"  Error occurred during operation for path '{path}'.")
         raise # Re-raise the original ApiError
 
+    except ValueError:
+        # Token or context resolution failures already carry a descriptive message
+        raise
     except AttributeError as e:
         # Catch potential issues accessing nested attributes like root_info
         import traceback
@@ -139,6 +86,166 @@ def list_folder_complete(path, select_user=None, **kwargs):
         print(f"Unexpected Error: {e}\n{traceback.format_exc()}") # Log full traceback
         raise RuntimeError(f"An unexpected error occurred: {e}") from e
 
+def iter_folder_entries(path, select_user=None, max_entries=None, predicate=None, **kwargs):
+    """
+    Yields the contents of a folder on Dropbox page by page. The next page is only
+    requested once the caller has consumed the current one, so stopping early (or
+    reaching max_entries) saves the remaining files_list_folder_continue calls.
+    
+    Args:
+        path (str): The path of the folder to list (relative to the determined root). 
+                    Use empty string "" for the root.
+        select_user (str, optional): Team member ID (e.g., "dbmid:...") to operate as. 
+                                     If None, operates as the admin linked to the token.
+        max_entries (int, optional): Stop after yielding this many entries.
+        predicate (callable, optional): Only entries for which predicate(entry) is true
+                                        are yielded (and counted towards max_entries).
+        **kwargs: Additional arguments for files_list_folder (e.g., recursive=True, or
+                  limit for the page size). Must match the API parameter names.
+        
+    Yields:
+        dropbox.files.Metadata: Entries in the folder, in the order the API returns them.
+        
+    Raises:
+        dropbox.exceptions.ApiError: If the API request fails.
+        ValueError: If token is invalid or required info cannot be determined.
+        RuntimeError: For unexpected errors during the process.
+    """
+    # Pass only valid listing arguments from kwargs
+    listing_kwargs = {
+        k: v for k, v in kwargs.items() 
+        if k in ['recursive', 'include_media_info', 'include_deleted', 
+                 'include_has_explicit_shared_members', 'include_mounted_folders', 
+                 'limit', 'shared_link', 'include_property_groups', 
+                 'include_non_downloadable_files']
+    }
+    
+    # Fix: Convert "/" to "" for root path (Dropbox API requires empty string for root)
+    if path == "/":
+        path = ""
+
+    if max_entries is not None and max_entries <= 0:
+        return
+
+    # Each page is a separate call, so an auth retry repeats only that page; cursors
+    # stay valid across the refreshed client because user and root are unchanged
+    result = _run_listing_call(
+        lambda context: _files_list_folder_internal(context.client, path, **listing_kwargs),
+        path, select_user,
+    )
+    yielded = 0
+    while True:
+        for entry in result.entries:
+            if predicate is not None and not predicate(entry):
+                continue
+            yield entry
+            yielded += 1
+            if max_entries is not None and yielded >= max_entries:
+                return
+        if not result.has_more:
+            return
+        cursor = result.cursor
+        result = _run_listing_call(
+            lambda context: _files_list_folder_continue_internal(context.client, cursor),
+            path, select_user,
+        )
+
+def list_folder_complete(path, select_user=None, **kwargs):
+    """
+    Lists all contents of a folder on Dropbox, handling pagination automatically.
+    Uses the cached user context and path root from dropbox_client_context, so a
+    listing costs only the listing calls themselves once the context is resolved.
+    Use iter_folder_entries to process entries as pages arrive or to stop early.
+    
+    Args:
+        path (str): The path of the folder to list (relative to the determined root). 
+                    Use empty string "" for the root.
+        select_user (str, optional): Team member ID (e.g., "dbmid:...") to operate as. 
+                                     If None, operates as the admin linked to the token.
+        **kwargs: Additional arguments for files_list_folder (e.g., recursive=True). 
+                  Must match the API parameter names. max_entries and predicate are
+                  passed on to iter_folder_entries.
+        
+    Returns:
+        list: Complete list of all dropbox.files.Metadata entries in the folder.
+        
+    Raises:
+        dropbox.exceptions.ApiError: If the API request fails.
+        ValueError: If token is invalid or required info cannot be determined.
+        RuntimeError: For unexpected errors during the process.
+    """
+    return list(iter_folder_entries(path, select_user=select_user, **kwargs))
+
+def list_tree(path, select_user=None, max_depth=TREE_MAX_DEPTH, max_entries=TREE_MAX_ENTRIES, max_workers=TREE_MAX_WORKERS):
+    """
+    Lists a folder and its subfolders breadth-first, down to max_depth levels. All
+    folders on one level are listed concurrently on a bounded pool, so the wall time
+    grows with the depth rather than the number of folders.
+    
+    Args:
+        path (str): The folder to start from. Use "" or "/" for the root.
+        select_user (str, optional): Team member ID (e.g., "dbmid:...") to operate as.
+        max_depth (int): Number of folder levels to list (1 lists only path itself).
+        max_entries (int): Stop once this many entries have been collected.
+        max_workers (int): Maximum number of folders listed at the same time.
+        
+    Returns:
+        FolderTree: The listed folders and their entries. A folder that fails to list
+                    is recorded in errors instead of failing the whole walk; truncated
+                    is True if the entry budget cut the walk short.
+    """
+    root = "" if path in ("/", "") else path
+    children = {}
+    errors = {}
+    unexpanded = set()
+    truncated = False
+    remaining = max_entries
+    level = [(root, root.lower())]
+    depth = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="list-tree") as executor:
+        while level and remaining > 0:
+            depth += 1
+            if len(level) > remaining:
+                # Not even one entry per folder is left; the rest of the level stays unlisted
+                unexpanded.update(key for _, key in level[remaining:])
+                level = level[:remaining]
+                truncated = True
+            # Share what is left of the budget between the folders on this level
+            per_folder = max(1, remaining // len(level))
+            # One entry over the share tells a cut-off folder from one that has exactly per_folder entries
+            futures = [
+                (folder, key, executor.submit(bind(list_folder_complete), folder, select_user=select_user, max_entries=per_folder + 1))
+                for folder, key in level
+            ]
+            next_level = []
+            for folder, key, future in futures:
+                try:
+                    entries = future.result()
+                except Exception as e:
+                    if folder == root:
+                        raise
+                    errors[key] = str(e)
+                    continue
+                if len(entries) > per_folder:
+                    truncated = True
+                    entries = entries[:per_folder]
+                children[key] = entries
+                remaining -= len(entries)
+                for entry in entries:
+                    if isinstance(entry, dropbox.files.FolderMetadata):
+                        next_level.append((entry.path_display, entry.path_lower))
+
+            if depth >= max_depth or remaining <= 0:
+                # Folders at the depth limit are unexpanded by design, not cut off by the budget
+                if remaining <= 0 and next_level and depth < max_depth:
+                    truncated = True
+                unexpanded.update(key for _, key in next_level)
+                break
+            level = next_level
+
+    return FolderTree(root, children, errors, unexpanded, truncated)
+
 # Keep original names as wrappers for backward compatibility if needed,
 # but they are now essentially replaced by list_folder_complete.
 # Consider removing them if they aren't used elsewhere.
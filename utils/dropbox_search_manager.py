@@ -0,0 +1,80 @@
+import dropbox
+import logging
+from .dropbox_client_context import run_with_dropbox_context
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+SEARCH_PAGE_SIZE = 100  # Matches requested per files_search_v2 call (API maximum is 1000)
+SEARCH_MAX_RESULTS = 1000  # Upper bound on matches returned by one search
+
+
+def _search_options(path, filename_only, extensions, page_size):
+    """Builds SearchOptions for files_search_v2."""
+    # Dropbox search uses None (not "" or "/") for the root
+    if path in ("", "/"):
+        path = None
+    file_extensions = [ext.lstrip('.').lower() for ext in extensions] if extensions else None
+    return dropbox.files.SearchOptions(
+        path=path,
+        max_results=page_size,
+        filename_only=filename_only,
+        file_extensions=file_extensions,
+    )
+
+
+def search_files(query, select_user=None, path=None, filename_only=True, extensions=None, max_results=50):
+    """
+    Searches Dropbox server-side with files_search_v2, following files_search_continue_v2
+    cursors until max_results matches are collected. Runs through the cached user and
+    namespace context, like list_folder_complete, so results cover the team space.
+
+    Args:
+        query (str): Text to search for.
+        select_user (str, optional): Team member ID (e.g., "dbmid:...") to operate as.
+        path (str, optional): Only search under this folder.
+        filename_only (bool): True to match file and folder names only, False to also
+                              match file contents.
+        extensions (list, optional): File extensions to restrict to (e.g., ["pdf", "xlsx"]).
+        max_results (int): Maximum number of matches to return (at most SEARCH_MAX_RESULTS).
+
+    Returns:
+        list: dropbox.files.Metadata for each match, in the order Dropbox ranks them.
+
+    Raises:
+        ValueError: If the query is empty or authentication fails.
+        dropbox.exceptions.ApiError: If the search request fails.
+    """
+    if not query or not query.strip():
+        raise ValueError("A search query is required.")
+
+    max_results = max(1, min(int(max_results), SEARCH_MAX_RESULTS))
+    options = _search_options(path, filename_only, extensions, min(max_results, SEARCH_PAGE_SIZE))
+
+    def _collect(result, matches):
+        for match in result.matches:
+            if match.metadata.is_metadata():
+                matches.append(match.metadata.get_metadata())
+        return result
+
+    matches = []
+    try:
+        # Each page is a separate call so an auth retry repeats only that page
+        result = run_with_dropbox_context(
+            lambda context: context.client.files_search_v2(query.strip(), options=options),
+            select_user=select_user,
+        )
+        _collect(result, matches)
+        while result.has_more and len(matches) < max_results:
+            cursor = result.cursor
+            result = run_with_dropbox_context(
+                lambda context: context.client.files_search_continue_v2(cursor),
+                select_user=select_user,
+            )
+            _collect(result, matches)
+    except dropbox.exceptions.AuthError as e:
+        raise ValueError(f"Authentication error: {e}. Check token validity and scopes.") from e
+
+    logger.info(f"Dropbox search for '{query}' returned {len(matches[:max_results])} match(es)")
+    return matches[:max_results]
@@ -1,8 +1,24 @@
 import os
 import requests
 import webbrowser
+import threading
+import logging
 from dotenv import load_dotenv, set_key
 import time
+from .tracing import span
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+TOKEN_EXPIRY_MARGIN_SECONDS = 5 * 60  # Refresh this long before the token actually expires
+DEFAULT_TOKEN_LIFETIME_SECONDS = 4 * 60 * 60  # Dropbox short-lived token lifetime, used if expires_in is missing
+
+# In-process token cache shared by every thread. _token_lock also serializes refreshes,
+# so concurrent callers that find the token stale wait for a single refresh request.
+_token_lock = threading.Lock()
+_token_state = {'access_token': None, 'expires_at': 0.0, 'persisted_token': None}
+_token_stats = {'hits': 0, 'refreshes': 0, 'refresh_failures': 0, 'env_writes': 0}
 
 def load_env():
     """Load environment variables from .env file"""
@@ -71,10 +87,13 @@ def get_refresh_token():
         print(response.text)
         return None, None
 
-def get_access_token():
+def _request_new_access_token():
     """
-    Get a new access token using the refresh token.
+    Exchanges the refresh token for a new access token.
     If no refresh token exists, call get_refresh_token first.
+
+    Returns:
+        tuple: (str: access token or None, int: lifetime in seconds)
     """
     env_vars = load_env()
     refresh_token = env_vars['refresh_token']
@@ -85,9 +104,7 @@ def get_access_token():
     if not refresh_token:
         print("No refresh token found. Starting authorization process...")
         refresh_token, access_token = get_refresh_token()
-        if access_token:
-            return access_token
-        return None
+        return access_token, DEFAULT_TOKEN_LIFETIME_SECONDS
     
     # Use refresh token to get a new access token
     token_url = "https://api.dropbox.com/oauth2/token"
@@ -102,16 +119,65 @@ def get_access_token():
     
     if response.status_code == 200:
         token_data = response.json()
-        access_token = token_data.get('access_token')
-        
-        # Save new access token to .env
-        save_to_env('current_access_token', access_token)
-        
-        return access_token
+        return token_data.get('access_token'), token_data.get('expires_in') or DEFAULT_TOKEN_LIFETIME_SECONDS
     else:
         print(f"Error refreshing access token: {response.status_code}")
         print(response.text)
-        return None
+        return None, 0
+
+def get_access_token():
+    """
+    Get a valid access token, refreshing it only when needed.
+
+    The token is held in memory until TOKEN_EXPIRY_MARGIN_SECONDS before the expiry
+    reported by the OAuth endpoint. Concurrent callers that find it stale wait for
+    a single refresh instead of each sending their own. The .env file is only
+    rewritten when the token actually changes.
+
+    Returns:
+        str: The access token, or None if it could not be obtained.
+    """
+    with _token_lock:
+        if _token_state['access_token'] and time.time() < _token_state['expires_at'] - TOKEN_EXPIRY_MARGIN_SECONDS:
+            _token_stats['hits'] += 1
+            return _token_state['access_token']
+
+        with span("dropbox.token_refresh"):
+            access_token, expires_in = _request_new_access_token()
+        if not access_token:
+            _token_stats['refresh_failures'] += 1
+            return None
+
+        _token_stats['refreshes'] += 1
+        _token_state['access_token'] = access_token
+        _token_state['expires_at'] = time.time() + expires_in
+        logger.info(f"Refreshed Dropbox access token, valid for {expires_in} seconds")
+
+        # Save new access token to .env only if it differs from what is already there
+        if access_token != _token_state['persisted_token']:
+            save_to_env('current_access_token', access_token)
+            _token_state['persisted_token'] = access_token
+            _token_stats['env_writes'] += 1
+
+        return access_token
+
+def invalidate_access_token():
+    """Marks the cached access token as expired so the next call refreshes it (e.g., after an auth error)."""
+    with _token_lock:
+        _token_state['expires_at'] = 0.0
+
+def get_token_stats():
+    """
+    Returns counters for the in-process token cache.
+
+    Returns:
+        dict: hits, refreshes, refresh_failures, env_writes and the seconds left
+              before the cached token is due for refresh.
+    """
+    with _token_lock:
+        stats = dict(_token_stats)
+        stats['seconds_until_refresh'] = max(0, int(_token_state['expires_at'] - TOKEN_EXPIRY_MARGIN_SECONDS - time.time()))
+    return stats
 
 def test_access_token(access_token):
     """Test if the access token is valid by making a team API call"""
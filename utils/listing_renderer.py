@@ -0,0 +1,222 @@
+import threading
+import time
+import uuid
+import logging
+from collections import Counter, OrderedDict
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+LISTING_PAGE_SIZE = 100  # Entries shown per page
+LISTING_MAX_CHARS = 8000  # Upper bound on the text of one page
+LISTING_TOP_FILES = 10  # Newest and largest files shown in the overview
+LISTING_TOP_EXTENSIONS = 15  # Extensions counted individually in the overview
+TREE_MAX_CHARS = 8000  # Upper bound on the text of a tree digest
+TREE_FILES_PER_FOLDER = 5  # File names shown under each folder in a tree digest
+PAGE_TOKEN_TTL_SECONDS = 15 * 60  # How long the model can keep paging through a listing
+PAGE_TOKEN_MAX_COUNT = 200  # Page tokens kept at once; the oldest are dropped first
+
+# page_token -> (created_at, folder_path, rows, offset of the next page); pages of
+# one listing share its rows list
+_pages_lock = threading.Lock()
+_pages = OrderedDict()
+
+
+def _to_row(entry):
+    """Reduces a Dropbox metadata entry to the fields the renderer needs."""
+    kind = entry.__class__.__name__.replace('Metadata', '') or 'Unknown'
+    path = getattr(entry, 'path_display', None) or getattr(entry, 'name', 'Unknown')
+    modified = getattr(entry, 'server_modified', None)
+    return {
+        'kind': kind,
+        'path': path,
+        'name': getattr(entry, 'name', path),
+        'size': getattr(entry, 'size', None),
+        'modified': modified.isoformat() if modified else None,
+    }
+
+
+def _extension(name):
+    return name.rsplit('.', 1)[-1].lower() if '.' in name else '(none)'
+
+
+def _format_row(row):
+    if row['kind'] == 'File':
+        return f"[File] {row['path']} ({(row['size'] or 0) / 1024:.1f} KB, modified {row['modified']})"
+    return f"[{row['kind']}] {row['path']}"
+
+
+def _store_remaining(folder_path, rows, offset):
+    """Remembers where the next page starts and returns a token for fetching it."""
+    token = uuid.uuid4().hex[:12]
+    now = time.monotonic()
+    with _pages_lock:
+        for key in [k for k, page in _pages.items() if now - page[0] > PAGE_TOKEN_TTL_SECONDS]:
+            del _pages[key]
+        while len(_pages) >= PAGE_TOKEN_MAX_COUNT:
+            _pages.popitem(last=False)
+        _pages[token] = (now, folder_path, rows, offset)
+    return token
+
+
+def _render_page(folder_path, rows, offset, page_size):
+    """Renders up to page_size rows from offset within LISTING_MAX_CHARS, plus a continuation token if rows remain."""
+    lines = []
+    used = 0
+    shown = 0
+    for row in rows[offset:offset + page_size]:
+        line = _format_row(row)
+        if shown and used + len(line) + 1 > LISTING_MAX_CHARS:
+            break
+        lines.append(line)
+        used += len(line) + 1
+        shown += 1
+
+    remaining = len(rows) - offset - shown
+    if remaining:
+        token = _store_remaining(folder_path, rows, offset + shown)
+        lines.append(f"... {remaining} more entries. Call list_folder_contents with page_token=\"{token}\" to see the next page.")
+    else:
+        lines.append("End of listing.")
+    return lines
+
+
+def render_listing(entries, folder_path, page_size=LISTING_PAGE_SIZE, description=None):
+    """
+    Renders a folder listing for the model with bounded size, however large the folder.
+    Starts with an overview (counts by type and extension, newest and largest files),
+    followed by the first page of entries, folders first. If entries remain, the text
+    ends with a page_token for render_listing_page.
+
+    Args:
+        entries (list): dropbox.files.Metadata entries, e.g. from list_folder_complete.
+        folder_path (str): The listed folder, used in headings.
+        page_size (int): Maximum number of entries on the first page.
+        description (str, optional): What the entries are, if not the whole folder
+                                     (e.g. "the first 100 entries matching 'budget'").
+
+    Returns:
+        str: The rendered listing.
+    """
+    rows = [_to_row(entry) for entry in entries]
+    if not rows:
+        return f"No {description} in folder '{folder_path}'." if description else f"Folder '{folder_path}' is empty."
+
+    kinds = Counter(row['kind'] for row in rows)
+    files = [row for row in rows if row['kind'] == 'File']
+    extensions = Counter(_extension(row['name']) for row in files)
+    total_size = sum(row['size'] or 0 for row in files)
+
+    lines = [
+        (f"Folder '{folder_path}', {description}: {len(rows)} entries: " if description else f"Folder '{folder_path}' contains {len(rows)} entries: ")
+        + ", ".join(f"{count} {kind.lower()}(s)" for kind, count in kinds.most_common())
+        + f"; {total_size / (1024 * 1024):.1f} MB in files."
+    ]
+    if extensions:
+        top = extensions.most_common(LISTING_TOP_EXTENSIONS)
+        other = sum(extensions.values()) - sum(count for _, count in top)
+        lines.append("File types: " + ", ".join(f"{ext}: {count}" for ext, count in top) + (f", other: {other}" if other else ""))
+    if len(files) > LISTING_TOP_FILES:
+        lines.append("Newest files:")
+        lines.extend("  " + _format_row(row) for row in sorted(files, key=lambda r: r['modified'] or '', reverse=True)[:LISTING_TOP_FILES])
+        lines.append("Largest files:")
+        lines.extend("  " + _format_row(row) for row in sorted(files, key=lambda r: r['size'] or 0, reverse=True)[:LISTING_TOP_FILES])
+
+    lines.append("Entries:")
+    rows.sort(key=lambda r: (r['kind'] != 'Folder', r['path'].lower()))
+    lines.extend(_render_page(folder_path, rows, 0, page_size))
+    return "\n".join(lines)
+
+
+def render_listing_page(page_token, page_size=LISTING_PAGE_SIZE):
+    """
+    Renders the next page of a listing started by render_listing.
+
+    Args:
+        page_token (str): Token from the end of the previous page.
+        page_size (int): Maximum number of entries on this page.
+
+    Returns:
+        str: The rendered page.
+
+    Raises:
+        ValueError: If the token is unknown or has expired.
+    """
+    with _pages_lock:
+        page = _pages.get(page_token)
+    if page is None or time.monotonic() - page[0] > PAGE_TOKEN_TTL_SECONDS:
+        raise ValueError(f"Page token '{page_token}' is unknown or has expired; list the folder again.")
+
+    _, folder_path, rows, offset = page
+    lines = [f"Folder '{folder_path}', continued from entry {offset + 1} of {len(rows)}:"]
+    lines.extend(_render_page(folder_path, rows, offset, page_size))
+    return "\n".join(lines)
+
+
+def _summarize_files(files):
+    """One-line summary of a folder's files: count, main extensions and total size."""
+    extensions = Counter(_extension(row['name']) for row in files)
+    top = ", ".join(f"{count} {ext}" for ext, count in extensions.most_common(3))
+    size = sum(row['size'] or 0 for row in files)
+    return f"{len(files)} file(s) ({top}; {size / (1024 * 1024):.1f} MB)"
+
+
+def render_tree(tree):
+    """
+    Renders a FolderTree from list_tree as an indented digest: one line per folder with
+    a summary of its files and the names of a few of them, within TREE_MAX_CHARS.
+
+    Args:
+        tree (FolderTree): Result of dropbox_folder_manager.list_tree.
+
+    Returns:
+        str: The rendered digest.
+    """
+    lines = []
+    used = 0
+    cut = False
+
+    def _add(line):
+        nonlocal used, cut
+        if used + len(line) + 1 > TREE_MAX_CHARS:
+            cut = True
+            return False
+        lines.append(line)
+        used += len(line) + 1
+        return True
+
+    total = sum(len(entries) for entries in tree.children.values())
+    _add(f"Tree of '{tree.root or '/'}': {len(tree.children)} folder(s) listed, {total} entries"
+         + (" (entry budget reached; some folders are incomplete)" if tree.truncated else "") + ".")
+
+    # Depth-first over the breadth-first results, folders before files
+    stack = [(tree.root.lower(), tree.root or "/", 0)]
+    while stack and not cut:
+        key, display, depth = stack.pop()
+        indent = "  " * depth
+        if key in tree.errors:
+            _add(f"{indent}{display.rstrip('/')}/ (could not list: {tree.errors[key]})")
+            continue
+        if key not in tree.children:
+            _add(f"{indent}{display.rstrip('/')}/ (not expanded)")
+            continue
+
+        rows = [_to_row(entry) for entry in tree.children[key]]
+        files = sorted((row for row in rows if row['kind'] == 'File'), key=lambda r: r['name'].lower())
+        folders = sorted((entry for entry in tree.children[key] if entry.__class__.__name__ == 'FolderMetadata'),
+                         key=lambda e: e.name.lower())
+        summary = _summarize_files(files) if files else "no files"
+        if not _add(f"{indent}{display.rstrip('/')}/ - {len(folders)} subfolder(s), {summary}"):
+            break
+        for row in files[:TREE_FILES_PER_FOLDER]:
+            if not _add(f"{indent}  {row['name']}"):
+                break
+        if len(files) > TREE_FILES_PER_FOLDER:
+            _add(f"{indent}  ... {len(files) - TREE_FILES_PER_FOLDER} more file(s)")
+        for entry in reversed(folders):
+            stack.append((entry.path_lower, entry.name, depth + 1))
+
+    if cut:
+        lines.append("... digest truncated; use list_folder_tree on a subfolder or list_folder_contents for details.")
+    return "\n".join(lines)
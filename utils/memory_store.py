@@ -0,0 +1,210 @@
+import os
+import re
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+from .context_window import count_text_tokens
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+MEMORY_DB_PATH = os.path.join("agent", "memory.db")
+LEGACY_MEMORY_PATH = os.path.join("agent", "running_memory.txt")  # Imported once into the store
+MEMORY_TOP_K = 8  # Memories injected into a prompt
+MEMORY_TOKEN_BUDGET = 1500  # Tokens of memories injected into a prompt
+MEMORY_SIMILARITY_THRESHOLD = 0.8  # Word overlap at which a memory about the same folder replaces an older one
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memories (
+    id INTEGER PRIMARY KEY,
+    content TEXT NOT NULL,
+    normalized TEXT NOT NULL UNIQUE,
+    path_key TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_memories_path_key ON memories(path_key);
+CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
+    content,
+    path_key,
+    tokenize = 'porter unicode61'
+);
+"""
+
+# Words too common in memories to help ranking
+_STOPWORDS = {
+    'the', 'and', 'for', 'are', 'was', 'with', 'that', 'this', 'from', 'file', 'files',
+    'folder', 'folders', 'contains', 'looking', 'find', 'where', 'can', 'you', 'have', 'any',
+}
+
+_TIMESTAMP_PREFIX = re.compile(r"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\]\s*")
+_QUOTED_PATH = re.compile(r"""['"`](/[^'"`]+)['"`]""")
+
+_import_lock = threading.Lock()
+_imported = False
+
+
+def normalize_memory(text):
+    """Normalizes a memory for duplicate detection: no timestamp prefix, case or extra whitespace."""
+    text = _TIMESTAMP_PREFIX.sub("", text.strip())
+    return re.sub(r"\s+", " ", text).strip().rstrip(".").lower()
+
+
+def memory_path_key(text):
+    """
+    Returns the folder a memory is about: the first quoted Dropbox path in it, with a
+    file name reduced to its folder. Lower-cased, without a trailing slash.
+    """
+    match = _QUOTED_PATH.search(text)
+    if not match:
+        return None
+    path = match.group(1).rstrip("/")
+    if os.path.splitext(path)[1]:
+        path = os.path.dirname(path)
+    return path.lower() or "/"
+
+
+def _words(text):
+    return set(re.findall(r"\w+", text.lower()))
+
+
+def _connect():
+    conn = sqlite3.connect(MEMORY_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    _import_legacy_memories(conn)
+    return conn
+
+
+def _import_legacy_memories(conn):
+    """Imports agent/running_memory.txt the first time the store is opened and is still empty."""
+    global _imported
+    with _import_lock:
+        if _imported:
+            return
+        _imported = True
+        if conn.execute("SELECT 1 FROM memories LIMIT 1").fetchone() or not os.path.exists(LEGACY_MEMORY_PATH):
+            return
+        with open(LEGACY_MEMORY_PATH, "r") as f:
+            lines = [line.strip() for line in f if line.strip()]
+        stored = 0
+        for line in lines:
+            match = _TIMESTAMP_PREFIX.match(line)
+            timestamp = match.group(1) if match else None
+            if _store(conn, _TIMESTAMP_PREFIX.sub("", line), timestamp) != "duplicate":
+                stored += 1
+        conn.commit()
+        logger.info(f"Imported {stored} of {len(lines)} memories from {LEGACY_MEMORY_PATH}")
+
+
+def _store(conn, content, timestamp=None):
+    """Inserts or updates one memory. Returns "stored", "updated" or "duplicate"."""
+    content = content.strip()
+    normalized = normalize_memory(content)
+    timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if conn.execute("SELECT 1 FROM memories WHERE normalized = ?", (normalized,)).fetchone():
+        return "duplicate"
+
+    path_key = memory_path_key(content)
+    if path_key:
+        # A near-identical memory about the same folder is replaced with the newer wording
+        words = _words(normalized)
+        for row in conn.execute("SELECT id, normalized FROM memories WHERE path_key = ?", (path_key,)).fetchall():
+            other = _words(row['normalized'])
+            if words and other and len(words & other) / len(words | other) >= MEMORY_SIMILARITY_THRESHOLD:
+                conn.execute("UPDATE memories SET content = ?, normalized = ?, updated_at = ? WHERE id = ?",
+                             (content, normalized, timestamp, row['id']))
+                conn.execute("UPDATE memories_fts SET content = ? WHERE rowid = ?", (content, row['id']))
+                return "updated"
+
+    cursor = conn.execute(
+        "INSERT INTO memories (content, normalized, path_key, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+        (content, normalized, path_key, timestamp, timestamp),
+    )
+    conn.execute("INSERT INTO memories_fts (rowid, content, path_key) VALUES (?, ?, ?)", (cursor.lastrowid, content, path_key or ""))
+    return "stored"
+
+
+def store_memory(content):
+    """
+    Stores a memory unless an identical one (ignoring case, whitespace and timestamps)
+    exists. A very similar memory about the same folder is updated instead of duplicated.
+
+    Args:
+        content (str): The memory text.
+
+    Returns:
+        str: "stored", "updated" or "duplicate".
+    """
+    if not content or not content.strip():
+        raise ValueError("Memory content is empty.")
+    conn = _connect()
+    try:
+        result = _store(conn, content)
+        conn.commit()
+    finally:
+        conn.close()
+    return result
+
+
+def _fts_query(query):
+    terms = [term for term in re.findall(r"\w+", query.lower()) if len(term) > 2 and term not in _STOPWORDS]
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def retrieve_memories(query=None, k=MEMORY_TOP_K, token_budget=MEMORY_TOKEN_BUDGET):
+    """
+    Returns the memories most relevant to query, ranked by BM25, stopping at k memories
+    or token_budget tokens. Without a query (or without matches) the newest memories
+    are returned.
+
+    Args:
+        query (str, optional): Text to match, usually the user's request.
+        k (int): Maximum number of memories.
+        token_budget (int): Maximum total tokens of the returned memories.
+
+    Returns:
+        list: dicts with content and updated_at, most relevant first.
+    """
+    conn = _connect()
+    try:
+        rows = []
+        fts_query = _fts_query(query or "")
+        if fts_query:
+            rows = conn.execute(
+                "SELECT m.content, m.updated_at FROM memories_fts JOIN memories m ON m.id = memories_fts.rowid "
+                "WHERE memories_fts MATCH ? ORDER BY bm25(memories_fts) LIMIT ?",
+                (fts_query, k),
+            ).fetchall()
+        if not rows:
+            rows = conn.execute("SELECT content, updated_at FROM memories ORDER BY updated_at DESC LIMIT ?", (k,)).fetchall()
+    finally:
+        conn.close()
+
+    selected = []
+    used = 0
+    for row in rows:
+        tokens = count_text_tokens(row['content'])
+        if used + tokens > token_budget:
+            continue
+        selected.append({'content': row['content'], 'updated_at': row['updated_at']})
+        used += tokens
+    return selected
+
+
+def get_memory_stats():
+    """
+    Returns the size of the memory store.
+
+    Returns:
+        dict: memories and folders (distinct path keys).
+    """
+    conn = _connect()
+    try:
+        memories, folders = conn.execute("SELECT COUNT(*), COUNT(DISTINCT path_key) FROM memories").fetchone()
+    finally:
+        conn.close()
+    return {'memories': memories, 'folders': folders}
@@ -0,0 +1,391 @@
+import os
+import sqlite3
+import threading
+import time
+import logging
+import dropbox
+from .dropbox_client_context import run_with_dropbox_context
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+# Keep the index next to the project (like .env), not relative to the working directory
+INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'index')
+INDEX_DB_PATH = os.path.join(INDEX_DIR, 'dropbox_index.db')
+INDEX_MAX_AGE_SECONDS = 60  # Searches trigger an incremental sync if the last one is older than this
+LIST_PAGE_LIMIT = 2000  # Entries per files_list_folder page during a crawl
+LONGPOLL_TIMEOUT_SECONDS = 120  # How long the watcher waits for changes per longpoll request
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY,
+    path_lower TEXT UNIQUE NOT NULL,
+    path_display TEXT NOT NULL,
+    name TEXT NOT NULL,
+    name_lower TEXT NOT NULL,
+    is_folder INTEGER NOT NULL,
+    extension TEXT,
+    size INTEGER,
+    server_modified TEXT,
+    content_hash TEXT,
+    rev TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_files_name_lower ON files(name_lower);
+CREATE INDEX IF NOT EXISTS idx_files_extension ON files(extension);
+CREATE INDEX IF NOT EXISTS idx_files_server_modified ON files(server_modified);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Only one sync may run at a time; searches never take this lock
+_sync_lock = threading.Lock()
+# Set while the watcher's longpoll is waiting. Any change would end the longpoll and
+# trigger a sync, so while it is set the index is current and no sync is needed.
+_longpoll_active = threading.Event()
+# First crawl started by a search when the watcher is not running
+_background_sync_lock = threading.Lock()
+_background_sync = None
+
+
+def connect_index():
+    """Opens a connection to the index database, creating the schema if needed."""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    conn = sqlite3.connect(INDEX_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    # WAL lets searches read while a sync is writing
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _get_state(conn, key):
+    row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else None
+
+
+def _set_state(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value))
+
+
+def _apply_entries(conn, entries):
+    """Writes one page of listing results (files, folders and deletions) to the index."""
+    for entry in entries:
+        if isinstance(entry, dropbox.files.DeletedMetadata):
+            # A deleted folder removes everything below it as well
+            conn.execute(
+                "DELETE FROM files WHERE path_lower = ? OR path_lower LIKE ? ESCAPE '\\'",
+                (entry.path_lower, _escape_like(entry.path_lower) + "/%"),
+            )
+            continue
+
+        is_folder = isinstance(entry, dropbox.files.FolderMetadata)
+        server_modified = getattr(entry, 'server_modified', None)
+        extension = None if is_folder else os.path.splitext(entry.name)[1].lower().lstrip('.') or None
+        # Paths are unique, so drop any stale row for this path that has a different id
+        conn.execute("DELETE FROM files WHERE path_lower = ? AND id != ?", (entry.path_lower, entry.id))
+        conn.execute(
+            "INSERT OR REPLACE INTO files (id, path_lower, path_display, name, name_lower, is_folder, extension, size, server_modified, content_hash, rev) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                entry.id,
+                entry.path_lower,
+                entry.path_display,
+                entry.name,
+                entry.name.lower(),
+                int(is_folder),
+                extension,
+                getattr(entry, 'size', None),
+                server_modified.isoformat() if server_modified else None,
+                getattr(entry, 'content_hash', None),
+                getattr(entry, 'rev', None),
+            ),
+        )
+
+
+def _escape_like(value):
+    """Escapes LIKE wildcards so user input is matched literally."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def sync_index(select_user=None):
+    """
+    Brings the local metadata index up to date.
+
+    The first run crawls the whole tree with a recursive files_list_folder listing.
+    Later runs only fetch changes since the stored cursor via files_list_folder_continue.
+    The cursor is saved after every page, so an interrupted crawl resumes where it stopped.
+
+    Args:
+        select_user (str, optional): Team member ID to operate as. Defaults to None (admin context).
+
+    Returns:
+        int: Number of entries (including deletions) applied.
+
+    Raises:
+        dropbox.exceptions.ApiError: If a listing request fails.
+    """
+    with _sync_lock:
+        conn = connect_index()
+        try:
+            def _sync(context):
+                applied = 0
+                cursor = _get_state(conn, 'cursor')
+                if cursor:
+                    try:
+                        result = context.client.files_list_folder_continue(cursor)
+                    except dropbox.exceptions.ApiError as e:
+                        if not (hasattr(e.error, 'is_reset') and e.error.is_reset()):
+                            raise
+                        # Dropbox expired the cursor; start over with a full crawl
+                        logger.warning("Index cursor was reset by Dropbox, re-crawling from scratch...")
+                        conn.execute("DELETE FROM files")
+                        _set_state(conn, 'cursor', None)
+                        conn.commit()
+                        result = None
+                else:
+                    result = None
+
+                if result is None:
+                    logger.info("Crawling Dropbox to build the metadata index...")
+                    result = context.client.files_list_folder("", recursive=True, limit=LIST_PAGE_LIMIT)
+
+                while True:
+                    _apply_entries(conn, result.entries)
+                    applied += len(result.entries)
+                    _set_state(conn, 'cursor', result.cursor)
+                    conn.commit()
+                    if not result.has_more:
+                        break
+                    result = context.client.files_list_folder_continue(result.cursor)
+                return applied
+
+            applied = run_with_dropbox_context(_sync, select_user=select_user)
+            _set_state(conn, 'last_sync', str(time.time()))
+            conn.commit()
+            if applied:
+                logger.info(f"Metadata index sync applied {applied} entries")
+            return applied
+        finally:
+            conn.close()
+
+
+def get_index_age_seconds():
+    """
+    Returns how out of date the index may be, in seconds.
+
+    Returns:
+        float: 0 while the watcher is long-polling, otherwise the time since the last
+               sync, or None if the index has never been synced.
+    """
+    if _longpoll_active.is_set():
+        return 0.0
+    conn = connect_index()
+    try:
+        last_sync = _get_state(conn, 'last_sync')
+    finally:
+        conn.close()
+    return None if last_sync is None else time.time() - float(last_sync)
+
+
+def _sync_in_background(select_user=None):
+    """Starts sync_index in a daemon thread, unless a sync is already running."""
+    global _background_sync
+    with _background_sync_lock:
+        if _sync_lock.locked() or (_background_sync is not None and _background_sync.is_alive()):
+            return
+
+        def _run():
+            try:
+                sync_index(select_user=select_user)
+            except Exception as e:
+                logger.error(f"Background metadata index sync failed: {e}")
+
+        _background_sync = threading.Thread(target=_run, daemon=True, name="metadata-index-sync")
+        _background_sync.start()
+
+
+def ensure_index_fresh(max_age_seconds=INDEX_MAX_AGE_SECONDS, select_user=None):
+    """
+    Brings the index up to date where that is quick, without ever waiting for a full crawl.
+
+    If the index has never been completely built, the crawl runs in the background (or is
+    left to the one already running) and this returns at once. If the index is older than
+    max_age_seconds, an incremental sync runs now, unless another sync is already running.
+
+    Args:
+        max_age_seconds (int): Maximum acceptable age of the index in seconds.
+        select_user (str, optional): Team member ID to operate as.
+
+    Returns:
+        float: Age of the index in seconds afterwards, or None if it is still being built.
+    """
+    age = get_index_age_seconds()
+    if age is None:
+        _sync_in_background(select_user=select_user)
+        return None
+    if age > max_age_seconds and not _sync_lock.locked():
+        sync_index(select_user=select_user)
+        return 0.0
+    return age
+
+
+def get_indexed_file(path, max_age_seconds=INDEX_MAX_AGE_SECONDS):
+    """
+    Looks up one file in the index without any API call.
+
+    Args:
+        path (str): The path of the file in Dropbox.
+        max_age_seconds (int): Return None if the index is older than this, so callers
+                               fall back to a live metadata lookup.
+
+    Returns:
+        dict: path, name, size, server_modified, content_hash and rev, or None if the
+              file is not indexed or the index is too old to trust.
+    """
+    age = get_index_age_seconds()
+    if age is None or age > max_age_seconds:
+        return None
+    conn = connect_index()
+    try:
+        row = conn.execute(
+            "SELECT path_display, name, size, server_modified, content_hash, rev FROM files WHERE path_lower = ? AND is_folder = 0",
+            (path.lower(),),
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {
+        'path': row['path_display'],
+        'name': row['name'],
+        'size': row['size'],
+        'server_modified': row['server_modified'],
+        'content_hash': row['content_hash'],
+        'rev': row['rev'],
+    }
+
+
+def search_index(name=None, path_prefix=None, extension=None, min_size=None, max_size=None,
+                 modified_after=None, modified_before=None, is_folder=None, limit=50):
+    """
+    Queries the local metadata index. All filters are optional and combined with AND.
+
+    Args:
+        name (str, optional): Words that must all appear in the file or folder name (case-insensitive).
+        path_prefix (str, optional): Only return entries under this folder.
+        extension (str, optional): File extension without the dot (e.g., "pdf").
+        min_size (int, optional): Minimum file size in bytes.
+        max_size (int, optional): Maximum file size in bytes.
+        modified_after (str, optional): ISO date/time; only files modified at or after it.
+        modified_before (str, optional): ISO date/time; only files modified before it.
+        is_folder (bool, optional): True for folders only, False for files only.
+        limit (int): Maximum number of rows to return (default: 50).
+
+    Returns:
+        list: dicts with path, name, is_folder, size, server_modified and content_hash,
+              newest first.
+    """
+    limit = max(1, int(limit or 50))
+    clauses = []
+    params = []
+    for term in (name or "").lower().split():
+        clauses.append("name_lower LIKE ? ESCAPE '\\'")
+        params.append(f"%{_escape_like(term)}%")
+    if path_prefix and path_prefix.strip("/"):
+        clauses.append("path_lower LIKE ? ESCAPE '\\'")
+        params.append(_escape_like("/" + path_prefix.strip("/").lower()) + "/%")
+    if extension:
+        clauses.append("extension = ?")
+        params.append(extension.lower().lstrip("."))
+    if min_size is not None:
+        clauses.append("size >= ?")
+        params.append(min_size)
+    if max_size is not None:
+        clauses.append("size <= ?")
+        params.append(max_size)
+    if modified_after:
+        clauses.append("server_modified >= ?")
+        params.append(modified_after)
+    if modified_before:
+        clauses.append("server_modified < ?")
+        params.append(modified_before)
+    if is_folder is not None:
+        clauses.append("is_folder = ?")
+        params.append(int(is_folder))
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    query = (
+        "SELECT path_display, name, is_folder, size, server_modified, content_hash FROM files "
+        f"{where} ORDER BY is_folder DESC, server_modified DESC LIMIT ?"
+    )
+    params.append(limit)
+
+    conn = connect_index()
+    try:
+        rows = conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+    return [
+        {
+            'path': row['path_display'],
+            'name': row['name'],
+            'is_folder': bool(row['is_folder']),
+            'size': row['size'],
+            'server_modified': row['server_modified'],
+            'content_hash': row['content_hash'],
+        }
+        for row in rows
+    ]
+
+
+def watch_index(stop_event=None, select_user=None):
+    """
+    Keeps the index fresh by long-polling Dropbox for changes and syncing when they arrive.
+    Blocks until stop_event is set; run it in a background thread (see start_index_watcher).
+
+    Args:
+        stop_event (threading.Event, optional): Set it to stop the watcher.
+        select_user (str, optional): Team member ID to operate as.
+    """
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        try:
+            sync_index(select_user=select_user)
+            conn = connect_index()
+            try:
+                cursor = _get_state(conn, 'cursor')
+            finally:
+                conn.close()
+
+            def _longpoll(context):
+                return context.client.files_list_folder_longpoll(cursor, timeout=LONGPOLL_TIMEOUT_SECONDS)
+
+            _longpoll_active.set()
+            try:
+                result = run_with_dropbox_context(_longpoll, select_user=select_user)
+            finally:
+                _longpoll_active.clear()
+            if result.backoff:
+                stop_event.wait(result.backoff)
+        except Exception as e:
+            logger.error(f"Metadata index watcher error: {e}")
+            stop_event.wait(LONGPOLL_TIMEOUT_SECONDS)
+
+
+def start_index_watcher(select_user=None):
+    """
+    Starts watch_index in a daemon thread.
+
+    Args:
+        select_user (str, optional): Team member ID to operate as.
+
+    Returns:
+        threading.Event: Set it to stop the watcher.
+    """
+    stop_event = threading.Event()
+    thread = threading.Thread(target=watch_index, args=(stop_event, select_user), daemon=True, name="metadata-index-watcher")
+    thread.start()
+    return stop_event
@@ -1,9 +1,19 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import os
 from pathlib import Path
-import base64
-from utils.tools import check_file_contents, list_folder_contents, store_important_memory, end_conversation
+import binascii
+import mimetypes
+from utils.tools import check_file_contents, list_folder_contents, list_folder_tree, search_dropbox, search_file_index, search_file_text, store_important_memory, end_conversation
+from utils.context_window import fit_history_to_budget
+from utils.tracing import span, bind, current_span
+from utils.cassette import wrap_openai_client, recording_turn
 import json
+import time
+import logging
+import asyncio
+import threading
+import concurrent.futures
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
 
 # Get the parent directory of the current file
 current_dir = Path(__file__).parent
@@ -15,7 +25,41 @@ load_dotenv(env_path)
 
 print("Loaded OPENAI_API_KEY:", os.getenv("OPENAI_API_KEY"))
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Wrapped in recording proxies when AGENT_CASSETTE is set (see utils/cassette.py)
+client = wrap_openai_client(OpenAI(api_key=os.getenv("OPENAI_API_KEY")))
+async_client = wrap_openai_client(AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")), is_async=True)
+
+logger = logging.getLogger(__name__)
+
+# Turns run on the asyncio engine (handle_conversation_async) unless AGENT_ASYNC_ENGINE=0
+USE_ASYNC_ENGINE = os.getenv("AGENT_ASYNC_ENGINE", "1") == "1"
+# Async turns running at once on the agent loop; more wait for a free slot
+AGENT_MAX_CONCURRENT_TURNS = int(os.getenv("AGENT_MAX_CONCURRENT_TURNS", "100"))
+# Set AGENT_STREAM=0 to have the CLI and Slack bot wait for whole responses instead of streaming them
+STREAM_RESPONSES = os.getenv("AGENT_STREAM", "1") == "1"
+_agent_loop = None
+_agent_loop_lock = threading.Lock()
+_turn_slots = None  # asyncio.Semaphore of AGENT_MAX_CONCURRENT_TURNS, created on the agent loop
+
+# Tool calls run concurrently on this shared, bounded pool (also used by the async engine).
+# Sized for every Slack worker (AGENT_MAX_WORKERS) running a few tools at once.
+TOOL_CALLS_PER_TURN = 4
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", str(TOOL_CALLS_PER_TURN * int(os.getenv("AGENT_MAX_WORKERS", "8")))))
+TOOL_QUEUE_TIMEOUT_SECONDS = 30  # How long a tool call may wait for a free worker before it is given up
+DEFAULT_TOOL_TIMEOUT_SECONDS = 60
+TOOL_TIMEOUT_SECONDS = {
+    "check_file_contents": 180,  # Download plus a model call
+    "list_folder_contents": 120,  # Recursive listings can take many pages
+    "list_folder_tree": 120,
+}
+_tool_executor = concurrent.futures.ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="tool")
+# Tool calls that timed out but are still running (and holding a worker) {future: (tool_name, started)}
+_abandoned_lock = threading.Lock()
+_abandoned_tools = {}
+
+# Token usage reported by the API, summed over all model steps
+_usage_lock = threading.Lock()
+_usage_stats = {'steps': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0}
 
 # OpenAI function calling tools array
 tools = [
@@ -23,13 +67,13 @@ tools = [
         "type": "function",
         "function": {
             "name": "check_file_contents",
-            "description": "Downloads a file from Dropbox and summarizes its content using the OpenAI API. Files larger than 5MB cannot be processed. Provides specific summaries for Excel files (.xlsx, .xls).",
+            "description": "Downloads a file from Dropbox and summarizes its content using the OpenAI API. For large files only the first max_size_bytes are analyzed. Provides specific summaries for Excel files (.xlsx, .xls).",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "dropbox_path": {"type": "string", "description": "The path to the file in Dropbox."},
                     "select_user": {"type": ["string", "null"], "description": "Team member ID to operate as. Optional."},
-                    "max_size_bytes": {"type": "integer", "description": "Maximum file size to download in bytes (default: 1MB). Files over 5MB will not be downloaded at all.", "default": 1048576}
+                    "max_size_bytes": {"type": "integer", "description": "Maximum number of bytes to download and analyze (default: 1MB, at most 5MB). Larger files are read partially.", "default": 1048576}
                 },
                 "required": ["dropbox_path"]
             }
@@ -39,18 +83,94 @@ tools = [
         "type": "function",
         "function": {
             "name": "list_folder_contents",
-            "description": "Lists all contents of a Dropbox folder given its path.",
+            "description": "Lists the contents of a Dropbox folder given its path. Returns an overview (counts by type and extension, newest and largest files) and the first page of entries, folders first. If more entries remain, the result ends with a page_token; call again with it to see the next page.",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "dropbox_path": {"type": "string", "description": "The path to the folder in Dropbox to list."},
                     "select_user": {"type": ["string", "null"], "description": "Team member ID to operate as. Optional."},
-                    "recursive": {"type": "boolean", "description": "Whether to list subfolders recursively. Optional.", "default": False}
+                    "recursive": {"type": "boolean", "description": "Whether to list subfolders recursively. Optional.", "default": False},
+                    "page_token": {"type": "string", "description": "Token from the end of a previous result, to get the next page of that listing. Optional."},
+                    "name_contains": {"type": "string", "description": "Only list entries whose name contains this text (case-insensitive). Listing stops as soon as enough matches are found, so this is much faster than a full recursive listing. Optional."},
+                    "max_entries": {"type": "integer", "description": "Stop listing after this many (matching) entries. Optional."}
+                },
+                "required": ["dropbox_path"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "list_folder_tree",
+            "description": "Shows the folder structure under a Dropbox path several levels deep in one call: each folder with its subfolder count, a summary of its files and a few file names. Use it to get oriented in an unfamiliar area instead of listing folders one at a time.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "dropbox_path": {"type": "string", "description": "The folder to start from. Use \"\" for the root."},
+                    "max_depth": {"type": "integer", "description": "Number of folder levels to show (default: 3, at most 5).", "default": 3},
+                    "select_user": {"type": ["string", "null"], "description": "Team member ID to operate as. Optional."}
                 },
                 "required": ["dropbox_path"]
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_dropbox",
+            "description": "Searches Dropbox itself for files and folders by name, or by name and content. Use it when the local index has no match or may be out of date, or to search inside file contents Dropbox has indexed.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "Text to search for."},
+                    "path": {"type": ["string", "null"], "description": "Only search under this folder. Optional."},
+                    "filename_only": {"type": "boolean", "description": "True to match names only, false to also match file contents.", "default": True},
+                    "extensions": {"type": "array", "items": {"type": "string"}, "description": "File extensions without the dot, e.g. [\"pdf\", \"xlsx\"]. Optional."},
+                    "max_results": {"type": "integer", "description": "Maximum number of results (default: 25).", "default": 25},
+                    "select_user": {"type": ["string", "null"], "description": "Team member ID to operate as. Optional."}
+                },
+                "required": ["query"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_file_index",
+            "description": "Searches a local index of every file and folder in Dropbox by name, folder, extension, size and modified date. Much faster than listing folders one by one; try this first when the user remembers part of a name, the file type or roughly when it changed.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": ["string", "null"], "description": "Words that must all appear in the file or folder name (case-insensitive). Optional."},
+                    "path_prefix": {"type": ["string", "null"], "description": "Only search under this folder path. Optional."},
+                    "extension": {"type": ["string", "null"], "description": "File extension without the dot, e.g. 'pdf' or 'xlsx'. Optional."},
+                    "min_size": {"type": ["integer", "null"], "description": "Minimum file size in bytes. Optional."},
+                    "max_size": {"type": ["integer", "null"], "description": "Maximum file size in bytes. Optional."},
+                    "modified_after": {"type": ["string", "null"], "description": "ISO date, e.g. '2024-01-31'. Only files modified on or after this date. Optional."},
+                    "modified_before": {"type": ["string", "null"], "description": "ISO date. Only files modified before this date. Optional."},
+                    "is_folder": {"type": ["boolean", "null"], "description": "True to return only folders, False for only files. Optional."},
+                    "limit": {"type": ["integer", "null"], "description": "Maximum number of results (default 50, at most 500). Optional.", "default": 50}
+                },
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_file_text",
+            "description": "Full-text search over the contents of indexed documents (PDF, Word, Excel, PowerPoint, text/CSV). Returns ranked paths with snippets. Use it when the user remembers what a document says rather than its name; much faster than opening candidates with check_file_contents.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "Words to look for in document contents."},
+                    "path_prefix": {"type": ["string", "null"], "description": "Only search documents under this folder path. Optional."},
+                    "limit": {"type": ["integer", "null"], "description": "Maximum number of results (default 10, at most 50). Optional.", "default": 10}
+                },
+                "required": ["query"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -81,6 +201,106 @@ tools = [
     }
 ]
 
+BASE64_CHUNK_SIZE = 3 * 64 * 1024  # Multiple of 3 so chunks encode without padding
+
+def _encode_data_url(data, mime_type):
+    """
+    Base64-encodes bytes into a data URL chunk by chunk, writing into one preallocated
+    buffer instead of building intermediate copies of the whole payload.
+
+    Args:
+        data (bytes-like): The raw file bytes (bytes, bytearray or memoryview).
+        mime_type (str): MIME type for the data URL.
+
+    Returns:
+        str: The data URL.
+    """
+    view = memoryview(data)
+    prefix = f"data:{mime_type};base64,".encode("ascii")
+    encoded = bytearray(len(prefix) + 4 * ((len(view) + 2) // 3))
+    encoded[:len(prefix)] = prefix
+    pos = len(prefix)
+    for start in range(0, len(view), BASE64_CHUNK_SIZE):
+        chunk = binascii.b2a_base64(view[start:start + BASE64_CHUNK_SIZE], newline=False)
+        encoded[pos:pos + len(chunk)] = chunk
+        pos += len(chunk)
+    return encoded.decode("ascii")
+
+def _create_response(model, content, **attributes):
+    """Sends one user message to the Responses API inside an "openai.responses" span and returns the output text."""
+    with span("openai.responses", model=model, **attributes) as response_span:
+        response = client.responses.create(
+            model=model,
+            input=[
+                {
+                    "role": "user",
+                    "content": content,
+                },
+            ]
+        )
+        usage = getattr(response, "usage", None)
+        response_span.set(input_tokens=getattr(usage, "input_tokens", None) or 0, output_tokens=getattr(usage, "output_tokens", None) or 0)
+    return response.output_text
+
+def ask_with_file_bytes(data, filename: str, prompt: str, model: str = "gpt-4.1", mime_type: str = None) -> str:
+    """
+    Sends in-memory file bytes (as base64) and a prompt to the OpenAI API and returns the response text.
+    Args:
+        data (bytes-like): The file content (bytes, bytearray or memoryview).
+        filename (str): Name of the file, shown to the model.
+        prompt (str): The prompt/question to ask about the file.
+        model (str): The model to use (default: "gpt-4.1").
+        mime_type (str, optional): MIME type of the data. Guessed from the filename if not given.
+    Returns:
+        str: The response from the model.
+    """
+    if not mime_type:
+        mime_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    file_data = _encode_data_url(data, mime_type)
+
+    return _create_response(
+        model,
+        [
+            {
+                "type": "input_file",
+                "filename": filename,
+                "file_data": file_data,
+            },
+            {
+                "type": "input_text",
+                "text": prompt,
+            },
+        ],
+        kind="file", mime_type=mime_type, bytes=len(data),
+    )
+
+def ask_with_text(text: str, filename: str, prompt: str, model: str = "gpt-4.1") -> str:
+    """
+    Sends text extracted from a file and a prompt to the OpenAI API and returns the response text.
+    Much smaller than uploading the original file for office documents and spreadsheets.
+    Args:
+        text (str): The file's text content.
+        filename (str): Name of the file, shown to the model.
+        prompt (str): The prompt/question to ask about the file.
+        model (str): The model to use (default: "gpt-4.1").
+    Returns:
+        str: The response from the model.
+    """
+    return _create_response(
+        model,
+        [
+            {
+                "type": "input_text",
+                "text": f"Text extracted from the file '{filename}':\n\n{text}",
+            },
+            {
+                "type": "input_text",
+                "text": prompt,
+            },
+        ],
+        kind="text", text_chars=len(text),
+    )
+
 def ask_with_base64_file(file_path: str, prompt: str, model: str = "gpt-4.1") -> str:
     """
     Sends a file (as base64) and a prompt to the OpenAI API and returns the response text.
@@ -93,111 +313,610 @@ def ask_with_base64_file(file_path: str, prompt: str, model: str = "gpt-4.1") ->
     """
     with open(file_path, "rb") as f:
         data = f.read()
-    base64_string = base64.b64encode(data).decode("utf-8")
+    return ask_with_file_bytes(data, os.path.basename(file_path), prompt, model=model)
 
-    response = client.responses.create(
-        model=model,
-        input=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "input_file",
-                        "filename": os.path.basename(file_path),
-                        "file_data": f"data:application/pdf;base64,{base64_string}",
-                    },
-                    {
-                        "type": "input_text",
-                        "text": prompt,
-                    },
-                ],
-            },
+def execute_tool_call(tool_name, arguments):
+    """
+    Runs a single tool requested by the model.
+
+    Args:
+        tool_name (str): Name of the tool from the tools array.
+        arguments (str): JSON-encoded arguments from the model.
+
+    Returns:
+        tuple: (str: tool result, bool: True if the tool ends the conversation)
+    """
+    should_end = False
+    with span(f"tool.{tool_name}") as tool_span:
+        try:
+            args = json.loads(arguments)
+            if tool_name == "list_folder_contents":
+                tool_result = list_folder_contents(**args)
+            elif tool_name == "list_folder_tree":
+                tool_result = list_folder_tree(**args)
+            elif tool_name == "check_file_contents":
+                tool_result = check_file_contents(**args)
+            elif tool_name == "search_dropbox":
+                tool_result = search_dropbox(**args)
+            elif tool_name == "search_file_index":
+                tool_result = search_file_index(**args)
+            elif tool_name == "search_file_text":
+                tool_result = search_file_text(**args)
+            elif tool_name == "store_important_memory":
+                tool_result = store_important_memory(**args)
+            elif tool_name == "end_conversation":
+                tool_result = end_conversation(**args)
+                should_end = True
+            else:
+                tool_result = f"Tool '{tool_name}' not implemented."
+        except Exception as e:
+            tool_result = f"Error executing tool {tool_name}: {e}"
+            tool_span.fail(f"{type(e).__name__}: {e}")
+        tool_span.set(result_chars=len(str(tool_result)))
+    return tool_result, should_end
+
+class _ToolRun:
+    """
+    One tool call submitted to the shared tool pool. Its timeout counts from when a
+    worker starts it, not from when it was queued, and a call still queued after
+    TOOL_QUEUE_TIMEOUT_SECONDS is cancelled.
+    """
+
+    def __init__(self, tool_name, arguments, on_start=None):
+        """
+        Args:
+            tool_name (str): The tool to run.
+            arguments (str): JSON arguments from the model.
+            on_start (callable, optional): Called on the worker thread when the call starts.
+        """
+        self.tool_name = tool_name
+        self.timeout = TOOL_TIMEOUT_SECONDS.get(tool_name, DEFAULT_TOOL_TIMEOUT_SECONDS)
+        self.submitted = time.monotonic()
+        self.started = None
+        self.started_event = threading.Event()
+        self._on_start = on_start
+        self.future = _tool_executor.submit(bind(self._run), arguments)
+
+    def _run(self, arguments):
+        self.started = time.monotonic()
+        self.started_event.set()
+        if self._on_start:
+            self._on_start()
+        return execute_tool_call(self.tool_name, arguments)
+
+    def queue_time_left(self):
+        return max(0, self.submitted + TOOL_QUEUE_TIMEOUT_SECONDS - time.monotonic())
+
+    def run_time_left(self):
+        return max(0, (self.started or time.monotonic()) + self.timeout - time.monotonic())
+
+    def give_up_queued(self):
+        """
+        Cancels the call if no worker has started it yet.
+
+        Returns:
+            tuple: The error result to report, or None if the call has already started.
+        """
+        if not self.future.cancel():
+            return None
+        logger.warning(f"Tool {self.tool_name} waited {TOOL_QUEUE_TIMEOUT_SECONDS} seconds for a free worker and was cancelled")
+        return f"Error executing tool {self.tool_name}: all tool workers are busy; try again shortly.", False
+
+    def _track_abandoned(self):
+        """Tracks a running call nobody waits for any more; its worker thread cannot be stopped. Returns the count."""
+        with _abandoned_lock:
+            _abandoned_tools[self.future] = (self.tool_name, self.started)
+            abandoned = len(_abandoned_tools)
+        self.future.add_done_callback(self._finished_after_timeout)
+        return abandoned
+
+    def abandon(self):
+        """
+        Stops waiting for a call that ran past its timeout. The call is tracked until it finishes.
+
+        Returns:
+            tuple: The error result to report.
+        """
+        abandoned = self._track_abandoned()
+        logger.warning(f"Tool {self.tool_name} timed out after {self.timeout} seconds; {abandoned} timed-out tool call(s) still hold workers")
+        return f"Error executing tool {self.tool_name}: timed out after {self.timeout} seconds.", False
+
+    def stop(self):
+        """
+        Stops waiting for the call because its turn ran out of time or was cancelled:
+        cancels it if it is still queued, otherwise tracks it until it finishes.
+
+        Returns:
+            tuple: The error result to report.
+        """
+        if not self.future.cancel():
+            self._track_abandoned()
+        logger.warning(f"Stopped waiting for tool {self.tool_name}: its turn ran out of time")
+        return f"Error executing tool {self.tool_name}: the request ran out of time.", False
+
+    def _finished_after_timeout(self, future):
+        with _abandoned_lock:
+            _abandoned_tools.pop(future, None)
+        logger.info(f"Timed-out tool {self.tool_name} finished after {time.monotonic() - self.started:.0f} seconds")
+
+    def result(self, deadline=None):
+        """
+        Waits for the call, first for a free worker and then for the call itself.
+
+        Args:
+            deadline (float, optional): time.monotonic() by which the turn must end; the
+                                        wait never goes past it.
+
+        Returns:
+            tuple: (tool result, ends_conversation).
+        """
+        def _until_deadline(seconds):
+            return seconds if deadline is None else max(0, min(seconds, deadline - time.monotonic()))
+
+        if not self.started_event.wait(_until_deadline(self.queue_time_left())):
+            if deadline is not None and time.monotonic() >= deadline:
+                return self.stop()
+            busy = self.give_up_queued()
+            if busy is not None:
+                return busy
+            self.started_event.wait()  # Started just as it was being cancelled
+        try:
+            return self.future.result(timeout=_until_deadline(self.run_time_left()))
+        except concurrent.futures.TimeoutError:
+            if deadline is not None and time.monotonic() >= deadline:
+                return self.stop()
+            return self.abandon()
+
+def get_abandoned_tool_calls():
+    """
+    Returns the tool calls that timed out but are still running on the tool pool.
+
+    Returns:
+        list: (tool_name, seconds running) tuples.
+    """
+    now = time.monotonic()
+    with _abandoned_lock:
+        return [(tool_name, now - started) for tool_name, started in _abandoned_tools.values()]
+
+def run_tool_calls(tool_calls, deadline=None):
+    """
+    Executes a step's tool calls concurrently on the shared tool pool.
+    Each call gets its own timeout (TOOL_TIMEOUT_SECONDS) from when it starts running,
+    and errors are isolated, so one slow download does not hold up or break the others.
+
+    Args:
+        tool_calls (list): Tool call objects from the model's response.
+        deadline (float, optional): time.monotonic() by which the turn must end. Calls
+                                    still queued or running then are given up.
+
+    Returns:
+        list: (tool result, ends_conversation) tuples in the same order as tool_calls.
+    """
+    runs = [_ToolRun(tc.function.name, tc.function.arguments) for tc in tool_calls]
+    return [run.result(deadline) for run in runs]
+
+def describe_tool_call(tool_name, arguments):
+    """
+    Returns a short progress line for a tool call (e.g. "listing /Finance…"), for showing
+    users what the agent is doing while a turn runs.
+    """
+    try:
+        args = json.loads(arguments) or {}
+    except (TypeError, ValueError):
+        args = {}
+    path = args.get("dropbox_path") or "/"
+    if tool_name == "list_folder_contents":
+        if args.get("page_token"):
+            return "reading the next page of a listing…"
+        return f"listing {path}…"
+    if tool_name == "list_folder_tree":
+        return f"mapping the folders under {path}…"
+    if tool_name == "check_file_contents":
+        return f"reading {path}…"
+    if tool_name == "search_dropbox":
+        return f"searching Dropbox for '{args.get('query') or ''}'…"
+    if tool_name == "search_file_text":
+        return f"searching document text for '{args.get('query') or ''}'…"
+    if tool_name == "search_file_index":
+        filters = [f"'{args['name']}'" if args.get("name") else None,
+                   f".{args['extension'].lstrip('.')} files" if args.get("extension") else None,
+                   f"under {args['path_prefix']}" if args.get("path_prefix") else None]
+        filters = [f for f in filters if f]
+        return f"searching the file index for {' '.join(filters)}…" if filters else "searching the file index…"
+    if tool_name == "store_important_memory":
+        return "saving a note for next time…"
+    if tool_name == "end_conversation":
+        return "wrapping up…"
+    return f"running {tool_name}…"
+
+class _StreamedResponse:
+    """
+    Rebuilds a chat completion message from streamed chunks, forwarding text to
+    on_event as it arrives. Has the same message and usage as a non-streamed response.
+    """
+
+    def __init__(self, on_event):
+        self.on_event = on_event
+        self.content = []
+        self.tool_calls = {}  # index -> {'id', 'name', 'arguments'}
+        self.usage = None
+
+    def add(self, chunk):
+        if chunk.usage is not None:
+            self.usage = chunk.usage  # Sent in a final chunk without choices
+        if not chunk.choices:
+            return
+        delta = chunk.choices[0].delta
+        if delta.content:
+            self.content.append(delta.content)
+            self.on_event("text", delta.content)
+        for tool_call in delta.tool_calls or []:
+            entry = self.tool_calls.setdefault(tool_call.index, {'id': None, 'name': "", 'arguments': ""})
+            if tool_call.id:
+                entry['id'] = tool_call.id
+            if tool_call.function:
+                entry['name'] += tool_call.function.name or ""
+                entry['arguments'] += tool_call.function.arguments or ""
+
+    def message(self):
+        tool_calls = [
+            ChatCompletionMessageToolCall(
+                id=entry['id'],
+                type="function",
+                function={"name": entry['name'], "arguments": entry['arguments']},
+            )
+            for _, entry in sorted(self.tool_calls.items())
         ]
+        return ChatCompletionMessage(role="assistant", content="".join(self.content) or None, tool_calls=tool_calls or None)
+
+def _notify_tool_calls(on_event, event, tool_calls):
+    if on_event:
+        for tool_call in tool_calls:
+            on_event(event, {
+                "id": tool_call.id,
+                "name": tool_call.function.name,
+                "description": describe_tool_call(tool_call.function.name, tool_call.function.arguments),
+            })
+
+def _assistant_message(msg):
+    """Converts the model's response message into a history entry."""
+    assistant_message = {"role": msg.role}
+    if msg.tool_calls:
+        assistant_message["content"] = None
+        # Convert tool calls to dicts for JSON serialization later
+        assistant_message["tool_calls"] = [tc.model_dump() for tc in msg.tool_calls] 
+    else:
+        assistant_message["content"] = msg.content or ""
+    return assistant_message
+
+def _append_tool_results(current_history, tool_calls, results):
+    """
+    Appends one tool message per tool call, in the original order so every tool
+    message still follows its assistant tool_call.
+
+    Returns:
+        bool: True if any of the tools ends the conversation.
+    """
+    should_end = False
+    for tool_call, (tool_result, ends_conversation) in zip(tool_calls, results):
+        if ends_conversation:
+            should_end = True # Set the flag to end the conversation
+
+        # Append tool result message
+        current_history.append({
+            "role": "tool",
+            "tool_call_id": tool_call.id,
+            "name": tool_call.function.name,
+            "content": str(tool_result) # Ensure content is a string
+        })
+    return should_end
+
+def _log_step_usage(response, trim_stats, elapsed):
+    """Logs and counts the prompt size of one model call, as reported by the API, next to the trimming done locally."""
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    # Prompt tokens served from OpenAI's prefix cache (static system prompt and tool definitions)
+    cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+    current_span().set(prompt_tokens=prompt_tokens or 0, cached_tokens=cached_tokens or 0, completion_tokens=completion_tokens or 0)
+    with _usage_lock:
+        _usage_stats['steps'] += 1
+        _usage_stats['prompt_tokens'] += prompt_tokens or 0
+        _usage_stats['cached_tokens'] += cached_tokens or 0
+        _usage_stats['completion_tokens'] += completion_tokens or 0
+    logger.info(
+        f"Model step: {prompt_tokens} prompt tokens ({cached_tokens or 0} cached), {completion_tokens} completion tokens, {elapsed:.2f}s "
+        f"(history {trim_stats['original_tokens']} -> {trim_stats['sent_tokens']} estimated tokens, "
+        f"{trim_stats['elided_tool_results']} tool results shortened, {trim_stats['dropped_messages']} messages dropped)"
     )
-    return response.output_text
 
-def handle_conversation(history, model="gpt-4.1"):
+def get_usage_stats():
+    """
+    Returns token usage summed over all model steps in this process.
+
+    Returns:
+        dict: steps, prompt_tokens, cached_tokens, completion_tokens and cached_ratio
+              (share of prompt tokens served from the prompt cache).
+    """
+    with _usage_lock:
+        stats = dict(_usage_stats)
+    stats['cached_ratio'] = stats['cached_tokens'] / stats['prompt_tokens'] if stats['prompt_tokens'] else 0.0
+    return stats
+
+def handle_conversation(history, model="gpt-4.1", on_event=None, deadline=None):
     """
     Handles a full turn of conversation with the OpenAI API, including potential nested tool calls.
 
     Args:
         history (list): The conversation history *before* this turn.
         model (str): The model to use for the API calls.
+        on_event (callable, optional): If given, responses are streamed and on_event(event, data)
+            is called as the turn progresses: ("step", None) before each model call,
+            ("text", str) for each piece of response text, and ("tool_start", dict) /
+            ("tool_end", dict) around each step's tool calls (dict has id, name and description).
+            Called on the thread running the turn, so it should return quickly.
+        deadline (float, optional): time.monotonic() by which the turn must end. It is checked
+            before each model call, and tool calls are not waited for past it.
 
     Returns:
         tuple: (updated_history, should_end)
             - updated_history: The history *after* this full turn.
             - should_end: Boolean indicating if the `end_conversation` tool was called.
+
+    Raises:
+        concurrent.futures.TimeoutError: If the deadline passed before the turn ended.
     """
     current_history = list(history) # Work on a copy
     should_end = False # Flag to signal conversation end
 
-    while True: # Loop to handle potential sequences of tool calls
-        # Make the API call
-        response = client.chat.completions.create(
-            model=model,
-            messages=current_history,
-            tools=tools,
-            tool_choice="auto",
-            max_tokens=2048,
-        )
-        msg = response.choices[0].message
-
-        # Append the assistant's response message.
-        assistant_message = {"role": msg.role}
-        if msg.tool_calls:
-            assistant_message["content"] = None
-            # Convert tool calls to dicts for JSON serialization later
-            assistant_message["tool_calls"] = [tc.model_dump() for tc in msg.tool_calls] 
-        else:
-            assistant_message["content"] = msg.content or ""
-        current_history.append(assistant_message)
-
-        # If there are no tool calls, this turn is over.
-        if not msg.tool_calls:
-            break # Exit the while loop
-
-        # --- Tool Call Execution --- 
-        # If we reach here, msg.tool_calls is not empty.
-        tool_calls_to_process = msg.tool_calls # Use the actual objects here
-        
-        for tool_call in tool_calls_to_process:
-            tool_name = tool_call.function.name
-            tool_call_id = tool_call.id
-            args = json.loads(tool_call.function.arguments)
-            tool_result = ""
+    with span("agent.turn", model=model, engine="sync", streamed=bool(on_event)) as turn_span:
+        while True: # Loop to handle potential sequences of tool calls
+            if deadline is not None and time.monotonic() >= deadline:
+                raise concurrent.futures.TimeoutError("The conversation turn ran past its deadline")
+            with span("agent.step", history_messages=len(current_history)) as step_span:
+                # Send a copy trimmed to the token budget; current_history keeps every message
+                messages, trim_stats = fit_history_to_budget(current_history)
+                started = time.monotonic()
+                if on_event:
+                    on_event("step", None)
+                with span("openai.chat", model=model, streamed=bool(on_event)):
+                    if on_event:
+                        # Stream the response so text reaches the user as it is generated
+                        response = _StreamedResponse(on_event)
+                        for chunk in client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            tools=tools,
+                            tool_choice="auto",
+                            max_tokens=2048,
+                            stream=True,
+                            stream_options={"include_usage": True},
+                        ):
+                            response.add(chunk)
+                        msg = response.message()
+                    else:
+                        # Make the API call
+                        response = client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            tools=tools,
+                            tool_choice="auto",
+                            max_tokens=2048,
+                        )
+                        msg = response.choices[0].message
+                    _log_step_usage(response, trim_stats, time.monotonic() - started)
 
-            try:
-                if tool_name == "list_folder_contents":
-                    entries = list_folder_contents(**args)
-                    summary = f"Folder '{args.get('dropbox_path','')}' contains: " + ", ".join([
-                        f"[{e.__class__.__name__.replace('Metadata','')}] {getattr(e, 'name', 'Unknown')}" for e in entries
-                    ])
-                    tool_result = summary
-                elif tool_name == "check_file_contents":
-                    tool_result = check_file_contents(**args)
-                elif tool_name == "store_important_memory":
-                    tool_result = store_important_memory(**args)
-                elif tool_name == "end_conversation":
-                    tool_result = end_conversation(**args)
-                    should_end = True # Set the flag to end the conversation
-                else:
-                    tool_result = f"Tool '{tool_name}' not implemented."
-            except Exception as e:
-                # print(f"Error executing tool {tool_name}: {e}")
-                tool_result = f"Error executing tool {tool_name}: {e}"
-
-            # Append tool result message
-            current_history.append({
-                "role": "tool",
-                "tool_call_id": tool_call_id,
-                "name": tool_name,
-                "content": str(tool_result) # Ensure content is a string
-            })
-        
-        # After processing all tool calls for this step, 
-        # loop back to call the API again with the tool results included.
-        # The loop continues until the API responds without tool calls.
+                # Append the assistant's response message.
+                current_history.append(_assistant_message(msg))
+
+                # If there are no tool calls, this turn is over.
+                if not msg.tool_calls:
+                    break # Exit the while loop
+
+                # --- Tool Call Execution --- 
+                # Independent tool calls run concurrently on the shared tool pool
+                step_span.set(tool_calls=len(msg.tool_calls))
+                _notify_tool_calls(on_event, "tool_start", msg.tool_calls)
+                results = run_tool_calls(msg.tool_calls, deadline)
+                _notify_tool_calls(on_event, "tool_end", msg.tool_calls)
+                if _append_tool_results(current_history, msg.tool_calls, results):
+                    should_end = True
         
+                # After processing all tool calls for this step, 
+                # loop back to call the API again with the tool results included.
+                # The loop continues until the API responds without tool calls.
+        turn_span.set(messages_added=len(current_history) - len(history), should_end=should_end)
+
     return current_history, should_end # Return the end flag
 
+
+async def run_tool_calls_async(tool_calls):
+    """
+    Async counterpart of run_tool_calls. The blocking Dropbox/OpenAI work runs on the
+    shared tool pool, so the event loop is never blocked and no thread is held per
+    conversation while waiting.
+
+    Args:
+        tool_calls (list): Tool call objects from the model's response.
+
+    Returns:
+        list: (tool result, ends_conversation) tuples in the same order as tool_calls.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def _run(tool_call):
+        started = asyncio.Event()
+        run = _ToolRun(tool_call.function.name, tool_call.function.arguments,
+                       on_start=lambda: loop.call_soon_threadsafe(started.set))
+        try:
+            try:
+                await asyncio.wait_for(started.wait(), run.queue_time_left())
+            except asyncio.TimeoutError:
+                busy = run.give_up_queued()
+                if busy is not None:
+                    return busy
+            try:
+                # shield: a timeout must not try to cancel the running call's future
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(run.future)), run.run_time_left())
+            except asyncio.TimeoutError:
+                return run.abandon()
+        except asyncio.CancelledError:
+            # The turn timed out or was cancelled; don't leave the call queued or untracked
+            run.stop()
+            raise
+
+    return await asyncio.gather(*(_run(tc) for tc in tool_calls))
+
+async def handle_conversation_async(history, model="gpt-4.1", on_event=None):
+    """
+    Async version of handle_conversation using AsyncOpenAI. Many conversations can
+    run on one event loop; see run_conversation_turn_async.
+
+    Args:
+        history (list): The conversation history *before* this turn.
+        model (str): The model to use for the API calls.
+        on_event (callable, optional): Streams the turn, as for handle_conversation.
+            Called on the event loop, so it must not block.
+
+    Returns:
+        tuple: (updated_history, should_end), as for handle_conversation.
+    """
+    current_history = list(history) # Work on a copy
+    should_end = False # Flag to signal conversation end
+
+    with span("agent.turn", model=model, engine="async", streamed=bool(on_event)) as turn_span:
+        while True: # Loop to handle potential sequences of tool calls
+            with span("agent.step", history_messages=len(current_history)) as step_span:
+                messages, trim_stats = fit_history_to_budget(current_history)
+                started = time.monotonic()
+                if on_event:
+                    on_event("step", None)
+                with span("openai.chat", model=model, streamed=bool(on_event)):
+                    if on_event:
+                        response = _StreamedResponse(on_event)
+                        stream = await async_client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            tools=tools,
+                            tool_choice="auto",
+                            max_tokens=2048,
+                            stream=True,
+                            stream_options={"include_usage": True},
+                        )
+                        async for chunk in stream:
+                            response.add(chunk)
+                        msg = response.message()
+                    else:
+                        response = await async_client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            tools=tools,
+                            tool_choice="auto",
+                            max_tokens=2048,
+                        )
+                        msg = response.choices[0].message
+                    _log_step_usage(response, trim_stats, time.monotonic() - started)
+                current_history.append(_assistant_message(msg))
+
+                if not msg.tool_calls:
+                    break
+
+                step_span.set(tool_calls=len(msg.tool_calls))
+                _notify_tool_calls(on_event, "tool_start", msg.tool_calls)
+                results = await run_tool_calls_async(msg.tool_calls)
+                _notify_tool_calls(on_event, "tool_end", msg.tool_calls)
+                if _append_tool_results(current_history, msg.tool_calls, results):
+                    should_end = True
+        turn_span.set(messages_added=len(current_history) - len(history), should_end=should_end)
+
+    return current_history, should_end
+
+def get_agent_event_loop():
+    """
+    Returns the process-wide event loop used by the async engine, starting it in a
+    daemon thread on first use. AsyncOpenAI's connection pool is tied to one loop,
+    so every async turn runs here rather than in a fresh asyncio.run() loop.
+
+    Returns:
+        asyncio.AbstractEventLoop: The running agent loop.
+    """
+    global _agent_loop
+    with _agent_loop_lock:
+        if _agent_loop is None:
+            _agent_loop = asyncio.new_event_loop()
+            threading.Thread(target=_agent_loop.run_forever, daemon=True, name="agent-event-loop").start()
+        return _agent_loop
+
+def submit_to_agent_loop(coro):
+    """
+    Schedules a coroutine on the agent loop and returns at once. The caller's context
+    (trace span, cassette turn) is carried into it.
+
+    Args:
+        coro (coroutine): For example run_conversation_turn_async(...).
+
+    Returns:
+        concurrent.futures.Future: Completes with the coroutine's result.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_agent_event_loop())
+
+async def run_conversation_turn_async(history, model="gpt-4.1", timeout=None, on_event=None):
+    """
+    Runs one conversation turn with the async engine. Must run on the agent loop (see
+    submit_to_agent_loop). At most AGENT_MAX_CONCURRENT_TURNS turns run at once; the
+    others wait for a slot without holding a thread.
+
+    Args:
+        history (list): The conversation history *before* this turn.
+        model (str): The model to use for the API calls.
+        timeout (float, optional): Seconds the turn may take once it has a slot. On timeout
+                                   it is cancelled, along with its queued tool calls.
+        on_event (callable, optional): Streams the turn; see handle_conversation_async.
+
+    Returns:
+        tuple: (updated_history, should_end), as for handle_conversation.
+
+    Raises:
+        concurrent.futures.TimeoutError: If the turn took longer than timeout.
+    """
+    global _turn_slots
+    if _turn_slots is None:
+        _turn_slots = asyncio.Semaphore(AGENT_MAX_CONCURRENT_TURNS)
+    if _turn_slots.locked():
+        logger.info(f"All {AGENT_MAX_CONCURRENT_TURNS} turn slots are busy; waiting for one")
+    async with _turn_slots:
+        # When recording a cassette, everything this turn calls is tagged with its turn id
+        with recording_turn(history):
+            try:
+                return await asyncio.wait_for(handle_conversation_async(history, model=model, on_event=on_event), timeout)
+            except asyncio.TimeoutError:
+                raise concurrent.futures.TimeoutError(f"The conversation turn took longer than {timeout} seconds") from None
+
+def run_conversation_turn(history, model="gpt-4.1", timeout=None, on_event=None):
+    """
+    Runs one conversation turn with the configured engine and waits for it, for callers
+    with a single conversation such as the CLI: run_conversation_turn_async on the agent
+    loop if USE_ASYNC_ENGINE is set, otherwise handle_conversation on the calling thread.
+    Servers with many conversations should submit run_conversation_turn_async to the
+    agent loop instead of calling this, so that no thread waits for a turn (see slack_bot.py).
+
+    Args:
+        history (list): The conversation history *before* this turn.
+        model (str): The model to use for the API calls.
+        timeout (float, optional): Seconds the turn may take. On timeout an async turn is
+                                   cancelled on the agent loop; a sync turn stops before its
+                                   next model call or at the deadline while waiting for tool calls.
+        on_event (callable, optional): Streams the turn; see handle_conversation.
+
+    Returns:
+        tuple: (updated_history, should_end), as for handle_conversation.
+
+    Raises:
+        concurrent.futures.TimeoutError: If the turn took longer than timeout.
+    """
+    if USE_ASYNC_ENGINE:
+        return submit_to_agent_loop(run_conversation_turn_async(history, model=model, timeout=timeout, on_event=on_event)).result()
+    # When recording a cassette, everything this turn calls is tagged with its turn id
+    with recording_turn(history):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        return handle_conversation(history, model=model, on_event=on_event, deadline=deadline)
@@ -0,0 +1,252 @@
+import os
+import zipfile
+import posixpath
+import logging
+import xml.etree.ElementTree as ET
+import dropbox
+from .dropbox_client_context import run_with_dropbox_context
+from .dropbox_file_manager import DropboxRangeReader, PLAIN_TEXT_EXTENSIONS
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+SAMPLE_READ_BUDGET = 4 * 1024 * 1024  # Bytes fetched from Dropbox per sampled file, whatever its size
+SAMPLE_BLOCK_SIZE = 256 * 1024  # Bytes per range request
+SAMPLE_TEXT_BYTES = 64 * 1024  # Head and tail read from text/CSV files
+SAMPLE_PDF_PAGES = 5  # Leading PDF pages extracted
+SAMPLE_SHEET_ROWS = 25  # Leading rows (header first) read per worksheet
+SAMPLE_MAX_SHEETS = 10  # Worksheets sampled per workbook
+SAMPLE_SHARED_STRINGS = 20000  # Spreadsheet strings resolved; later ones are shown as placeholders
+SAMPLE_MAX_SLIDES = 200  # Slide titles read per presentation
+SAMPLE_DOCX_PARAGRAPHS = 200  # Leading paragraphs read from a Word document
+SAMPLEABLE_EXTENSIONS = {'.pdf', '.xlsx', '.docx', '.pptx'} | PLAIN_TEXT_EXTENSIONS
+
+_NS = {
+    'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
+    'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
+}
+
+
+def _tag(prefix, name):
+    return f"{{{_NS[prefix]}}}{name}"
+
+
+def _sample_text(reader, size):
+    """Head and tail of a text file, cut at line boundaries."""
+    head = reader.read(SAMPLE_TEXT_BYTES).decode('utf-8', errors='replace')
+    if size <= 2 * SAMPLE_TEXT_BYTES:
+        return head + reader.read().decode('utf-8', errors='replace')
+    head = head.rsplit('\n', 1)[0]
+    reader.seek(size - SAMPLE_TEXT_BYTES)
+    tail = reader.read().decode('utf-8', errors='replace')
+    tail = tail.split('\n', 1)[-1]
+    return f"--- First {len(head)} characters ---\n{head}\n\n--- Last {len(tail)} characters ---\n{tail}"
+
+
+def _sample_pdf(reader):
+    """Page count plus the text of the first SAMPLE_PDF_PAGES pages."""
+    from PyPDF2 import PdfReader
+
+    # The cross-reference table and page tree can be large too, so the read budget may run out here
+    try:
+        pdf = PdfReader(reader)
+        page_count = len(pdf.pages)
+    except RuntimeError as e:
+        return f"PDF whose structure could not be read within the sample: stopped, {e}"
+    lines = [f"PDF with {page_count} pages; text of the first {min(page_count, SAMPLE_PDF_PAGES)}:"]
+    for number in range(min(page_count, SAMPLE_PDF_PAGES)):
+        try:
+            text = pdf.pages[number].extract_text() or ""
+        except RuntimeError as e:
+            lines.append(f"--- Page {number + 1}: stopped, {e} ---")
+            break
+        lines.append(f"--- Page {number + 1} ---\n{text.strip()}")
+    return "\n".join(lines)
+
+
+def _read_part(zf, name):
+    with zf.open(name) as part:
+        return ET.fromstring(part.read())
+
+
+def _part_targets(zf, rels_name, base_dir):
+    """Maps relationship IDs to part names from a .rels file."""
+    targets = {}
+    if rels_name not in zf.namelist():
+        return targets
+    for rel in _read_part(zf, rels_name).iter(_tag('rel', 'Relationship')):
+        target = rel.get('Target', '')
+        targets[rel.get('Id')] = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join(base_dir, target))
+    return targets
+
+
+def _leading_shared_strings(zf):
+    """Reads up to SAMPLE_SHARED_STRINGS shared strings, streaming so a huge table is not fully read."""
+    strings = []
+    if 'xl/sharedStrings.xml' not in zf.namelist():
+        return strings
+    with zf.open('xl/sharedStrings.xml') as part:
+        for _, element in ET.iterparse(part):
+            if element.tag == _tag('main', 'si'):
+                strings.append("".join(t.text or "" for t in element.iter(_tag('main', 't'))))
+                element.clear()
+                if len(strings) >= SAMPLE_SHARED_STRINGS:
+                    break
+    return strings
+
+
+def _cell_value(cell, strings):
+    cell_type = cell.get('t')
+    if cell_type == 'inlineStr':
+        return "".join(t.text or "" for t in cell.iter(_tag('main', 't')))
+    value = cell.find(_tag('main', 'v'))
+    if value is None or value.text is None:
+        return ""
+    if cell_type == 's':
+        index = int(value.text)
+        return strings[index] if index < len(strings) else f"[string #{index}]"
+    return value.text
+
+
+def _sample_xlsx(reader):
+    """Sheet names, dimensions and the leading rows of each sheet."""
+    zf = zipfile.ZipFile(reader)
+    workbook = _read_part(zf, 'xl/workbook.xml')
+    targets = _part_targets(zf, 'xl/_rels/workbook.xml.rels', 'xl')
+    sheets = [(sheet.get('name'), targets.get(sheet.get(_tag('r', 'id')))) for sheet in workbook.iter(_tag('main', 'sheet'))]
+    strings = _leading_shared_strings(zf)
+
+    lines = [f"Workbook with {len(sheets)} sheet(s): " + ", ".join(name for name, _ in sheets)]
+    for name, part_name in sheets[:SAMPLE_MAX_SHEETS]:
+        if not part_name or part_name not in zf.namelist():
+            continue
+        dimension = None
+        rows = []
+        try:
+            with zf.open(part_name) as part:
+                # Rows are read in order and parsing stops after SAMPLE_SHEET_ROWS,
+                # so only the start of the (compressed) sheet is fetched
+                for _, element in ET.iterparse(part):
+                    if element.tag == _tag('main', 'dimension'):
+                        dimension = element.get('ref')
+                    elif element.tag == _tag('main', 'row'):
+                        rows.append(" | ".join(_cell_value(cell, strings) for cell in element.iter(_tag('main', 'c'))))
+                        element.clear()
+                        if len(rows) >= SAMPLE_SHEET_ROWS:
+                            break
+        except RuntimeError as e:
+            rows.append(f"(stopped: {e})")
+        lines.append(f"\nSheet '{name}'" + (f" (range {dimension})" if dimension else "") + f", first {len(rows)} row(s):")
+        lines.extend(rows)
+    if len(sheets) > SAMPLE_MAX_SHEETS:
+        lines.append(f"\n({len(sheets) - SAMPLE_MAX_SHEETS} more sheet(s) not sampled)")
+    return "\n".join(lines)
+
+
+def _sample_pptx(reader):
+    """Slide count and the title of each slide, in presentation order."""
+    zf = zipfile.ZipFile(reader)
+    presentation = _read_part(zf, 'ppt/presentation.xml')
+    targets = _part_targets(zf, 'ppt/_rels/presentation.xml.rels', 'ppt')
+    slides = [targets.get(slide.get(_tag('r', 'id'))) for slide in presentation.iter(_tag('p', 'sldId'))]
+
+    lines = [f"Presentation with {len(slides)} slide(s). Slide titles:"]
+    for number, part_name in enumerate(slides[:SAMPLE_MAX_SLIDES], start=1):
+        if not part_name or part_name not in zf.namelist():
+            continue
+        try:
+            slide = _read_part(zf, part_name)
+        except RuntimeError as e:
+            lines.append(f"(stopped at slide {number}: {e})")
+            break
+        title = None
+        for shape in slide.iter(_tag('p', 'sp')):
+            placeholder = shape.find(f".//{_tag('p', 'ph')}")
+            if placeholder is not None and placeholder.get('type') in ('title', 'ctrTitle'):
+                title = " ".join(t.text or "" for t in shape.iter(_tag('a', 't'))).strip()
+                break
+        if not title:
+            # No title placeholder: fall back to the slide's first text
+            first = next((t.text for t in slide.iter(_tag('a', 't')) if t.text and t.text.strip()), "")
+            title = f"(untitled) {first.strip()[:100]}" if first else "(no text)"
+        lines.append(f"{number}. {title}")
+    if len(slides) > SAMPLE_MAX_SLIDES:
+        lines.append(f"({len(slides) - SAMPLE_MAX_SLIDES} more slide(s) not read)")
+    return "\n".join(lines)
+
+
+def _sample_docx(reader):
+    """The leading paragraphs of a Word document."""
+    zf = zipfile.ZipFile(reader)
+    paragraphs = []
+    try:
+        with zf.open('word/document.xml') as part:
+            for _, element in ET.iterparse(part):
+                if element.tag == _tag('w', 'p'):
+                    text = "".join(t.text or "" for t in element.iter(_tag('w', 't'))).strip()
+                    element.clear()
+                    if text:
+                        paragraphs.append(text)
+                        if len(paragraphs) >= SAMPLE_DOCX_PARAGRAPHS:
+                            break
+    except RuntimeError as e:
+        paragraphs.append(f"(stopped: {e})")
+    return f"First {len(paragraphs)} paragraph(s):\n" + "\n".join(paragraphs)
+
+
+def extract_sample(path, select_user=None, size=None):
+    """
+    Extracts a representative sample of a file of any size using bounded range reads:
+    the first pages of a PDF, sheet names plus leading rows of each XLSX sheet, slide
+    titles of a PPTX, the first paragraphs of a DOCX, or the head and tail of a text/CSV
+    file. At most SAMPLE_READ_BUDGET bytes are fetched, so the cost does not grow with
+    the file size.
+
+    Args:
+        path (str): The path of the file in Dropbox.
+        select_user (str, optional): Team member ID to operate as.
+        size (int, optional): File size in bytes, if already known; saves a metadata request.
+
+    Returns:
+        tuple: (str: The sample, starting with a note that it is a sample,
+                dict: file_size, bytes_read and requests)
+
+    Raises:
+        ValueError: If the format cannot be sampled or authentication fails.
+        dropbox.exceptions.ApiError: If a Dropbox request fails.
+    """
+    file_ext = os.path.splitext(path)[1].lower()
+    if file_ext not in SAMPLEABLE_EXTENSIONS:
+        raise ValueError(f"Sampling is not supported for {file_ext or 'files without an extension'} files.")
+
+    def _sample(context):
+        file_size = size
+        if file_size is None:
+            file_size = context.client.files_get_metadata(path).size
+        reader = DropboxRangeReader(context.client, path, file_size, budget=SAMPLE_READ_BUDGET, block_size=SAMPLE_BLOCK_SIZE)
+        if file_ext == '.pdf':
+            body = _sample_pdf(reader)
+        elif file_ext == '.xlsx':
+            body = _sample_xlsx(reader)
+        elif file_ext == '.pptx':
+            body = _sample_pptx(reader)
+        elif file_ext == '.docx':
+            body = _sample_docx(reader)
+        else:
+            body = _sample_text(reader, file_size)
+        return body, {'file_size': file_size, 'bytes_read': reader.bytes_fetched, 'requests': reader.requests}
+
+    try:
+        body, stats = run_with_dropbox_context(_sample, select_user=select_user)
+    except dropbox.exceptions.AuthError as e:
+        raise ValueError(f"Authentication error: {e}. Check token validity and scopes.") from e
+
+    logger.info(f"Sampled '{path}': read {stats['bytes_read']} of {stats['file_size']} bytes in {stats['requests']} range request(s)")
+    notice = (f"[SAMPLE ONLY: this file is {stats['file_size'] / 1024 / 1024:.1f} MB; only the parts below were read "
+              f"({stats['bytes_read'] / 1024:.0f} KB). Conclusions about the rest of the file are guesses.]")
+    return f"{notice}\n\n{body}", stats
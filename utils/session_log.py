@@ -0,0 +1,158 @@
+import os
+import json
+import gzip
+import queue
+import threading
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+SESSION_LOG_DIR = "history"
+SESSION_LOG_GZIP = os.getenv("AGENT_SESSION_LOG_GZIP", "0") == "1"  # Write history/<session_id>.jsonl.gz instead of .jsonl
+
+# Messages already queued per session, so each save only appends what is new. Entries
+# are dropped with the conversation (forget_session); the writer recounts from disk after.
+_counts_lock = threading.Lock()
+_written_counts = {}
+
+# One background thread does all the writing, so persistence never blocks a reply
+_write_queue = queue.Queue()
+_writer_lock = threading.Lock()
+_writer_thread = None
+
+
+def _json_default(obj):
+    # Pydantic models (e.g. tool calls) dump to plain dicts
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
+
+
+def session_log_path(session_id, compress=None):
+    """Returns the log file path for a session."""
+    compress = SESSION_LOG_GZIP if compress is None else compress
+    return os.path.join(SESSION_LOG_DIR, f"{session_id}.jsonl{'.gz' if compress else ''}")
+
+
+def _open_log(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _existing_log_path(session_id):
+    for compress in (SESSION_LOG_GZIP, not SESSION_LOG_GZIP):
+        path = session_log_path(session_id, compress)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _writer_loop():
+    while True:
+        session_id, messages, skip_logged = _write_queue.get()
+        try:
+            if skip_logged:
+                # Runs here, in queue order, so the count includes every earlier write
+                messages = messages[_count_logged_messages(session_id):]
+                if not messages:
+                    continue
+            path = _existing_log_path(session_id) or session_log_path(session_id)
+            # Appending to a .gz adds a new gzip member; gzip readers see one continuous stream
+            with _open_log(path, "a") as f:
+                for message in messages:
+                    f.write(json.dumps(message, default=_json_default) + "\n")
+        except Exception as e:
+            logger.error(f"Error writing session log for {session_id}: {e}")
+        finally:
+            _write_queue.task_done()
+
+
+def _ensure_writer():
+    global _writer_thread
+    with _writer_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            os.makedirs(SESSION_LOG_DIR, exist_ok=True)
+            _writer_thread = threading.Thread(target=_writer_loop, daemon=True, name="session-log-writer")
+            _writer_thread.start()
+
+
+def _count_logged_messages(session_id):
+    """Counts messages already on disk for a session. Only called on the writer thread."""
+    path = _existing_log_path(session_id)
+    if not path:
+        return 0
+    with _open_log(path, "r") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def append_session_messages(history, session_id):
+    """
+    Queues the messages of history that are not logged yet and returns immediately;
+    a background thread appends them to the session's JSONL log.
+
+    Args:
+        history (list): The full conversation history. Earlier messages must be unchanged
+                        since the last call; only new messages at the end are written.
+        session_id (str): The session the history belongs to.
+
+    Returns:
+        int: Number of messages queued. For a session not seen since it was forgotten (or
+             since a restart) that is the whole history; the writer skips what is on disk.
+    """
+    with _counts_lock:
+        written = _written_counts.get(session_id)
+        _written_counts[session_id] = len(history)
+    if written is None:
+        new_messages, skip_logged = history, True
+    else:
+        new_messages, skip_logged = history[written:], False
+    if new_messages:
+        _ensure_writer()
+        _write_queue.put((session_id, list(new_messages), skip_logged))
+    return len(new_messages)
+
+
+def forget_session(session_id):
+    """
+    Drops the in-memory bookkeeping for a session that ended or was evicted from memory.
+    Its log file is kept, and a later append_session_messages picks up where it left off.
+    """
+    with _counts_lock:
+        _written_counts.pop(session_id, None)
+
+
+def flush_session_logs():
+    """Blocks until every queued message has been written."""
+    _write_queue.join()
+
+
+def load_session(session_id):
+    """
+    Reconstructs a conversation history from its session log, for resuming a session
+    or analysing it. Falls back to the older history/<session_id>.json format.
+
+    Args:
+        session_id (str): The session to load.
+
+    Returns:
+        list: The messages in order (empty if there is no log).
+    """
+    path = _existing_log_path(session_id)
+    if path:
+        history = []
+        with _open_log(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    history.append(json.loads(line))
+        with _counts_lock:
+            _written_counts.setdefault(session_id, len(history))
+        return history
+
+    legacy_path = os.path.join(SESSION_LOG_DIR, f"{session_id}.json")
+    if os.path.exists(legacy_path):
+        with open(legacy_path, "r") as f:
+            return json.load(f)
+    return []
@@ -0,0 +1,112 @@
+import threading
+import time
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+SLACK_UPDATE_INTERVAL_SECONDS = 1.2  # chat.update is rate limited (Tier 3, ~50 per minute)
+SLACK_STREAM_MAX_CHARS = 3500  # Longer partial text shows only its end while streaming
+
+
+class SlackMessageStreamer:
+    """
+    Streams a conversation turn into one Slack message by editing it with chat_update.
+
+    on_event (see handle_conversation) only records the latest text and tool progress;
+    a timer pushes the current state to Slack at most once per min_interval seconds,
+    so the agent is never blocked on Slack and bursts of tokens collapse into one edit.
+    """
+
+    def __init__(self, client, channel, ts, min_interval=SLACK_UPDATE_INTERVAL_SECONDS):
+        """
+        Args:
+            client (slack_sdk.WebClient): Client used for chat_update.
+            channel (str): Channel of the message to edit.
+            ts (str): Timestamp of the message to edit (e.g. the "Thinking..." message).
+            min_interval (float): Minimum seconds between edits.
+        """
+        self._client = client
+        self._channel = channel
+        self._ts = ts
+        self._min_interval = min_interval
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()  # Keeps a late timer edit from overwriting the final text
+        self._text = []  # Response text of the current model step
+        self._running = {}  # Tool calls in progress {id: progress line, e.g. "listing /Finance…"}
+        self._timer = None
+        self._last_update = 0.0
+        self._closed = False
+
+    def on_event(self, event, data):
+        """Event callback for run_conversation_turn; returns immediately."""
+        with self._lock:
+            if event == "step":
+                # A new model step replaces the previous step's text and tool progress
+                self._text = []
+                self._running = {}
+            elif event == "text":
+                self._text.append(data)
+                self._running = {}
+            elif event == "tool_start":
+                # A step's tools run concurrently; show every one of them
+                self._running[data.get('id') or len(self._running)] = data['description']
+            elif event == "tool_end":
+                self._running.pop(data.get('id'), None)
+            else:
+                return
+            self._schedule()
+
+    def _schedule(self):
+        # Called with the lock held
+        if self._closed or self._timer is not None:
+            return
+        delay = max(0.0, self._last_update + self._min_interval - time.monotonic())
+        self._timer = threading.Timer(delay, self._flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _render(self):
+        text = "".join(self._text).strip()
+        if len(text) > SLACK_STREAM_MAX_CHARS:
+            text = "…" + text[-SLACK_STREAM_MAX_CHARS:]
+        if self._running:
+            status = "\n".join(f"_{description}_" for description in self._running.values())
+            return f"{text}\n\n{status}" if text else status
+        return (text + " …") if text else "Thinking..."
+
+    def _flush(self):
+        with self._send_lock:
+            with self._lock:
+                self._timer = None
+                if self._closed:
+                    return
+                text = self._render()
+                self._last_update = time.monotonic()
+            self._update(text)
+
+    def _update(self, text):
+        try:
+            self._client.chat_update(channel=self._channel, ts=self._ts, text=text)
+            return True
+        except Exception as e:
+            # A missed edit is harmless; the next one (or finish) shows the latest state
+            logger.warning(f"Slack chat_update failed: {e}")
+            return False
+
+    def finish(self, text):
+        """
+        Stops streaming and replaces the message with the final text.
+
+        Returns:
+            bool: True if the message was updated; False if the caller should post
+                  the text another way.
+        """
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        with self._send_lock:
+            return self._update(text)
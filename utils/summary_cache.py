@@ -0,0 +1,142 @@
+import threading
+import time
+import logging
+from .metadata_index import connect_index
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+SUMMARY_CACHE_MAX_BYTES = 50 * 1024 * 1024  # Total summary text kept before least-recently-used entries are evicted
+
+# Summaries are keyed by what determines the model's answer: the file content
+# (content_hash), the prompt used and how many bytes of the file were analyzed.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summary_cache (
+    content_hash TEXT NOT NULL,
+    prompt_variant TEXT NOT NULL,
+    analyzed_bytes INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (content_hash, prompt_variant, analyzed_bytes)
+);
+CREATE INDEX IF NOT EXISTS idx_summary_cache_last_access ON summary_cache(last_access);
+"""
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+
+def _connect():
+    conn = connect_index()
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _count(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def get_cached_summary(content_hash, prompt_variant, analyzed_bytes):
+    """
+    Looks up a cached file summary and marks it as recently used.
+
+    Args:
+        content_hash (str): Dropbox content_hash of the file.
+        prompt_variant (str): Identifier of the prompt used to produce the summary.
+        analyzed_bytes (int): Number of bytes of the file that were analyzed, or None to
+                              accept any (for samples, whose size is only known once read).
+
+    Returns:
+        str: The cached summary, or None on a miss.
+    """
+    if not content_hash:
+        _count('misses')
+        return None
+
+    conn = _connect()
+    try:
+        if analyzed_bytes is None:
+            row = conn.execute(
+                "SELECT rowid, summary FROM summary_cache WHERE content_hash = ? AND prompt_variant = ? ORDER BY created_at DESC LIMIT 1",
+                (content_hash, prompt_variant),
+            ).fetchone()
+        else:
+            row = conn.execute(
+                "SELECT rowid, summary FROM summary_cache WHERE content_hash = ? AND prompt_variant = ? AND analyzed_bytes = ?",
+                (content_hash, prompt_variant, analyzed_bytes),
+            ).fetchone()
+        if row is None:
+            _count('misses')
+            return None
+        conn.execute("UPDATE summary_cache SET last_access = ? WHERE rowid = ?", (time.time(), row['rowid']))
+        conn.commit()
+    finally:
+        conn.close()
+    _count('hits')
+    return row['summary']
+
+
+def store_summary(content_hash, prompt_variant, analyzed_bytes, summary):
+    """
+    Stores a file summary, then evicts least-recently-used entries until the cache
+    is back under SUMMARY_CACHE_MAX_BYTES.
+
+    Args:
+        content_hash (str): Dropbox content_hash of the file.
+        prompt_variant (str): Identifier of the prompt used to produce the summary.
+        analyzed_bytes (int): Number of bytes of the file that were analyzed.
+        summary (str): The summary to cache.
+    """
+    if not content_hash:
+        return
+
+    now = time.time()
+    size_bytes = len(summary.encode('utf-8'))
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO summary_cache (content_hash, prompt_variant, analyzed_bytes, summary, size_bytes, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (content_hash, prompt_variant, analyzed_bytes, summary, size_bytes, now, now),
+        )
+        total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM summary_cache").fetchone()[0]
+        evicted = 0
+        if total > SUMMARY_CACHE_MAX_BYTES:
+            for row in conn.execute("SELECT rowid, size_bytes FROM summary_cache ORDER BY last_access").fetchall():
+                if total <= SUMMARY_CACHE_MAX_BYTES:
+                    break
+                conn.execute("DELETE FROM summary_cache WHERE rowid = ?", (row['rowid'],))
+                total -= row['size_bytes']
+                evicted += 1
+        conn.commit()
+    finally:
+        conn.close()
+    _count('stores')
+    if evicted:
+        _count('evictions', evicted)
+        logger.info(f"Summary cache evicted {evicted} least-recently-used entries")
+
+
+def get_summary_cache_stats():
+    """
+    Returns hit/miss counters for this process plus the current cache size.
+
+    Returns:
+        dict: hits, misses, stores, evictions, hit_rate, entries and total_bytes.
+    """
+    conn = _connect()
+    try:
+        entries, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM summary_cache").fetchone()
+    finally:
+        conn.close()
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    stats['entries'] = entries
+    stats['total_bytes'] = total_bytes
+    return stats
@@ -1,95 +1,358 @@
-from utils.dropbox_file_manager import download_file, download_file_with_size_limit, MAX_DOWNLOAD_SIZE, PARTIAL_DOWNLOAD_SIZE
-from utils.dropbox_folder_manager import list_folder_complete
+from utils.dropbox_file_manager import download_file, download_file_to_buffer, get_file_metadata, extract_text_from_bytes, MAX_DOWNLOAD_SIZE, PARTIAL_DOWNLOAD_SIZE, PLAIN_TEXT_EXTENSIONS, TEXT_EXTRACTABLE_EXTENSIONS
+from utils.dropbox_folder_manager import iter_folder_entries, list_tree, TREE_MAX_DEPTH
+from utils.dropbox_search_manager import search_files, SEARCH_MAX_RESULTS
+from utils.listing_renderer import render_listing, render_listing_page, render_tree, LISTING_PAGE_SIZE
+from utils.metadata_index import ensure_index_fresh, search_index, get_indexed_file, get_index_age_seconds, INDEX_MAX_AGE_SECONDS
+from utils.content_index import search_text, get_content_index_stats
+from utils.summary_cache import get_cached_summary, store_summary
+from utils.context_window import trim_text_to_tokens
+from utils.memory_store import store_memory
+from utils.sampled_extraction import extract_sample, SAMPLEABLE_EXTENSIONS, SAMPLE_READ_BUDGET
 import os
 import logging
+import threading
+import dropbox
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Bump when the check_file_contents prompts change so old cached summaries are not reused
+SUMMARY_PROMPT_VERSION = 2
+
+FILE_TEXT_TOKEN_BUDGET = 20000  # Tokens of extracted text sent when check_file_contents analyzes a file as text
+INDEX_SEARCH_MAX_RESULTS = 500  # Upper bound on the limit search_file_index accepts
+TEXT_SEARCH_MAX_RESULTS = 50  # Upper bound on the limit search_file_text accepts (each result carries a snippet)
+
+# How check_file_contents answered: from the summary cache, extracted text, a file upload or a sample
+_analysis_lock = threading.Lock()
+_analysis_stats = {'cache': 0, 'text': 0, 'file_upload': 0, 'sample': 0}
+
+def _count_analysis(path):
+    with _analysis_lock:
+        _analysis_stats[path] += 1
+
+def _summary_prompt_variant(file_extension):
+    """Identifies which prompt check_file_contents uses for a file type, for the summary cache key."""
+    kind = "excel" if file_extension.lower() in ['.xlsx', '.xls'] else "generic"
+    return f"{kind}-v{SUMMARY_PROMPT_VERSION}"
+
+def _lookup_content_hash(dropbox_path, select_user=None):
+    """
+    Finds the content_hash and size of a file, from the local index when it is fresh
+    (no API call) or with a single metadata request otherwise.
+    
+    Returns:
+        tuple: (str: content_hash or None, int: file size)
+    """
+    # The index only covers the default (admin) context
+    if select_user is None:
+        indexed = get_indexed_file(dropbox_path)
+        if indexed:
+            return indexed['content_hash'], indexed['size']
+    metadata = get_file_metadata(dropbox_path, select_user=select_user)
+    return getattr(metadata, 'content_hash', None), getattr(metadata, 'size', 0)
+
+def _analyze_file(data, filename, prompt, is_truncated):
+    """
+    Format router for check_file_contents: extracts text locally where an extractor
+    exists and sends only that text (trimmed to FILE_TEXT_TOKEN_BUDGET), otherwise
+    uploads the file itself with its MIME type.
+
+    Returns:
+        tuple: (str: The model's answer, str: The path taken, "text" or "file_upload")
+    """
+    from utils.openai_api_call import ask_with_file_bytes, ask_with_text
+
+    file_extension = os.path.splitext(filename)[1].lower()
+    # Office files and PDFs need the whole file to parse; plain text can be cut anywhere
+    if file_extension in TEXT_EXTRACTABLE_EXTENSIONS and (not is_truncated or file_extension in PLAIN_TEXT_EXTENSIONS):
+        try:
+            text = extract_text_from_bytes(data, filename).strip()
+        except Exception as e:
+            logger.warning(f"Local text extraction failed for '{filename}', uploading the file instead: {e}")
+            text = ""
+        # Scanned PDFs and image-only documents have no text layer; the model can still read the file
+        if text:
+            text, text_trimmed = trim_text_to_tokens(text, FILE_TEXT_TOKEN_BUDGET)
+            if text_trimmed:
+                prompt = f"{prompt}\n\nNOTE: The extracted text was cut to the first {FILE_TEXT_TOKEN_BUDGET} tokens."
+            return ask_with_text(text, filename, prompt), "text"
+
+    return ask_with_file_bytes(data, filename, prompt), "file_upload"
+
+def get_file_analysis_stats():
+    """
+    Returns how check_file_contents answered requests in this process.
+
+    Returns:
+        dict: Counts for cache, text (local extraction), file_upload and sample.
+    """
+    with _analysis_lock:
+        return dict(_analysis_stats)
+
+def _check_file_sample(dropbox_path, select_user, content_hash, file_size):
+    """check_file_contents for large files: summarizes a bounded sample of the file."""
+    from utils.openai_api_call import ask_with_text
+
+    # The read budget is part of the variant, so a different budget takes a new sample;
+    # the entry itself is keyed on the bytes the sample actually read
+    prompt_variant = f"sample{SAMPLE_READ_BUDGET}-{_summary_prompt_variant(os.path.splitext(dropbox_path)[1])}"
+    cached_summary = get_cached_summary(content_hash, prompt_variant, None)
+    if cached_summary is not None:
+        logger.info(f"Summary cache hit for sample of '{dropbox_path}'")
+        _count_analysis('cache')
+        return cached_summary
+
+    sample, sample_stats = extract_sample(dropbox_path, select_user=select_user, size=file_size)
+    sample, _ = trim_text_to_tokens(sample, FILE_TEXT_TOKEN_BUDGET)
+    prompt = ("This is a sample of a large file, not the whole file. Summarize what the file appears to contain "
+              "based on the sample, and say clearly that your summary is based on a sample.")
+    response = ask_with_text(sample, os.path.basename(dropbox_path), prompt)
+    response += f"\n\n[NOTE: This file is {file_size/1024/1024:.1f} MB; this summary is based on a sample of it (first pages, rows or slide titles).]"
+    _count_analysis('sample')
+    store_summary(content_hash, prompt_variant, sample_stats['bytes_read'], response)
+    return response
+
 def check_file_contents(dropbox_path: str, select_user=None, max_size_bytes=PARTIAL_DOWNLOAD_SIZE) -> str:
     """
     Downloads a file from Dropbox, sends it to the OpenAI API with an appropriate prompt 
     based on file type (especially for Excel), and asks about its content.
     Returns the response from the API.
-    Cleans up the downloaded file after use.
-    Files larger than 5MB will not be downloaded.
+    The file is streamed into an in-memory buffer, so nothing is written to disk.
+    Only the first max_size_bytes (at most 5MB) of larger files are downloaded and analyzed,
+    except PDF, Office and text files, of which a sample is read instead (see extract_sample).
+    PDF, Office and text files are converted to text locally and only the text is sent;
+    other formats are uploaded with their MIME type.
+    Summaries are cached by content_hash, so unchanged files are not re-downloaded or re-summarized.
     
     Args:
         dropbox_path (str): The path of the file in Dropbox
         select_user (str, optional): Team member ID to operate as
-        max_size_bytes (int): Maximum file size to download (default: 1MB)
+        max_size_bytes (int): Maximum number of bytes to download (default: 1MB)
         
     Returns:
-        str: API response with file content analysis or error message for oversized files
+        str: API response with file content analysis or an error message
     """
-    from utils.openai_api_call import ask_with_base64_file
-    
     # Use size-limited download to prevent timeouts
     try:
-        local_path, is_truncated, total_size, too_large = download_file_with_size_limit(
-            dropbox_path, select_user=select_user, max_size_bytes=max_size_bytes
-        )
+        # Range reads never pull more than MAX_DOWNLOAD_SIZE bytes, whatever the file size
+        max_size_bytes = min(max_size_bytes, MAX_DOWNLOAD_SIZE)
+        prompt_variant = _summary_prompt_variant(os.path.splitext(dropbox_path)[1])
         
-        # Handle case when file is too large to download (>5MB)
-        if too_large:
-            size_mb = total_size / (1024 * 1024)
-            max_size_mb = MAX_DOWNLOAD_SIZE / (1024 * 1024)
-            return f"⚠️ This file is too large to process: {size_mb:.1f} MB exceeds the {max_size_mb:.0f} MB limit. Please try a smaller file or ask for basic metadata about this file instead."
+        # Consult the summary cache before downloading anything
+        content_hash, file_size = _lookup_content_hash(dropbox_path, select_user=select_user)
         
-        prompt = "What is in this file?"
+        # Files too big to read whole are sampled with bounded range reads instead,
+        # since a truncated PDF or Office file cannot be parsed at all
+        if file_size > max_size_bytes and os.path.splitext(dropbox_path)[1].lower() in SAMPLEABLE_EXTENSIONS:
+            return _check_file_sample(dropbox_path, select_user, content_hash, file_size)
         
-        # Add information about truncation if needed
-        if is_truncated:
-            truncation_notice = f"NOTE: This file is {total_size/1024/1024:.1f} MB, but only the first {max_size_bytes/1024/1024:.1f} MB were analyzed due to size constraints."
-            prompt = f"{prompt}\n\n{truncation_notice}"
-            logger.warning(truncation_notice)
+        cached_summary = get_cached_summary(content_hash, prompt_variant, min(max_size_bytes, file_size))
+        if cached_summary is not None:
+            logger.info(f"Summary cache hit for '{dropbox_path}'")
+            _count_analysis('cache')
+            return cached_summary
         
-        # Check file extension for Excel files
-        _, file_extension = os.path.splitext(local_path)
-        if file_extension.lower() in ['.xlsx', '.xls']:
-            excel_prompt = "This is an Excel spreadsheet. Please summarize its main content, key data tables, sheet names, or overall purpose."
-            prompt = excel_prompt if not is_truncated else f"{excel_prompt}\n\n{truncation_notice}"
-            
-        try:
-            response = ask_with_base64_file(local_path, prompt)
+        with download_file_to_buffer(dropbox_path, select_user=select_user, max_size_bytes=max_size_bytes) as (data, is_truncated, total_size, metadata):
+            prompt = "What is in this file?"
             
-            # Add truncation notice to response if file was truncated
+            # Add information about truncation if needed
             if is_truncated:
-                response += f"\n\n[NOTE: This file is {total_size/1024/1024:.1f} MB in total, but only the first {max_size_bytes/1024/1024:.1f} MB were analyzed due to size constraints.]"
-        finally:
-            try:
-                os.remove(local_path)
-                logger.info(f"Temporary file deleted: {local_path}")
-            except Exception as e:
-                logger.error(f"Error removing temporary file {local_path}: {e}")
-                pass # Continue anyway
+                truncation_notice = f"NOTE: This file is {total_size/1024/1024:.1f} MB, but only the first {max_size_bytes/1024/1024:.1f} MB were analyzed due to size constraints."
+                prompt = f"{prompt}\n\n{truncation_notice}"
+                logger.warning(truncation_notice)
+            
+            # Check file extension for Excel files
+            _, file_extension = os.path.splitext(metadata.name)
+            if file_extension.lower() in ['.xlsx', '.xls']:
+                excel_prompt = "This is an Excel spreadsheet. Please summarize its main content, key data tables, sheet names, or overall purpose."
+                prompt = excel_prompt if not is_truncated else f"{excel_prompt}\n\n{truncation_notice}"
+                
+            response, analysis_path = _analyze_file(data, metadata.name, prompt, is_truncated)
+            
+        logger.info(f"Analyzed '{dropbox_path}' via {analysis_path} ({min(max_size_bytes, total_size)} bytes downloaded)")
+        _count_analysis(analysis_path)
+        
+        # Add truncation notice to response if file was truncated
+        if is_truncated:
+            response += f"\n\n[NOTE: This file is {total_size/1024/1024:.1f} MB in total, but only the first {max_size_bytes/1024/1024:.1f} MB were analyzed due to size constraints.]"
+        
+        # Key on the hash of what was actually downloaded, in case the file changed since the lookup
+        store_summary(getattr(metadata, 'content_hash', None), prompt_variant, min(max_size_bytes, total_size), response)
         return response
     
-    except ValueError as e:
-        # Handle the case where the file is too large
-        if "too large to download" in str(e):
-            return str(e)
-        else:
-            raise
     except Exception as e:
         logger.error(f"Error in check_file_contents: {e}")
         return f"Error processing file: {str(e)}"
 
-def list_folder_contents(dropbox_path: str, select_user=None, **kwargs):
+def list_folder_contents(dropbox_path: str = "", select_user=None, page_token=None, name_contains=None, max_entries=None, **kwargs) -> str:
     """
-    Lists all contents of a Dropbox folder given its path.
+    Lists the contents of a Dropbox folder given its path, rendered with bounded size:
+    an overview (counts by type and extension, newest and largest files) and the first
+    page of entries. Pass the returned page_token to get the next page.
     Args:
         dropbox_path (str): The path to the folder in Dropbox to list.
         select_user (str, optional): Team member ID to operate as. Defaults to None (admin context).
+        page_token (str, optional): Continuation token from a previous page; dropbox_path is ignored.
+        name_contains (str, optional): Only list entries whose name contains this text (case-insensitive).
+        max_entries (int, optional): Stop listing once this many entries were found. Defaults to
+                                     LISTING_PAGE_SIZE when name_contains is given.
         **kwargs: Additional arguments for Dropbox listing (e.g., recursive=True).
     Returns:
-        list: List of dropbox.files.Metadata entries in the folder.
+        str: The rendered listing page.
     """
-    return list_folder_complete(dropbox_path, select_user=select_user, **kwargs)
+    if page_token:
+        return render_listing_page(page_token)
+
+    predicate = None
+    if name_contains:
+        needle = name_contains.lower()
+        predicate = lambda entry: needle in getattr(entry, 'name', '').lower()
+        if max_entries is None:
+            max_entries = LISTING_PAGE_SIZE
+
+    # Pages are only fetched until max_entries matches are found; one more tells whether any are left
+    probe = max_entries + 1 if max_entries is not None else None
+    entries = list(iter_folder_entries(dropbox_path, select_user=select_user, max_entries=probe, predicate=predicate, **kwargs))
+
+    description = None
+    stopped_early = max_entries is not None and len(entries) > max_entries
+    entries = entries[:max_entries] if stopped_early else entries
+    if name_contains:
+        description = f"{'the first ' if stopped_early else ''}entries with '{name_contains}' in the name"
+    elif stopped_early:
+        description = "the first entries listed"
+    if stopped_early:
+        description += " (listing stopped early; there may be more)"
+    return render_listing(entries, dropbox_path or "/", description=description)
+
+def list_folder_tree(dropbox_path: str = "", max_depth=TREE_MAX_DEPTH, select_user=None) -> str:
+    """
+    Lists a folder and its subfolders down to max_depth levels in one call, listing
+    each level's folders concurrently, and returns a compact indented digest.
+    Args:
+        dropbox_path (str): The folder to start from.
+        max_depth (int): Number of folder levels to list (default: 3, at most 5).
+        select_user (str, optional): Team member ID to operate as. Defaults to None (admin context).
+    Returns:
+        str: The rendered tree digest.
+    """
+    max_depth = max(1, min(int(max_depth), 5))
+    return render_tree(list_tree(dropbox_path, select_user=select_user, max_depth=max_depth))
+
+def search_dropbox(query: str, path=None, filename_only=True, extensions=None, max_results=25, select_user=None) -> str:
+    """
+    Searches Dropbox server-side (files_search_v2) by file name, or by name and content.
+    Unlike search_file_index this does not depend on the local index being synced.
+    
+    Args:
+        query (str): Text to search for.
+        path (str, optional): Only search under this folder.
+        filename_only (bool): True to match names only (default), False to also match file contents.
+        extensions (list, optional): File extensions without the dot (e.g., ["pdf", "docx"]).
+        max_results (int): Maximum number of results (default: 25).
+        select_user (str, optional): Team member ID to operate as.
+        
+    Returns:
+        str: One line per match, or a message if nothing matched.
+    """
+    # search_files caps the limit, so the note below compares against the same cap
+    max_results = max(1, min(int(max_results or 25), SEARCH_MAX_RESULTS))
+    matches = search_files(query, select_user=select_user, path=path, filename_only=filename_only,
+                           extensions=extensions, max_results=max_results)
+    if not matches:
+        return f"No files or folders matching '{query}' found in Dropbox."
+    
+    lines = [f"Found {len(matches)} match(es){' (limit reached)' if len(matches) >= max_results else ''}:"]
+    for entry in matches:
+        if isinstance(entry, dropbox.files.FileMetadata):
+            lines.append(f"[File] {entry.path_display} ({entry.size / 1024:.1f} KB, modified {entry.server_modified.isoformat()})")
+        else:
+            kind = entry.__class__.__name__.replace('Metadata', '')
+            lines.append(f"[{kind}] {getattr(entry, 'path_display', None) or entry.name}")
+    return "\n".join(lines)
+
+def search_file_index(name=None, path_prefix=None, extension=None, min_size=None, max_size=None,
+                      modified_after=None, modified_before=None, is_folder=None, limit=50) -> str:
+    """
+    Searches the local metadata index of the whole Dropbox tree by name, folder, extension,
+    size and modified date. A stale index is synced incrementally before querying; the
+    first full crawl runs in the background, and until it finishes the results say they
+    may be incomplete.
+    
+    Args:
+        name (str, optional): Words that must all appear in the name (case-insensitive).
+        path_prefix (str, optional): Only return entries under this folder.
+        extension (str, optional): File extension without the dot (e.g., "pdf").
+        min_size (int, optional): Minimum file size in bytes.
+        max_size (int, optional): Maximum file size in bytes.
+        modified_after (str, optional): ISO date (e.g., "2024-01-31"); files modified on or after it.
+        modified_before (str, optional): ISO date; files modified before it.
+        is_folder (bool, optional): True for folders only, False for files only.
+        limit (int): Maximum number of results (default: 50, at most INDEX_SEARCH_MAX_RESULTS).
+        
+    Returns:
+        str: One line per match, or a message if nothing matched, plus a note if the index is incomplete or stale.
+    """
+    limit = max(1, min(int(limit or 50), INDEX_SEARCH_MAX_RESULTS))
+    try:
+        age = ensure_index_fresh()
+    except Exception as e:
+        # A stale index is still useful; say so instead of failing the search
+        logger.error(f"Error syncing metadata index: {e}")
+        age = get_index_age_seconds()
+    if age is None:
+        note = "Note: the file index is still being built, so results may be incomplete. Use search_dropbox or list_folder_contents for anything missing."
+    elif age > INDEX_MAX_AGE_SECONDS:
+        note = f"Note: the file index was last updated {age / 60:.0f} minute(s) ago; very recent changes may be missing."
+    else:
+        note = None
+
+    rows = search_index(name=name, path_prefix=path_prefix, extension=extension, min_size=min_size,
+                        max_size=max_size, modified_after=modified_after, modified_before=modified_before,
+                        is_folder=is_folder, limit=limit)
+    if not rows:
+        lines = ["No matching files or folders found in the index."]
+    else:
+        lines = [f"Found {len(rows)} match(es){' (limit reached)' if len(rows) >= limit else ''}:"]
+        for row in rows:
+            if row['is_folder']:
+                lines.append(f"[Folder] {row['path']}")
+            else:
+                lines.append(f"[File] {row['path']} ({row['size'] / 1024:.1f} KB, modified {row['server_modified']})")
+    if note:
+        lines.append(note)
+    return "\n".join(lines)
+
+def search_file_text(query: str, path_prefix=None, limit=10) -> str:
+    """
+    Searches the text of already-indexed documents (PDF, DOCX, XLSX, PPTX, TXT, CSV, MD)
+    and returns ranked matches with snippets. Documents are indexed in the background,
+    so very new or very large files may not be covered yet.
+    
+    Args:
+        query (str): Words to search for in document contents.
+        path_prefix (str, optional): Only search documents under this folder.
+        limit (int): Maximum number of results (default: 10, at most TEXT_SEARCH_MAX_RESULTS).
+        
+    Returns:
+        str: One entry per match with a snippet (matches in [brackets]), or a message if nothing matched.
+    """
+    limit = max(1, min(int(limit or 10), TEXT_SEARCH_MAX_RESULTS))
+    rows = search_text(query, path_prefix=path_prefix, limit=limit)
+    stats = get_content_index_stats()
+    coverage = f"(content index covers {stats['indexed']} documents)"
+    if not rows:
+        return f"No indexed documents contain '{query}' {coverage}."
+    
+    lines = [f"Found {len(rows)} document(s) {coverage}:"]
+    for row in rows:
+        lines.append(f"- {row['path']}: {row['snippet']}")
+    return "\n".join(lines)
 
 def store_important_memory(memory: str) -> str:
     """
-    Stores important information in the running memory file that will be included in the system prompt.
+    Stores important information in the memory store; relevant memories are included in future system prompts.
     Use this tool frequently to record what you learn about the file structure, especially:
     
     - After exploring a folder structure and learning its organization
@@ -100,6 +363,7 @@ def store_important_memory(memory: str) -> str:
     - **Whenever the user provides specific information in response to your questions (e.g., file type, keywords, project context), store this as a standalone memory.**
     
     This information will be available in future conversations to help with file searches.
+    Memories are deduplicated, and only the ones relevant to a new request are added to its prompt.
     
     Args:
         memory (str): The important information to store.
@@ -107,31 +371,12 @@ def store_important_memory(memory: str) -> str:
     Returns:
         str: Confirmation message.
     """
-    memory_file = os.path.join("agent", "running_memory.txt")
-    
-    # Create directories if they don't exist
-    os.makedirs(os.path.dirname(memory_file), exist_ok=True)
-    
-    # Read existing memories to avoid duplicates
-    existing_memories = []
-    if os.path.exists(memory_file) and os.path.getsize(memory_file) > 0:
-        with open(memory_file, "r") as f:
-            existing_memories = f.read().strip().split("\n")
-    
-    # Add timestamp to the memory
-    from datetime import datetime
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    formatted_memory = f"[{timestamp}] {memory}"
-    
-    # Only add if not duplicate
-    if formatted_memory not in existing_memories:
-        with open(memory_file, "a") as f:
-            if existing_memories:
-                f.write("\n")
-            f.write(formatted_memory)
-        return f"Memory stored: {memory}"
-    else:
+    result = store_memory(memory)
+    if result == "duplicate":
         return f"Memory already exists: {memory}"
+    if result == "updated":
+        return f"Memory updated: {memory}"
+    return f"Memory stored: {memory}"
 
 def end_conversation(reason: str) -> str:
     """
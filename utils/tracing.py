@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+TRACING_ENABLED = os.getenv("AGENT_TRACE", "0") == "1"  # Off by default; span() is then a shared no-op
+TRACE_DIR = "traces"
+TRACE_PATH = os.path.join(TRACE_DIR, "agent_trace.jsonl")  # One JSON line per finished span
+METRICS_PATH = os.path.join(TRACE_DIR, "metrics.prom")  # Prometheus text format, rewritten periodically
+METRICS_INTERVAL_SECONDS = 15
+METRICS_PORT = int(os.getenv("AGENT_METRICS_PORT", "0"))  # Also serve /metrics over HTTP if set
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)  # Seconds
+# Numeric span attributes that are summed into counters; others only go to the trace
+METRIC_ATTRIBUTES = {
+    'bytes', 'request_bytes', 'response_bytes', 'entries', 'tool_calls', 'result_chars',
+    'prompt_tokens', 'cached_tokens', 'completion_tokens', 'input_tokens', 'output_tokens',
+}
+
+_current_span = contextvars.ContextVar("agent_current_span", default=None)
+
+_trace_lock = threading.Lock()
+_trace_file = None
+
+# Aggregates per span name: {name: {'count', 'errors', 'seconds', 'buckets': [...], 'values': {attr: total}}}
+_metrics_lock = threading.Lock()
+_metrics = {}
+_exporter_lock = threading.Lock()
+_exporter_started = False
+
+
+class _NoopSpan:
+    """Returned by span() when tracing is disabled; every method does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, key, amount=1):
+        pass
+
+    def fail(self, error):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """
+    A timed, named unit of work. Spans opened inside another span (in the same thread,
+    or in a task started with bind()) become its children and share its trace_id.
+    """
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = None
+        self.trace_id = None
+        self.error = None
+        self._token = None
+        self._started = None
+        self._start_time = None
+
+    def __enter__(self):
+        parent = _current_span.get()
+        if parent is not None:
+            self.parent_id = parent.span_id
+            self.trace_id = parent.trace_id
+        else:
+            self.trace_id = uuid.uuid4().hex
+        self._token = _current_span.set(self)
+        self._start_time = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._started
+        _current_span.reset(self._token)
+        _finish(self, duration, f"{exc_type.__name__}: {exc}" if exc_type else self.error)
+        return False
+
+    def set(self, **attributes):
+        """Sets attributes, e.g. span.set(entries=120)."""
+        self.attributes.update(attributes)
+
+    def add(self, key, amount=1):
+        """Adds to a numeric attribute, e.g. span.add('bytes', len(chunk))."""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def fail(self, error):
+        """Marks the span as failed for errors that are handled rather than raised."""
+        self.error = error
+
+
+def span(name, **attributes):
+    """
+    Opens a span, to be used as a context manager:
+
+        with span("dropbox.download", path=path) as s:
+            ...
+            s.set(bytes=written)
+
+    Args:
+        name (str): Span name; metrics are aggregated per name.
+        **attributes: Initial attributes (latency is recorded automatically).
+
+    Returns:
+        Span: The span, or a shared no-op object when tracing is disabled.
+    """
+    if not TRACING_ENABLED:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+
+def record_span(name, duration, error=None, **attributes):
+    """
+    Records a span for work that was timed elsewhere (e.g. by an HTTP library), as a
+    child of the current span.
+
+    Args:
+        name (str): Span name.
+        duration (float): Duration in seconds.
+        error (str, optional): Error description if the work failed.
+        **attributes: Span attributes.
+    """
+    if not TRACING_ENABLED:
+        return
+    recorded = Span(name, attributes)
+    parent = _current_span.get()
+    recorded.parent_id = parent.span_id if parent else None
+    recorded.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+    recorded._start_time = time.time() - duration
+    _finish(recorded, duration, error)
+
+
+def current_span():
+    """Returns the innermost open span, or a no-op span if there is none."""
+    return _current_span.get() or _NOOP_SPAN
+
+
+def bind(fn):
+    """
+    Returns fn wrapped to run in the caller's context, so spans it opens on a pool
+    thread nest under the caller's span. Always applied (copying a context is cheap),
+    since other context variables, such as the cassette's turn id, rely on it too.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def _finish(finished, duration, error):
+    record = {
+        'trace_id': finished.trace_id,
+        'span_id': finished.span_id,
+        'parent_id': finished.parent_id,
+        'name': finished.name,
+        'start': round(finished._start_time, 6),
+        'duration_ms': round(duration * 1000, 3),
+        'status': "error" if error else "ok",
+        'thread': threading.current_thread().name,
+        'attributes': finished.attributes,
+    }
+    if error:
+        record['error'] = error
+    _write_trace(record)
+    _aggregate(finished.name, duration, error, finished.attributes)
+
+
+def _write_trace(record):
+    global _trace_file
+    line = json.dumps(record, default=str)
+    with _trace_lock:
+        try:
+            if _trace_file is None:
+                os.makedirs(TRACE_DIR, exist_ok=True)
+                _trace_file = open(TRACE_PATH, "a", encoding="utf-8", buffering=1)  # Line buffered
+            _trace_file.write(line + "\n")
+        except OSError as e:
+            logger.error(f"Error writing trace to {TRACE_PATH}: {e}")
+
+
+def _aggregate(name, duration, error, attributes):
+    with _metrics_lock:
+        entry = _metrics.get(name)
+        if entry is None:
+            entry = _metrics[name] = {'count': 0, 'errors': 0, 'seconds': 0.0, 'buckets': [0] * len(LATENCY_BUCKETS), 'values': {}}
+        entry['count'] += 1
+        entry['seconds'] += duration
+        if error:
+            entry['errors'] += 1
+        index = bisect.bisect_left(LATENCY_BUCKETS, duration)
+        if index < len(LATENCY_BUCKETS):
+            entry['buckets'][index] += 1
+        for key, value in attributes.items():
+            if key in METRIC_ATTRIBUTES and isinstance(value, (int, float)) and not isinstance(value, bool):
+                entry['values'][key] = entry['values'].get(key, 0) + value
+
+
+def get_span_stats():
+    """
+    Returns the aggregated metrics per span name.
+
+    Returns:
+        dict: {name: {'count', 'errors', 'seconds', 'values'}}
+    """
+    with _metrics_lock:
+        return {
+            name: {'count': e['count'], 'errors': e['errors'], 'seconds': e['seconds'], 'values': dict(e['values'])}
+            for name, e in _metrics.items()
+        }
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_metrics():
+    """
+    Renders the aggregated span metrics in the Prometheus text exposition format.
+
+    Returns:
+        str: agent_span_duration_seconds histograms, agent_span_errors_total and
+             agent_span_value_total (summed METRIC_ATTRIBUTES) per span name.
+    """
+    with _metrics_lock:
+        snapshot = {name: {**e, 'buckets': list(e['buckets']), 'values': dict(e['values'])} for name, e in _metrics.items()}
+
+    lines = [
+        "# HELP agent_span_duration_seconds Latency of agent, tool, Dropbox and OpenAI operations.",
+        "# TYPE agent_span_duration_seconds histogram",
+    ]
+    for name, e in sorted(snapshot.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, e['buckets']):
+            cumulative += count
+            lines.append(f'agent_span_duration_seconds_bucket{{span="{_label(name)}",le="{bound}"}} {cumulative}')
+        lines.append(f'agent_span_duration_seconds_bucket{{span="{_label(name)}",le="+Inf"}} {e["count"]}')
+        lines.append(f'agent_span_duration_seconds_sum{{span="{_label(name)}"}} {e["seconds"]:.6f}')
+        lines.append(f'agent_span_duration_seconds_count{{span="{_label(name)}"}} {e["count"]}')
+    lines += ["# HELP agent_span_errors_total Operations that raised an error.", "# TYPE agent_span_errors_total counter"]
+    for name, e in sorted(snapshot.items()):
+        lines.append(f'agent_span_errors_total{{span="{_label(name)}"}} {e["errors"]}')
+    lines += ["# HELP agent_span_value_total Bytes, entries and tokens recorded on spans.", "# TYPE agent_span_value_total counter"]
+    for name, e in sorted(snapshot.items()):
+        for key, value in sorted(e['values'].items()):
+            lines.append(f'agent_span_value_total{{span="{_label(name)}",value="{key}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path=None):
+    """Writes render_metrics() to path (default METRICS_PATH), replacing the file atomically."""
+    path = path or METRICS_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_metrics())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would otherwise be printed to stderr
+
+
+def _metrics_file_loop():
+    while True:
+        time.sleep(METRICS_INTERVAL_SECONDS)
+        try:
+            write_metrics()
+        except OSError as e:
+            logger.error(f"Error writing metrics to {METRICS_PATH}: {e}")
+
+
+def start_metrics_exporter():
+    """
+    Starts exporting metrics if tracing is enabled: METRICS_PATH is rewritten every
+    METRICS_INTERVAL_SECONDS, and /metrics is served on AGENT_METRICS_PORT if set.
+    Safe to call more than once.
+    """
+    global _exporter_started
+    if not TRACING_ENABLED:
+        return
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+    threading.Thread(target=_metrics_file_loop, daemon=True, name="metrics-writer").start()
+    if METRICS_PORT:
+        server = ThreadingHTTPServer(("127.0.0.1", METRICS_PORT), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+        logger.info(f"Serving metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+    logger.info(f"Tracing to {TRACE_PATH}, metrics in {METRICS_PATH}")